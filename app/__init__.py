@@ -1,16 +1,47 @@
 # Import necessary packages and modules.
-from flask import Flask
+from flask import Flask, current_app, g
 # The core of the Flask framework.
+from werkzeug.middleware.proxy_fix import ProxyFix
+# Reads the client address set by trusted reverse proxies.
 from config import Config
 # Our configuration settings (from config.py).
 from flask_jwt_extended import JWTManager
 # For handling JWT (JSON Web Token).
+from flask_jwt_extended.default_callbacks import default_decode_key_callback, default_encode_key_callback
+# The signing keys used without a key ring (JWT_SECRET_KEY).
+from jwt.exceptions import InvalidTokenError
+# Rejects tokens signed with a key the key ring does not know.
 from flask_cors import CORS
 # To allow requests from the browser (Cross-Origin Resource Sharing).
-from models import db, TokenBlocklist
+from models import db, TokenBlocklist, User
 # Our database models (from models.py).
-from commands import db_seed
-# Our command for seeding the database (from commands.py).
+from routing import ReplicaSet
+# Read replica routing (from routing.py).
+from passwords import PasswordHasher, PasswordHasherBusy
+# Password hashing with a bounded concurrency (from passwords.py).
+from app.errors import error_response
+# Uniform error responses (from app/errors.py).
+from commands import db_seed, db_migrate, blocklist_prune, jwt_key_generate, serve, startup_profile
+# Our command-line commands: seeding and migrating the database, pruning the blocklist, signing keys,
+# the server and the startup profile (from commands.py).
+from app.revocation import RevocationStore, create_backend
+# In-process cache of revoked tokens (from app/revocation.py).
+from app import response_cache
+# Server-side cache of GET responses (from app/response_cache.py).
+from app.ratelimit import LoginLimiter, create_store
+# Login rate limiting (from app/ratelimit.py).
+from app.blocklist import BlocklistSweeper, PruneStats
+# Pruning of expired revoked tokens (from app/blocklist.py).
+from app.keyring import KeyRing
+# Asymmetric signing keys of the tokens (from app/keyring.py).
+from app import metrics
+# Latency histograms and the '/metrics' endpoint (from app/metrics.py).
+from app import serialization
+# The JSON library of the responses (from app/serialization.py).
+from app import compression
+# Compression of the responses (from app/compression.py).
+from app.search import ShipIndex
+# Search index of the ships (from app/search.py).
 
 
 # Create a JWTManager instance, which handles token management.
@@ -25,14 +56,82 @@ def check_if_token_in_blacklist(decrypted_token):
     Callback function that checks if a JWT token has been revoked.
     On logout, the token's identifier (jti) is stored in the database.
     This function checks if the incoming token's jti is on the revoked list.
+    Tokens issued before the user's current token generation (see 'User.revoke_tokens') are revoked as well.
+    The revocation store answers from memory and only queries the database when it has to.
     """
-    # Read the unique identifier (jti) of the token.
-    jti = decrypted_token["jti"]
+    store = current_app.extensions["revocation_store"]
+    # The time spent here is reported as the 'revocation_check' phase on '/metrics'.
+    with metrics.timed("revocation_check"):
+        # Tokens without a generation claim (issued before generations existed) are only checked by jti.
+        claims = decrypted_token.get(current_app.config["JWT_USER_CLAIMS"]) or {}
+        if "gen" in claims:
+            user_id = decrypted_token[current_app.config["JWT_IDENTITY_CLAIM"]]
+            # Without a shared backend both checks go to the database: they are made with one query.
+            if not store.backend.shared:
+                return store.is_token_revoked(decrypted_token["jti"], user_id, claims["gen"], loader=token_revocation_state)
+            if store.is_generation_revoked(user_id, claims["gen"], loader=User.current_token_generation):
+                return True
+        # Read the unique identifier (jti) of the token.
+        jti = decrypted_token["jti"]
+        return store.is_revoked(jti, loader=is_jti_in_blocklist, warmer=all_blocklisted_jtis)
+
+
+def is_jti_in_blocklist(jti):
     # Look for this jti in the TokenBlocklist table.
-    token = TokenBlocklist.query.filter_by(jti=jti).first()
     # If the token exists in the table, it means it has been revoked (the user has logged out).
-    # 'is not None' returns a boolean value (True/False).
-    return token is not None
+    return TokenBlocklist.query.filter_by(jti=jti).first() is not None
+
+
+def token_revocation_state(jti, user_id):
+    # The user's current token generation and whether the jti is in the TokenBlocklist table, in one
+    # query: the user's row is joined to the blocklist rows of the jti (None if the user does not exist).
+    row = (db.session.query(User.token_generation, TokenBlocklist.id)
+           .outerjoin(TokenBlocklist, TokenBlocklist.jti == jti)
+           .filter(User.id == user_id).first())
+    return (None, False) if row is None else (row.token_generation, row.id is not None)
+
+
+def all_blocklisted_jtis():
+    # Only the 'jti' column is needed to fill the Bloom filter.
+    return [jti for (jti,) in db.session.query(TokenBlocklist.jti)]
+
+
+# With a key ring (JWT_KEYS_DIR), tokens are signed with its active private key and name it in the 'kid' header.
+# The header is built first, so the chosen key is kept on 'g' for the signature of the same token.
+@jwt.additional_headers_loader
+def key_id_header(identity):
+    keyring = current_app.extensions.get("jwt_keyring")
+    if keyring is None:
+        return None
+    g.jwt_signing_key = keyring.signing_key()
+    return {"kid": g.jwt_signing_key.kid}
+
+
+@jwt.encode_key_loader
+def signing_key(identity):
+    keyring = current_app.extensions.get("jwt_keyring")
+    if keyring is None:
+        return default_encode_key_callback(identity)
+    key = g.pop("jwt_signing_key", None) or keyring.signing_key()
+    return key.private_key
+
+
+@jwt.decode_key_loader
+def verification_key(claims, headers):
+    keyring = current_app.extensions.get("jwt_keyring")
+    if keyring is None:
+        return default_decode_key_callback(claims, headers)
+    # The parsed public key is cached by the key ring, so verifying costs the same on every request.
+    key = keyring.verification_key(headers.get("kid"))
+    if key is None:
+        raise InvalidTokenError("Unknown signing key.")
+    return key
+
+
+def password_hasher_busy(error):
+    response = error_response(503, "Too many password operations in progress, try again later.")
+    response.headers["Retry-After"] = "1"
+    return response
 
 
 # This is the "application factory" function.
@@ -42,17 +141,75 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     # Load the configuration from the Config class defined in config.py.
     app.config.from_object(config_class)
+    # Behind reverse proxies, the client IP (e.g. of the login rate limits) comes from their 'X-Forwarded-For'.
+    if app.config["TRUSTED_PROXY_COUNT"]:
+        count = app.config["TRUSTED_PROXY_COUNT"]
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=count, x_proto=count)
     # Enable CORS on the application, which allows
     # the frontend (another "origin", e.g., localhost:3000) to send requests to the backend (localhost:5000).
     CORS(app)
 
+    # Every read replica becomes a Flask-SQLAlchemy "bind" with its own engine and pool.
+    replica_binds = {f"replica_{i}": uri for i, uri in enumerate(app.config["SQLALCHEMY_REPLICA_URIS"])}
+    app.config["SQLALCHEMY_BINDS"] = dict(app.config.get("SQLALCHEMY_BINDS") or {}, **replica_binds)
     # Initialize the database manager (SQLAlchemy) with the application.
     db.init_app(app)
+    app.extensions["db_replicas"] = ReplicaSet(
+        db, replica_binds,
+        health_check_interval=app.config["REPLICA_HEALTH_CHECK_INTERVAL"],
+        sticky_seconds=app.config["REPLICA_STICKY_SECONDS"],
+    )
+    # A client that wrote is told to read from the primary for a while (in a cookie and a header).
+    app.after_request(app.extensions["db_replicas"].after_request)
     # Initialize the JWT manager with the application.
     jwt.init_app(app)
+    # Load the asymmetric signing keys (without JWT_KEYS_DIR tokens are signed with JWT_SECRET_KEY).
+    if app.config["JWT_KEYS_DIR"]:
+        app.extensions["jwt_keyring"] = KeyRing(
+            app.config["JWT_KEYS_DIR"], app.config["JWT_ALGORITHM"],
+            active_kid=app.config["JWT_ACTIVE_KID"],
+            activation_delay=app.config["JWT_KEY_ACTIVATION_DELAY"],
+            reload_interval=app.config["JWT_KEYS_RELOAD_INTERVAL"],
+        )
+    # Create the password hasher used by 'User.set_password' and 'User.check_password'.
+    app.extensions["password_hasher"] = PasswordHasher(
+        method=app.config["PASSWORD_HASH_METHOD"],
+        salt_length=app.config["PASSWORD_SALT_LENGTH"],
+        concurrency=app.config["PASSWORD_HASH_CONCURRENCY"],
+        max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+        queue_timeout=app.config["PASSWORD_HASH_QUEUE_TIMEOUT"],
+    )
+    # When every hashing slot is taken, tell the client to come back instead of piling up requests.
+    app.register_error_handler(PasswordHasherBusy, password_hasher_busy)
+    # The revocation store, the login rate limiter, the response cache and the search index.
+    init_stores(app)
+    # Pick the JSON library used to encode the responses.
+    app.extensions["json_backend"] = serialization.create_backend(app.config["JSON_LIBRARY"])
+    # Record latency, SQL and serialization time per endpoint, exported on '/metrics' (disabled with METRICS_ENABLED = False).
+    if app.config["METRICS_ENABLED"]:
+        metrics.init_app(app)
+    # Compress the responses with gzip, brotli or zstd (disabled with COMPRESSION_ENABLED = False).
+    # Registered after the metrics, so that it runs before their 'after_request' and is measured.
+    if app.config["COMPRESSION_ENABLED"]:
+        compression.init_app(app)
 
-    # Register our command-line command ('flask db-seed').
+    # Register our command-line commands ('flask db-seed', 'flask db-migrate', 'flask blocklist-prune',
+    # 'flask jwt-key-generate', 'flask serve', 'flask startup-profile').
     app.cli.add_command(db_seed)
+    app.cli.add_command(db_migrate)
+    app.cli.add_command(blocklist_prune)
+    app.cli.add_command(jwt_key_generate)
+    app.cli.add_command(serve)
+    app.cli.add_command(startup_profile)
+
+    # Expired rows of the token blocklist are deleted by 'flask blocklist-prune' or, if configured, by a background thread.
+    app.extensions["blocklist_stats"] = PruneStats()
+    if app.config["BLOCKLIST_PRUNE_INTERVAL"] > 0:
+        app.extensions["blocklist_sweeper"] = BlocklistSweeper(
+            app, app.config["BLOCKLIST_PRUNE_INTERVAL"],
+            app.config["BLOCKLIST_PRUNE_BATCH_SIZE"], app.config["BLOCKLIST_PRUNE_PAUSE"],
+        )
+        app.extensions["blocklist_sweeper"].start()
 
     # Import and register the "blueprints".
     # Blueprints help to logically separate parts of the application (e.g., API, authentication).
@@ -64,10 +221,41 @@ def create_app(config_class=Config):
     # The routes defined in 'auth_bp' will be accessible with the '/auth' prefix (e.g., /auth/login).
     app.register_blueprint(auth_bp, url_prefix="/auth")
 
-    # Within the application context, we create the database tables if they don't already exist.
-    # This 'db.create_all()' command goes through the classes defined in 'models.py' and creates the schema.
-    with app.app_context():
-        db.create_all()
+    # The database is not touched here: its engine connects on the first query, and the schema is
+    # created and updated by 'flask db-migrate' (see migrations.py), not on every start.
 
     # Return the configured application instance.
     return app
+
+
+def init_stores(app):
+    """
+    Creates the stores the application keeps in memory, from its configuration. The server calls it
+    again in every worker it forks: a worker starts with stores of its own, not with copies of the
+    master's (whose locks may have been held at the time of the fork).
+    """
+    # Create the store of revoked tokens used by 'check_if_token_in_blacklist'.
+    app.extensions["revocation_store"] = RevocationStore(
+        backend=create_backend(app.config["REVOCATION_BACKEND_URL"], app.config["REVOCATION_EVENT_LOG_SIZE"]),
+        max_size=app.config["REVOCATION_CACHE_SIZE"],
+        ttl=app.config["REVOCATION_CACHE_TTL"],
+        bloom_capacity=app.config["REVOCATION_BLOOM_CAPACITY"],
+        sync_interval=app.config["REVOCATION_SYNC_INTERVAL"],
+    )
+    # Create the login rate limiter (disabled with LOGIN_RATE_LIMIT_ENABLED = False).
+    if app.config["LOGIN_RATE_LIMIT_ENABLED"]:
+        app.extensions["login_limiter"] = LoginLimiter(
+            create_store(app.config["LOGIN_RATE_LIMIT_URL"]),
+            ip_capacity=app.config["LOGIN_IP_BURST"],
+            ip_rate=app.config["LOGIN_IP_PER_MINUTE"] / 60,
+            user_capacity=app.config["LOGIN_USER_FAILURES"],
+            user_rate=app.config["LOGIN_USER_FAILURES"] / app.config["LOGIN_USER_FAILURE_WINDOW"],
+        )
+    # Create the cache of serialized GET responses (disabled with RESPONSE_CACHE_ENABLED = False).
+    if app.config["RESPONSE_CACHE_ENABLED"]:
+        app.extensions["response_cache"] = response_cache.ResponseCache(
+            backend=response_cache.create_backend(app.config["RESPONSE_CACHE_URL"], app.config["RESPONSE_CACHE_MAX_BYTES"]),
+            ttl=app.config["RESPONSE_CACHE_TTL"],
+        )
+    # The search index of '/api/ships/search', built on the first search.
+    app.extensions["ship_index"] = ShipIndex()
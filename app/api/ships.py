@@ -1,36 +1,285 @@
 # Import necessary Flask and Flask-JWT-Extended modules.
-from flask import jsonify, request, url_for
-# jsonify: creates a JSON response from a Python dict; request: incoming request data; url_for: generates a URL for an endpoint.
+from flask import request, url_for, current_app
+# request: incoming request data; url_for: generates a URL for an endpoint.
 from flask_jwt_extended import jwt_required  # Decorator that requires a valid JWT token to access the endpoint.
+import bisect  # Finds where the next search page starts in the sorted ids.
+from decimal import Decimal  # Some databases (MySQL) return sums and averages as decimals.
+import json  # Parses the lines of NDJSON request bodies.
+import operator  # Comparison functions (>=, <=) for the range filters.
+from sqlalchemy import case, func, select  # Builds SQL SELECT statements (SQLAlchemy Core).
 from app.api import bp  # Our blueprint instance, on which we register the endpoints.
-from models import db, Ship  # The database connection and the Ship model.
+from models import db, Ship, TableVersion  # The database connection, the Ship model and the table versions (ETags).
+from app.http_cache import add_validators, conditional, not_modified, row_etag, table_version  # ETags and conditional GET.
+from app.api.writes import delete_row, update_row  # Single-statement writes guarded by 'If-Match'.
+from app.response_cache import cached, invalidate  # Server-side cache of GET responses.
 from app.errors import error_response  # Uniform error handler function.
+from app.serialization import jsonify, json_response, get_backend, RowSerializer  # JSON encoding of responses (jsonify: a JSON response from a Python dict).
+from app.search import FACETS, TEXT_FIELDS, update_index, invalidate_index  # In-process search index of the ships.
+from app.api.streaming import wants_stream, stream_rows  # Streaming (NDJSON) responses for large collections.
+from app.query_budget import query_budget  # Limits on the SQL statements per request.
+
+
+# The columns of the 'ships' table, by name. These can be requested with 'fields='.
+# The row version is not part of a ship: it is sent as the ETag of '/ships/<id>'.
+SHIP_COLUMNS = {column.name: column for column in Ship.__table__.columns if column.name != "version"}
+# Encodes complete ships (all columns) straight from result rows.
+SHIP_SERIALIZER = RowSerializer(SHIP_COLUMNS.values())
+# Query parameters filtering on equality.
+EXACT_FILTERS = ("affiliation", "category", "manufacturer", "ship_class")
+# Query parameters filtering on a range: name -> (column, comparison).
+RANGE_FILTERS = {
+    "min_crew": (Ship.crew, operator.ge),
+    "max_crew": (Ship.crew, operator.le),
+    "min_length": (Ship.length, operator.ge),
+    "max_length": (Ship.length, operator.le),
+}
+
+
+def int_arg(name):
+    """Reads an integer query parameter. Returns None if missing, raises ValueError if invalid."""
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def filter_conditions():
+    """The WHERE conditions of the exact and range filters in the query parameters. Raises ValueError if a range is invalid."""
+    conditions = [SHIP_COLUMNS[name] == request.args[name] for name in EXACT_FILTERS if name in request.args]
+    for name, (column, comparison) in RANGE_FILTERS.items():
+        value = int_arg(name)
+        if value is not None:
+            conditions.append(comparison(column, value))
+    return conditions
 
 
 # Endpoint to get all ships.
+# Optional query parameters:
+#   limit, after  -- keyset pagination on 'id' (the next page is linked in the 'Link' header),
+#   fields        -- comma separated list of columns to return (e.g. fields=model,crew),
+#   affiliation, category, manufacturer, ship_class, min_crew, max_crew, min_length, max_length -- filters,
+#   stream        -- 'stream=1' (or 'Accept: application/x-ndjson') streams the ships one per line.
 @bp.route("/ships", methods=["GET"])
+@query_budget(max_queries=2)  # The table version and the page of ships.
+@cached("ships")  # Serves the stored response while no write has invalidated it.
+@conditional("ships")  # ETag and If-None-Match handling, based on the version of the 'ships' table.
 def get_ships():
-    # Query all records from the 'ships' table using SQLAlchemy.
-    ships = Ship.query.all()
-    # Convert the list of 'Ship' objects received into a JSON formatted list with the 'to_json' method, then return it.
-    return jsonify([ship.to_json() for ship in ships])
+    try:
+        serializer, query, limit = ships_query()
+    except ValueError as e:
+        return error_response(400, str(e))
+    # Large collections can be streamed instead of building the whole list in memory.
+    if wants_stream():
+        return stream_rows(query, serializer)
+    # Rows are turned into JSON directly, without creating 'Ship' objects or dicts.
+    return ships_page(serializer, db.session.execute(query).all(), limit)
+
+
+def ships_query():
+    """
+    Builds the SELECT of 'GET /api/ships' from the query parameters: returns (serializer, query, limit).
+    Raises ValueError with the message for the client if a parameter is invalid.
+    (Also used by the async handlers of app/asgi.py.)
+    """
+    # Select only the requested columns; the 'id' is always needed for the cursor.
+    fields = [field for field in request.args.get("fields", "").split(",") if field]
+    unknown = [field for field in fields if field not in SHIP_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if fields:
+        columns = [SHIP_COLUMNS["id"]] + [SHIP_COLUMNS[field] for field in fields if field != "id"]
+    else:
+        columns = list(SHIP_COLUMNS.values())
+
+    try:
+        limit = int_arg("limit")
+        after = int_arg("after")
+        conditions = filter_conditions()
+    except ValueError:
+        raise ValueError("Parameters 'limit', 'after' and the crew/length ranges must be integers.") from None
+    if limit is not None and limit < 1:
+        raise ValueError("Parameter 'limit' must be positive.")
+
+    # Build the query: filters and the cursor go into the WHERE clause, so the database does the work.
+    serializer = RowSerializer(columns)
+    query = serializer.select().where(*conditions).order_by(Ship.id)
+    if after is not None:
+        query = query.where(Ship.id > after)
+    if limit is not None:
+        limit = min(limit, current_app.config["SHIPS_PAGE_SIZE_MAX"])
+        query = query.limit(limit)
+    return serializer, query, limit
+
+
+def ships_page(serializer, ships, limit):
+    """The response of 'GET /api/ships' for the rows of the query."""
+    response = json_response(serializer.dumps(ships))
+    # A full page means there may be more: link to the page after the last returned id.
+    if limit is not None and len(ships) == limit:
+        args = request.args.to_dict()
+        args["after"] = ships[-1].id
+        response.headers["Link"] = '<{}>; rel="next"'.format(url_for("api.get_ships", **args))
+    return response
+
+
+def search_fields():
+    """The columns of every ship that the search index needs, as dicts."""
+    columns = [SHIP_COLUMNS[name] for name in ("id",) + TEXT_FIELDS + FACETS]
+    return [dict(row._mapping) for row in db.session.execute(select(*columns))]
+
+
+# Endpoint to search ships.
+# Query parameters:
+#   q             -- words that must all start a word of the model, the manufacturer or a role (e.g. q=star dest),
+#   affiliation, category, ship_class -- exact match filters,
+#   limit, after  -- keyset pagination on 'id' (the next page is linked in the 'Link' header).
+# The response contains the number of matches, their counts per affiliation, category and class, and a page of ships.
+@bp.route("/ships/search", methods=["GET"])
+@query_budget(max_queries=3)  # The table version (ETag and index), a rebuild after another worker's write, the page.
+@cached("ships")
+@conditional("ships")  # ETag and If-None-Match handling, based on the version of the 'ships' table.
+def search_ships():
+    try:
+        limit = int_arg("limit")
+        after = int_arg("after")
+    except ValueError:
+        return error_response(400, "Parameters 'limit' and 'after' must be integers.")
+    if limit is not None and limit < 1:
+        return error_response(400, "Parameter 'limit' must be positive.")
+    limit = min(limit or current_app.config["SEARCH_PAGE_SIZE"], current_app.config["SHIPS_PAGE_SIZE_MAX"])
+
+    # The index is rebuilt only if the table changed since it was last brought up to date.
+    index = current_app.extensions["ship_index"]
+    index.refresh(table_version("ships"), search_fields)
+    ids, facets = index.search(request.args.get("q", ""), {name: request.args.get(name) for name in FACETS})
+    start = bisect.bisect_right(ids, after) if after is not None else 0
+    page = ids[start:start + limit]
+
+    # The ships of the page are read from the database, so they are never older than the index.
+    rows = db.session.execute(SHIP_SERIALIZER.select().where(Ship.id.in_(page)).order_by(Ship.id)).all() if page else []
+    body = b'{"total":%d,"facets":%s,"ships":%s}' % (len(ids), get_backend().dumps(facets), SHIP_SERIALIZER.dumps(rows))
+    response = json_response(body)
+    if start + limit < len(ids):
+        args = request.args.to_dict()
+        args["after"] = page[-1]
+        response.headers["Link"] = '<{}>; rel="next"'.format(url_for("api.search_ships", **args))
+    return response
+
+
+# Columns the statistics can be grouped by, and the numeric columns they can aggregate.
+STATS_DIMENSIONS = ("affiliation", "category", "manufacturer", "ship_class")
+STATS_COLUMNS = ("crew", "length")
+STATS_FUNCTIONS = {"sum": func.sum, "avg": func.avg, "min": func.min, "max": func.max}
+
+
+def numeric_value(column):
+    """
+    'column' where it holds a number, else NULL, which the aggregates skip and the histogram puts
+    in a bin of its own: SQLite keeps a value like 'BAD' in an INTEGER column, as text.
+    """
+    if db.engine.dialect.name != "sqlite":
+        return column
+    return case((func.typeof(column).in_(("integer", "real")), column))
+
+
+def stats_aggregates(spec):
+    """
+    Parses 'count,avg:crew,max:length' into labelled SQL aggregates, e.g. 'avg_crew'.
+    Raises ValueError naming the invalid entry.
+    """
+    aggregates = []
+    for entry in spec.split(","):
+        if entry == "count":
+            aggregates.append(func.count(Ship.id).label("count"))
+            continue
+        name, _, column = entry.partition(":")
+        if name not in STATS_FUNCTIONS or column not in STATS_COLUMNS:
+            raise ValueError(entry)
+        aggregates.append(STATS_FUNCTIONS[name](numeric_value(SHIP_COLUMNS[column])).label(f"{name}_{column}"))
+    return aggregates
+
+
+def stats_value(name, value):
+    # Averages stay fractional; sums, minimums and maximums of integer columns are integers.
+    if isinstance(value, Decimal):
+        return float(value) if name.startswith("avg_") else int(value)
+    return value
+
+
+# Endpoint to compute statistics of the ships in the database (one GROUP BY query).
+# Query parameters:
+#   group_by      -- comma separated dimensions: affiliation, category, manufacturer, ship_class,
+#   metrics       -- comma separated aggregates: count (default), sum:<column>, avg:<column>, min:<column>, max:<column>
+#                    of crew or length,
+#   histogram     -- crew or length: adds a '<column>_bin' dimension, the lower bound of the bin,
+#   bin_width     -- width of the bins (default: the range of the column divided by 'bins'), bins -- default 10,
+#   the filters of '/api/ships' (affiliation, category, manufacturer, ship_class, min_crew, ...).
+@bp.route("/ships/stats", methods=["GET"])
+@query_budget(max_queries=3)  # The table version, the range of the histogram column, the statistics.
+@cached("ships")  # Invalidated by every write to the ships, like the ship lists.
+@conditional("ships")
+def ship_stats():
+    dimensions = [name for name in request.args.get("group_by", "").split(",") if name]
+    unknown = [name for name in dimensions if name not in STATS_DIMENSIONS]
+    if unknown:
+        return error_response(400, f"Unknown dimensions: {', '.join(unknown)}")
+    try:
+        aggregates = stats_aggregates(request.args.get("metrics") or "count")
+    except ValueError as e:
+        return error_response(400, f"Unknown metric: {e}")
+    try:
+        conditions = filter_conditions()
+        bin_width = int_arg("bin_width")
+        bins = int_arg("bins") or 10
+    except ValueError:
+        return error_response(400, "Parameters 'bin_width', 'bins' and the crew/length ranges must be integers.")
+
+    groups = [SHIP_COLUMNS[name] for name in dimensions]
+    histogram = request.args.get("histogram")
+    if histogram is not None:
+        if histogram not in STATS_COLUMNS:
+            return error_response(400, f"Parameter 'histogram' must be one of: {', '.join(STATS_COLUMNS)}")
+        column = numeric_value(SHIP_COLUMNS[histogram])
+        # Bins of a given width start at 0; otherwise 'bins' bins cover the range of the column.
+        low = 0
+        if bin_width is None:
+            low, high = db.session.execute(select(func.min(column), func.max(column)).where(*conditions)).one()
+            low, high = int(low or 0), int(high or 0)
+            bin_width = max(1, -(-(high - low + 1) // max(1, bins)))
+        if bin_width < 1:
+            return error_response(400, "Parameter 'bin_width' must be positive.")
+        # The lower bound of the bin: 'x - (x - low) % width' is integer arithmetic in every database.
+        groups.append((column - (column - low) % bin_width).label(f"{histogram}_bin"))
+
+    query = select(*groups, *aggregates).where(*conditions).group_by(*groups).order_by(*groups)
+    rows = db.session.execute(query).all()
+    result = [{name: stats_value(name, value) for name, value in row._mapping.items()} for row in rows]
+    body = {"groups": result}
+    if histogram is not None:
+        body["bin_width"] = bin_width
+    return jsonify(body)
 
 
 # Endpoint to get a specific ship by identifier (ID).
 @bp.route("/ships/<int:id>", methods=["GET"])
+@query_budget(max_queries=2)  # The table version (in the key of the cached response) and the ship.
+@cached("ships", item="id")
 def get_ship(id):
-    # Find the ship by ID. 'get' is a quick search for the primary key.
-    ship = Ship.query.get(id)
-    # If the ship is not found ('get' returns None), we send a 404 error.
+    # Find the ship by ID, as a row of its columns and its version (no 'Ship' object is needed to answer).
+    ship = db.session.execute(SHIP_SERIALIZER.select().add_columns(Ship.version).where(Ship.id == id)).first()
+    # If the ship is not found, we send a 404 error.
     if ship is None:
         return error_response(404)
+    # The ETag is the version of the row: If-None-Match is answered with 304, and PUT and DELETE take it in If-Match.
+    etag = row_etag(ship.version)
     # If found, return the ship's data in JSON format.
-    return jsonify(ship.to_json())
+    return not_modified(etag) or add_validators(json_response(SHIP_SERIALIZER.dumps_one(ship)), etag)
 
 
 # Endpoint to create a new ship.
 @bp.route("/ships", methods=["POST"])
 @jwt_required  # Only an authenticated user (with a valid access token) can access it.
+@query_budget(max_queries=3)
 def create_ship():
     # Get the JSON data from the request body.
     data = request.get_json()
@@ -56,62 +305,227 @@ def create_ship():
     )
     # Add the new object to the database "session".
     db.session.add(new_ship)
+    # Bump the version of the table, so the old ETags no longer match.
+    TableVersion.bump("ships")
     # Commit the changes to the database.
     db.session.commit()
+    # The cached ship lists no longer contain every ship.
+    invalidate("ships")
+    payload = new_ship.to_json()
+    update_index(ships=[payload])
 
     # Return the data of the newly created ship as JSON.
-    response = jsonify(new_ship.to_json())
+    response = jsonify(payload)
     # Set the HTTP status code to 201 Created, indicating successful creation.
     response.status_code = 201
     # Add the URL of the new resource to the 'Location' header of the response.
     response.headers["Location"] = url_for("api.get_ship", id=new_ship.id)
+    response.set_etag(row_etag(new_ship.version))
+    return response
+
+
+def write_ship(id, values):
+    """
+    Applies 'values' (attribute -> value) to ship 'id' for PUT and PATCH: one UPDATE statement guarded
+    by 'If-Match', without reading the ship first, then the caches and the search index are updated.
+    """
+    ship, error = update_row(Ship.__table__, id, values, SHIP_COLUMNS.values())
+    # 404 if the ship does not exist, 412 if it was modified since the client read it.
+    if error is not None:
+        return error
+
+    payload = {name: ship[name] for name in SHIP_COLUMNS}
+    # Without attributes to set, the ship was only read: its version and the caches stay as they are.
+    if values:
+        TableVersion.bump("ships")
+        # Commit the changes to the database.
+        db.session.commit()
+        # Drop the cached responses of this ship and of the ship lists.
+        invalidate("ships", id)
+        update_index(ships=[payload])
+    # Return the updated ship's data, with its new ETag for the next update.
+    response = jsonify(payload)
+    response.set_etag(row_etag(ship.version))
     return response
 
 
 # Endpoint to update an existing ship.
+# With 'If-Match: <ETag of the ship>' the update only applies if nobody changed the ship since (412 otherwise).
 @bp.route("/ships/<int:id>", methods=["PUT"])
 @jwt_required  # Only an authenticated user can access it.
+@query_budget(max_queries=3)
 def update_ship(id):
-    # Find the ship to be updated by ID.
-    ship = Ship.query.get(id)
-    # If it doesn't exist, we return a 404 error.
-    if ship is None:
-        return error_response(404)
-
     # Get the JSON data from the request body.
     data = request.get_json()
     if not data:
         return error_response(400, "No data in request.")
 
-    # Update the ship's attributes with the received data.
-    # 'data.get(key, default_value)' is safer because if a key is missing, it keeps the existing value.
-    ship.affiliation = data.get('affiliation', ship.affiliation)
-    ship.category = data.get('category', ship.category)
-    ship.crew = data.get('crew', ship.crew)
-    ship.length = data.get('length', ship.length)
-    ship.manufacturer = data.get('manufacturer', ship.manufacturer)
-    ship.model = data.get('model', ship.model)
-    ship.roles = data.get('roles', ship.roles)
-    ship.ship_class = data.get('ship_class', ship.ship_class)
+    # Only the attributes present in the data are set; the others keep their value.
+    return write_ship(id, {field: data[field] for field in SHIP_FIELD_TYPES if field in data})
 
-    # Commit the changes to the database.
-    db.session.commit()
-    # Return the updated ship's data.
-    return jsonify(ship.to_json())
+
+# Endpoint to change some attributes of a ship, e.g. '{"crew": 5}' (also conditional with 'If-Match').
+# Unlike PUT, the attributes sent are validated (unknown ones and wrong types are rejected).
+@bp.route("/ships/<int:id>", methods=["PATCH"])
+@jwt_required  # Only an authenticated user can access it.
+@query_budget(max_queries=3)
+def patch_ship(id):
+    data = request.get_json(silent=True)
+    if not data:
+        return error_response(400, "No data in request.")
+    # Only the attributes sent are checked, none is required; the required ones cannot be emptied.
+    errors = validate_ship_data(data)
+    for field in SHIP_REQUIRED_FIELDS:
+        if field in data and data[field] is None:
+            errors.setdefault(field, "Field may not be null.")
+    if errors:
+        return error_response(400, errors)
+    return write_ship(id, data)
 
 
-# Endpoint to delete a ship.
+# Endpoint to delete a ship (also conditional with 'If-Match').
 @bp.route("/ships/<int:id>", methods=["DELETE"])
 @jwt_required  # Only an authenticated user can access it.
+@query_budget(max_queries=2)
 def delete_ship(id):
-    # Find the ship to be deleted by ID.
-    ship = Ship.query.get(id)
-    # If it doesn't exist, we return a 404 error.
-    if ship is None:
-        return error_response(404)
-    # Delete the object from the database "session".
-    db.session.delete(ship)
+    # Delete the ship with one DELETE statement; 404 if it does not exist, 412 if 'If-Match' does not match.
+    error = delete_row(Ship.__table__, id)
+    if error is not None:
+        return error
+    TableVersion.bump("ships")
     # Commit the change.
     db.session.commit()
+    invalidate("ships", id)
+    update_index(deleted=[id])
     # On successful deletion, return a 204 No Content status code with an empty response.
     return "", 204
+
+
+# The type every ship attribute must have in a bulk request ('id' is never set by the client).
+SHIP_FIELD_TYPES = {
+    "affiliation": str,
+    "category": str,
+    "crew": int,
+    "length": int,
+    "manufacturer": str,
+    "model": str,
+    "roles": list,
+    "ship_class": str,
+}
+
+
+# The attributes every ship must have.
+SHIP_REQUIRED_FIELDS = ("model", "ship_class")
+
+
+def validate_ship_data(data, required=()):
+    """Returns a dict of field -> error message; an empty dict means the data is valid."""
+    if not isinstance(data, dict):
+        return {"data": "Must be an object."}
+    errors = {}
+    for field in required:
+        if data.get(field) is None:
+            errors[field] = "Missing data for required field."
+    for field, value in data.items():
+        expected = SHIP_FIELD_TYPES.get(field)
+        if expected is None:
+            errors[field] = "Unknown field."
+        # 'bool' is a subclass of 'int' in Python, so it has to be excluded explicitly.
+        elif value is not None and (not isinstance(value, expected) or isinstance(value, bool)):
+            errors[field] = f"Not a valid {expected.__name__}."
+    return errors
+
+
+def read_bulk_items():
+    """Reads the operations of a bulk request: a JSON array or one JSON object per line (NDJSON)."""
+    if request.mimetype == "application/x-ndjson":
+        lines = request.get_data(as_text=True).splitlines()
+        return [json.loads(line) for line in lines if line.strip()]
+    return request.get_json(silent=True)
+
+
+# Endpoint to create, update and delete many ships in a single transaction.
+# The body is a list of operations:
+#   {"op": "create", "data": {...}}, {"op": "update", "id": 5, "data": {...}}, {"op": "delete", "id": 5}
+# All operations are validated first; if any of them is invalid, nothing is changed.
+# With '?return_ids=0' new ships are inserted with one executemany INSERT, but their ids are not returned.
+@bp.route("/ships/bulk", methods=["POST"])
+@jwt_required  # Only an authenticated user can access it.
+def bulk_ships():
+    try:
+        items = read_bulk_items()
+    except ValueError:
+        return error_response(400, "Invalid JSON in request.")
+    if not isinstance(items, list) or not items:
+        return error_response(400, "Expected a non-empty list of operations.")
+    if len(items) > current_app.config["BULK_MAX_ITEMS"]:
+        return error_response(400, f"At most {current_app.config['BULK_MAX_ITEMS']} operations per request.")
+
+    # First pass: validate every item without touching the database.
+    results = []
+    seen_ids = set()
+    for index, item in enumerate(items):
+        op = item.get("op") if isinstance(item, dict) else None
+        result = {"index": index, "op": op}
+        results.append(result)
+        if op not in ("create", "update", "delete"):
+            result.update(status=400, message="'op' must be one of: create, update, delete.")
+            continue
+        if op != "create":
+            ship_id = item.get("id")
+            if not isinstance(ship_id, int) or isinstance(ship_id, bool):
+                result.update(status=400, message="'id' is required.")
+                continue
+            if ship_id in seen_ids:
+                result.update(status=400, message="The same 'id' can only appear once per request.")
+                continue
+            seen_ids.add(ship_id)
+            result["id"] = ship_id
+        if op != "delete":
+            errors = validate_ship_data(item.get("data"), required=SHIP_REQUIRED_FIELDS if op == "create" else ())
+            if errors:
+                result.update(status=400, message=errors)
+
+    # A single query checks that every ship to be updated or deleted exists.
+    if seen_ids:
+        existing = {ship_id for (ship_id,) in db.session.execute(select(Ship.id).where(Ship.id.in_(seen_ids)))}
+        for result in results:
+            if "id" in result and "status" not in result and result["id"] not in existing:
+                result.update(status=404, message="Ship not found.")
+
+    if any("status" in result for result in results):
+        for result in results:
+            result.setdefault("status", 200)
+        return error_response(400, "No changes were applied.", results=results)
+
+    # Second pass: group the operations and apply them with one statement per kind.
+    creates = [(result, dict(items[result["index"]]["data"])) for result in results if result["op"] == "create"]
+    updates = [dict(items[result["index"]]["data"], id=result["id"]) for result in results if result["op"] == "update"]
+    deletes = [result["id"] for result in results if result["op"] == "delete"]
+
+    if creates:
+        rows = [row for _, row in creates]
+        if request.args.get("return_ids", "1") == "0":
+            # A plain executemany INSERT, the fastest way, but the database does not report the new ids.
+            db.session.execute(Ship.__table__.insert(), rows)
+        else:
+            # 'return_defaults' writes the generated primary keys back into the dicts.
+            db.session.bulk_insert_mappings(Ship, rows, return_defaults=True)
+            for result, row in creates:
+                result["id"] = row["id"]
+    if updates:
+        # Rows with the same set of columns are sent as one executemany UPDATE.
+        db.session.bulk_update_mappings(Ship, updates)
+        # The updated ships get a new version (ETag), in one more statement.
+        db.session.execute(Ship.__table__.update().where(Ship.id.in_([row["id"] for row in updates]))
+                           .values(version=Ship.version + 1))
+    if deletes:
+        db.session.execute(Ship.__table__.delete().where(Ship.id.in_(deletes)))
+    TableVersion.bump("ships")
+    db.session.commit()
+    invalidate("ships", *[result["id"] for result in results if result["op"] != "create"])
+    invalidate_index()
+
+    for result in results:
+        result["status"] = {"create": 201, "update": 200, "delete": 204}[result["op"]]
+    return jsonify(results=results)
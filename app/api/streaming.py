@@ -0,0 +1,32 @@
+# Helpers for streaming large collections as newline delimited JSON (NDJSON).
+from flask import Response, current_app, request, stream_with_context
+from models import db
+
+
+NDJSON = "application/x-ndjson"
+
+
+def wants_stream():
+    """True if the client asked for streaming with '?stream=1' or 'Accept: application/x-ndjson'."""
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    # With no (or a generic) Accept header the first entry, plain JSON, wins.
+    return request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON
+
+
+def stream_rows(query, serializer):
+    """
+    Sends the rows of a Core SELECT (built with 'serializer.select()') one JSON object per line.
+    The rows are fetched from a server-side cursor in batches of STREAM_BATCH_SIZE,
+    so memory use stays the same no matter how many rows the query returns.
+    """
+    batch_size = current_app.config["STREAM_BATCH_SIZE"]
+
+    def generate():
+        result = db.session.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+        # Every batch is written to the client as soon as it is serialized.
+        for rows in result.partitions(batch_size):
+            yield serializer.lines(rows)
+
+    # 'stream_with_context' keeps the request (and the database session) alive while the generator runs.
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
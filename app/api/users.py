@@ -1,34 +1,57 @@
 # Import necessary Flask and Flask-JWT-Extended modules.
-from flask import jsonify, request, url_for
+from flask import current_app, request, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity  # jwt_required: protection; get_jwt_identity: reads the logged-in user's ID from the token.
+from sqlalchemy.exc import IntegrityError  # Raised when a new name is already taken (the column is unique).
 from app.api import bp
-from models import db, User  # Database connection and User model.
+from models import db, User, TableVersion  # Database connection and User model.
+from app.http_cache import add_validators, conditional, not_modified, row_etag  # ETags and conditional GET.
+from app.api.writes import delete_row, update_row  # Single-statement writes guarded by 'If-Match'.
+from passwords import get_hasher  # Hashes new passwords.
+from app.response_cache import cached, invalidate  # Server-side cache of GET responses.
 from app.errors import error_response
+from app.serialization import jsonify, json_response, RowSerializer  # JSON encoding of responses.
+from app.revocation import USER_DELETED  # Generation recorded for deleted users.
+from app.api.streaming import wants_stream, stream_rows
+from app.query_budget import query_budget  # Limits on the SQL statements per request.
 
 
+# Encodes the public columns of users straight from result rows.
+USER_SERIALIZER = RowSerializer([User.__table__.c.id, User.__table__.c.name])
+
 # Endpoint to get all users.
 @bp.route("/users", methods=["GET"])
+@query_budget(max_queries=2)  # The table version and the users.
+@cached("users")  # Serves the stored response while no write has invalidated it.
+@conditional("users")  # ETag and If-None-Match handling, based on the version of the 'users' table.
 def get_users():
-    # Query all users.
-    users = User.query.all()
-    # Return the list of users in JSON format. The 'to_json' method ensures that the password is not included.
-    return jsonify([user.to_json() for user in users])
+    # Only the public columns are selected, the same ones 'to_json' returns (never the password).
+    query = USER_SERIALIZER.select().order_by(User.id)
+    # Stream the users one per line if the client asked for it ('?stream=1' or 'Accept: application/x-ndjson').
+    if wants_stream():
+        return stream_rows(query, USER_SERIALIZER)
+    # Return the list of users in JSON format, encoded straight from the rows.
+    return json_response(USER_SERIALIZER.dumps(db.session.execute(query).all()))
 
 
 # Endpoint to get a user by ID.
 @bp.route("/users/<int:id>", methods=["GET"])
+@query_budget(max_queries=2)  # The table version (in the key of the cached response) and the user.
+@cached("users", item="id")
 def get_user(id):
-    # Find the user by ID.
-    user = User.query.get(id)
+    # Find the user by ID (only the public columns, and the version of the row).
+    user = db.session.execute(USER_SERIALIZER.select().add_columns(User.version).where(User.id == id)).first()
     # If it doesn't exist, we return a 404 error.
     if user is None:
         return error_response(404)
+    # The ETag is the version of the row (If-None-Match, and If-Match of PUT and DELETE).
+    etag = row_etag(user.version)
     # Return their data as JSON.
-    return jsonify(user.to_json())
+    return not_modified(etag) or add_validators(json_response(USER_SERIALIZER.dumps_one(user)), etag)
 
 
 # Endpoint to create a new user (registration).
 @bp.route("/users", methods=["POST"])
+@query_budget(max_queries=4)
 def create_user():
     # Get the JSON data from the request.
     data = request.get_json()
@@ -46,8 +69,15 @@ def create_user():
     new_user.set_password(data['password'])
     # Add the new user to the database session.
     db.session.add(new_user)
+    # Bump the version of the table, so the old ETags no longer match.
+    TableVersion.bump("users")
     # Commit the changes.
     db.session.commit()
+    # The cached user lists no longer contain every user.
+    invalidate("users")
+    # The id may be the one of a deleted user (SQLite reuses the highest id): the generation of the
+    # new user replaces the one cached for the deleted user, which revokes every token.
+    current_app.extensions["revocation_store"].revoke_user(new_user.id, new_user.token_generation)
 
     # Create the response.
     response = jsonify(new_user.to_json())
@@ -55,12 +85,56 @@ def create_user():
     response.status_code = 201
     # Add the URL of the new user to the response header.
     response.headers["Location"] = url_for("api.get_user", id=new_user.id)
+    response.set_etag(row_etag(new_user.version))
+    return response
+
+
+def write_user(id, data):
+    """
+    Applies the 'name' and 'password' of 'data' to user 'id' for PUT and PATCH: one UPDATE statement
+    guarded by 'If-Match', without reading the user first.
+    """
+    # Update the name if provided.
+    values = {}
+    if 'name' in data:
+        values['name'] = data['name']
+    # Update the password if provided.
+    # A password change logs the user out everywhere: the tokens issued so far are revoked.
+    password_changed = 'password' in data
+    if password_changed:
+        values['password'] = get_hasher().hash(data['password'])
+        values['token_generation'] = User.token_generation + 1
+
+    # The new token generation is read back with the row.
+    try:
+        user, error = update_row(User.__table__, id, values, [User.id, User.name, User.token_generation])
+    except IntegrityError:
+        # The new name belongs to another user.
+        db.session.rollback()
+        return error_response(400, "Username is already taken.")
+    # 404 if the user does not exist, 412 if it was modified since the client read it.
+    if error is not None:
+        return error
+
+    # Without a name or a password to set, the user was only read: its version and the caches stay as they are.
+    if values:
+        TableVersion.bump("users")
+        # Commit the changes.
+        db.session.commit()
+        if password_changed:
+            current_app.extensions["revocation_store"].revoke_user(id, user.token_generation)
+        # Drop the cached responses of this user and of the user lists.
+        invalidate("users", id)
+    response = jsonify({"id": user.id, "name": user.name})
+    response.set_etag(row_etag(user.version))
     return response
 
 
 # Endpoint to update a user's data.
+# With 'If-Match: <ETag of the user>' the update only applies if nobody changed the user since (412 otherwise).
 @bp.route("/users/<int:id>", methods=["PUT"])
 @jwt_required  # Only accessible by a logged-in user.
+@query_budget(max_queries=3)
 def update_user(id):
     # Get the logged-in user's ID from the token.
     current_user_id = get_jwt_identity()
@@ -69,33 +143,58 @@ def update_user(id):
         # If not, we return a 403 Forbidden error.
         return error_response(403)
 
-    # Query the user to be updated from the database.
-    user = User.query.get(id)
-    if user is None:
-        return error_response(404)
-
     data = request.get_json()
     if not data:
         return error_response(400, "No data in request.")
-
-    # If a new name is provided, and it's different from the old one, AND it's already taken, we throw an error.
-    if 'name' in data and data['name'] != user.name and User.query.filter_by(name=data['name']).first():
-        return error_response(400, "Username is already taken.")
-
-    # Update the name if provided.
-    user.name = data.get('name', user.name)
-    # Update the password if provided.
-    if 'password' in data:
-        user.set_password(data['password'])
-
-    # Commit the changes.
-    db.session.commit()
-    return jsonify(user.to_json())
+    # The name and the password cannot be emptied (the columns are NOT NULL).
+    errors = {field: "Field may not be null." for field in ("name", "password") if field in data and data[field] is None}
+    if errors:
+        return error_response(400, errors)
+    return write_user(id, data)
+
+
+# The minimum length of the user attributes that can be changed.
+USER_FIELD_MIN_LENGTHS = {"name": 2, "password": 4}
+
+
+def validate_user_data(data):
+    """Returns a dict of field -> error message for the attributes in 'data'; an empty dict means the data is valid."""
+    if not isinstance(data, dict):
+        return {"data": "Must be an object."}
+    errors = {}
+    for field, value in data.items():
+        min_length = USER_FIELD_MIN_LENGTHS.get(field)
+        if min_length is None:
+            errors[field] = "Unknown field."
+        elif not isinstance(value, str):
+            errors[field] = "Not a valid string."
+        elif len(value) < min_length:
+            errors[field] = f"Shorter than minimum length {min_length}."
+    return errors
+
+
+# Endpoint to change the name or the password of a user (also conditional with 'If-Match').
+# Unlike PUT, the attributes sent are validated.
+@bp.route("/users/<int:id>", methods=["PATCH"])
+@jwt_required  # Only accessible by a logged-in user.
+@query_budget(max_queries=3)
+def patch_user(id):
+    # Users can only change their own data.
+    if id != get_jwt_identity():
+        return error_response(403)
+    data = request.get_json(silent=True)
+    if not data:
+        return error_response(400, "No data in request.")
+    errors = validate_user_data(data)
+    if errors:
+        return error_response(400, errors)
+    return write_user(id, data)
 
 
 # Endpoint to delete a user.
 @bp.route("/users/<int:id>", methods=["DELETE"])
 @jwt_required  # Only accessible by a logged-in user.
+@query_budget(max_queries=2)
 def delete_user(id):
     # Get the logged-in user's ID.
     current_user_id = get_jwt_identity()
@@ -103,13 +202,14 @@ def delete_user(id):
     if id != current_user_id:
         return error_response(403)
 
-    # Query the user to be deleted.
-    user = User.query.get(id)
-    if user is None:
-        return error_response(404)
-
-    # Delete the user.
-    db.session.delete(user)
+    # Delete the user with one DELETE statement; 404 if it does not exist, 412 if 'If-Match' does not match.
+    error = delete_row(User.__table__, id)
+    if error is not None:
+        return error
+    TableVersion.bump("users")
     db.session.commit()
+    # The tokens of a deleted user are no longer accepted.
+    current_app.extensions["revocation_store"].revoke_user(id, USER_DELETED)
+    invalidate("users", id)
     # Indicate successful deletion with a 204 No Content response.
     return "", 204
@@ -0,0 +1,52 @@
+# Updates and deletes of a single row as one SQL statement (SQLAlchemy Core), without loading it,
+# with optimistic concurrency control: every update increments the row's 'version' column, which
+# is its ETag, and a request with 'If-Match' only applies while the row still has a version it names.
+# Two clients editing the same row cannot both succeed: the second one gets '412 Precondition Failed'.
+from sqlalchemy import select
+from app.errors import error_response
+from app.http_cache import if_match_versions, row_etag
+from models import db
+
+
+def guarded(statement, table):
+    """Restricts an UPDATE or DELETE to the row versions the 'If-Match' header accepts."""
+    versions = if_match_versions()
+    return statement if versions is None else statement.where(table.c.version.in_(versions))
+
+
+def write_failed(table, id):
+    """The response to a guarded write that changed no row: 404 if the row does not exist, else 412 with its current ETag."""
+    version = db.session.execute(select(table.c.version).where(table.c.id == id)).scalar()
+    if version is None:
+        return error_response(404)
+    response = error_response(412, "The resource was modified in the meantime: read it again and retry.")
+    response.set_etag(row_etag(version))
+    return response
+
+
+def update_row(table, id, values, columns):
+    """
+    Sets 'values' (column name -> value or SQL expression) on row 'id' and increments its version,
+    in a single UPDATE guarded by 'If-Match'. Returns (row, None), the row with 'columns' and its
+    version, or (None, error response). The row comes back with the UPDATE where the database
+    supports 'UPDATE ... RETURNING' (PostgreSQL), else from a SELECT by primary key right after it.
+    Without 'values' nothing is written: the row is read as it is, with the same 'If-Match' check.
+    """
+    if not values:
+        row = db.session.execute(guarded(select(*columns, table.c.version).where(table.c.id == id), table)).first()
+        return (row, None) if row is not None else (None, write_failed(table, id))
+    statement = table.update().where(table.c.id == id).values(dict(values, version=table.c.version + 1))
+    statement = guarded(statement, table)
+    if db.engine.dialect.full_returning:
+        row = db.session.execute(statement.returning(*columns, table.c.version)).first()
+        return (row, None) if row is not None else (None, write_failed(table, id))
+    if db.session.execute(statement).rowcount == 0:
+        return None, write_failed(table, id)
+    return db.session.execute(select(*columns, table.c.version).where(table.c.id == id)).first(), None
+
+
+def delete_row(table, id):
+    """Deletes row 'id' with a single DELETE guarded by 'If-Match'. Returns None, or an error response."""
+    if db.session.execute(guarded(table.delete().where(table.c.id == id), table)).rowcount == 0:
+        return write_failed(table, id)
+    return None
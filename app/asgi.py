@@ -0,0 +1,295 @@
+# Optional ASGI serving mode ('asgi.py': 'uvicorn asgi:app'). The read endpoints of the ships and
+# users run as coroutines on SQLAlchemy's asyncio engine (aiomysql or aiosqlite), so a request waiting
+# on the database holds no thread; every other route is passed to the Flask application in a thread pool.
+#
+# Werkzeug's context locals are not coroutine-aware, so the Flask request context is only pushed around
+# the synchronous steps of an async handler (parsing the request, building the response), never across
+# an 'await'. The server-side response cache is bypassed by the async handlers; ETags, compression,
+# CORS and the request metrics apply as usual.
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import g
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
+from app.api.ships import SHIP_SERIALIZER, ships_page, ships_query
+from app.api.streaming import wants_stream
+from app.api.users import USER_SERIALIZER
+from app.errors import error_response
+from app.http_cache import add_validators, make_etag, not_modified, row_etag
+from app.metrics import RequestMetrics
+from app.serialization import json_response
+from models import Ship, TableVersion, User
+
+
+# Synchronous driver -> asyncio driver of the same database.
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql", "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite", "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url):
+    """The URL of the asyncio driver for a database URL, e.g. 'mysql+pymysql://...' -> 'mysql+aiomysql://...'."""
+    scheme, separator, rest = url.partition("://")
+    if scheme not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver known for: {scheme}")
+    return ASYNC_DRIVERS[scheme] + separator + rest
+
+
+def async_engine(app):
+    """The asyncio engine of the application's database (ASYNC_DATABASE_URL, or the same database with an asyncio driver)."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    url = app.config["ASYNC_DATABASE_URL"] or async_database_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    # SQLite connections are not pooled, so only the pre-ping option applies to them.
+    options = dict(app.config["SQLALCHEMY_ENGINE_OPTIONS"])
+    if url.startswith("sqlite"):
+        options = {"pool_pre_ping": options.get("pool_pre_ping", False)}
+    try:
+        return create_async_engine(url, **options)
+    except ImportError as e:
+        raise RuntimeError(f"The asyncio driver of {url.split('://')[0]} is not installed ({e.name}).")
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ of an ASGI HTTP request."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        # WSGI paths are the raw bytes decoded as latin-1, ASGI paths are decoded as UTF-8.
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin-1").upper().replace("-", "_"), value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+class AsyncRequest:
+    """One request served by an async handler: its environ and its metrics, kept across the 'await's."""
+
+    def __init__(self, app, environ):
+        self.app = app
+        self.environ = environ
+        self.metrics = RequestMetrics() if app.config["METRICS_ENABLED"] else None
+
+    @contextmanager
+    def context(self):
+        """Pushes the Flask request context for a synchronous step (no 'await' inside)."""
+        with self.app.request_context(self.environ):
+            if self.metrics is not None:
+                g.request_metrics = self.metrics
+            yield
+
+    async def execute(self, connection, query):
+        started = time.perf_counter()
+        result = await connection.execute(query)
+        if self.metrics is not None:
+            self.metrics.queries += 1
+            self.metrics.phases["sql"] += time.perf_counter() - started
+        return result
+
+    def finish(self, response):
+        """Runs the 'after_request' hooks and returns (status, headers, body chunks) of the response."""
+        with self.context():
+            response = self.app.process_response(response)
+            started = {}
+
+            def start_response(status, headers, exc_info=None):
+                started.update(status=int(status.split(" ", 1)[0]), headers=headers)
+
+            chunks = list(response(self.environ, start_response))
+        return started["status"], started["headers"], chunks
+
+
+class AsyncAPI:
+    """
+    ASGI application: the GET endpoints of '/api/ships' and '/api/users' have async handlers,
+    every other request goes to 'app' (the Flask application) in a pool of 'threads' threads.
+    """
+
+    def __init__(self, app, threads=None):
+        self.app = app
+        self.engine = async_engine(app)
+        self.executor = ThreadPoolExecutor(threads or app.config["ASGI_THREADS"], thread_name_prefix="wsgi")
+        # Endpoint -> async handler of its GET requests; the endpoints are matched with the Flask URL map.
+        self.handlers = {
+            "api.get_ships": self.get_ships,
+            "api.get_ship": self.get_ship,
+            "api.get_users": self.get_users,
+            "api.get_user": self.get_user,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        environ = wsgi_environ(scope, await read_body(receive))
+        handler, arguments = self.match(environ)
+        if handler is not None:
+            request = AsyncRequest(self.app, environ)
+            response = await handler(request, **arguments)
+            # None: the handler leaves this request to the Flask application (e.g. a streamed list).
+            if response is not None:
+                await send_response(send, *request.finish(response))
+                return
+        await self.call_wsgi(environ, send)
+
+    def match(self, environ):
+        if environ["REQUEST_METHOD"] not in ("GET", "HEAD"):
+            return None, {}
+        adapter = self.app.url_map.bind_to_environ(environ)
+        try:
+            endpoint, arguments = adapter.match()
+        except HTTPException:
+            # Redirects, 404 and 405 are answered by Flask.
+            return None, {}
+        return self.handlers.get(endpoint), arguments
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read(self, request, table, query, respond):
+        """
+        Answers a conditional GET: reads the version of 'table' and, unless the client holds the
+        current ETag, the rows of 'query'; 'respond(rows)' builds the response from them.
+        """
+        async with self.engine.connect() as connection:
+            version = (await request.execute(connection, select(TableVersion.version).where(TableVersion.name == table))).scalar()
+            with request.context():
+                etag = make_etag(version or 0)
+                response = not_modified(etag)
+            if response is not None:
+                return response
+            rows = (await request.execute(connection, query)).all()
+        with request.context():
+            response = respond(rows)
+            return add_validators(response, etag) if response.status_code == 200 else response
+
+    async def get_ships(self, request):
+        with request.context():
+            if wants_stream():
+                return None
+            try:
+                serializer, query, limit = ships_query()
+            except ValueError as e:
+                return error_response(400, str(e))
+        return await self.read(request, "ships", query, lambda rows: ships_page(serializer, rows, limit))
+
+    async def read_row(self, request, serializer, query):
+        """Answers a GET of a single row, selected with its version last: the ETag is the row version."""
+        async with self.engine.connect() as connection:
+            row = (await request.execute(connection, query)).first()
+        with request.context():
+            if row is None:
+                return error_response(404)
+            etag = row_etag(row.version)
+            return not_modified(etag) or add_validators(json_response(serializer.dumps_one(row)), etag)
+
+    async def get_ship(self, request, id):
+        query = SHIP_SERIALIZER.select().add_columns(Ship.version).where(Ship.id == id)
+        return await self.read_row(request, SHIP_SERIALIZER, query)
+
+    async def get_users(self, request):
+        with request.context():
+            if wants_stream():
+                return None
+        query = USER_SERIALIZER.select().order_by(User.id)
+        return await self.read(request, "users", query, lambda rows: json_response(USER_SERIALIZER.dumps(rows)))
+
+    async def get_user(self, request, id):
+        query = USER_SERIALIZER.select().add_columns(User.version).where(User.id == id)
+        return await self.read_row(request, USER_SERIALIZER, query)
+
+    async def call_wsgi(self, environ, send):
+        """
+        Runs the Flask application in a thread. The body is sent as it is produced: a streamed
+        response is iterated in the same thread (its request context lives there) and every chunk
+        is handed over through a small queue, which also makes the thread wait for a slow client.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=8)
+        done = loop.run_in_executor(self.executor, self.run_wsgi, environ, loop, queue)
+        started = False
+        while True:
+            message = await queue.get()
+            if message[0] == "start":
+                await send({"type": "http.response.start", "status": message[1], "headers": encode_headers(message[2])})
+                started = True
+            elif message[0] == "body":
+                await send({"type": "http.response.body", "body": message[1], "more_body": True})
+            else:
+                break
+        if not started:
+            await send({"type": "http.response.start", "status": 500, "headers": []})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        await done
+
+    def run_wsgi(self, environ, loop, queue):
+        def put(message):
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            put(("start", int(status.split(" ", 1)[0]), headers))
+
+        try:
+            result = self.app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        put(("body", chunk))
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+        finally:
+            put(("end",))
+
+
+def encode_headers(headers):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+async def send_response(send, status, headers, chunks):
+    await send({"type": "http.response.start", "status": status, "headers": encode_headers(headers)})
+    await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": False})
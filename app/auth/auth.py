@@ -1,5 +1,5 @@
 # Import necessary modules.
-from flask import jsonify, request
+from flask import request, current_app
 from flask_jwt_extended import (
     create_access_token, create_refresh_token,  # Functions for creating tokens.
     jwt_required, jwt_refresh_token_required,  # Decorators for protecting endpoints.
@@ -7,12 +7,15 @@ from flask_jwt_extended import (
 )
 from app.auth import bp  # The authentication blueprint.
 from app.errors import error_response  # Uniform error handler.
+from app.serialization import jsonify  # JSON responses encoded with the configured JSON library.
+from app.query_budget import query_budget  # Limits on the SQL statements per request.
 from models import db, User, TokenBlocklist  # Database models.
 from datetime import datetime  # For handling date and time.
 
 
 # Login endpoint.
 @bp.route("/login", methods=["POST"])
+@query_budget(max_queries=2)  # The user, and the new hash if the password is rehashed.
 def login():
     # Check if the request is in JSON format.
     if not request.is_json:
@@ -27,18 +30,41 @@ def login():
     if not username or not password:
         return error_response(400, "Username or password missing.")
 
+    # Reject clients that are over their rate limit before doing any expensive work.
+    # 'remote_addr' is the client's address, also behind the proxies counted in TRUSTED_PROXY_COUNT.
+    limiter = current_app.extensions.get("login_limiter")
+    if limiter is not None:
+        retry_after = limiter.check(request.remote_addr, username)
+        if retry_after:
+            response = error_response(429, "Too many login attempts, try again later.")
+            response.headers["Retry-After"] = str(retry_after)
+            return response
+
     # Find the user by name in the database.
     user = User.query.filter_by(name=username).first()
 
     # Check if the user exists and the provided password is correct.
     # 'check_password' compares the hashed password with the received password.
+    # A failed attempt keeps the token taken by 'check'.
     if not user or not user.check_password(password):
         return error_response(401, "Username or password invalid.")
+    if limiter is not None:
+        limiter.succeeded(request.remote_addr, username)
+
+    # The user's token generation goes into both tokens, so 'logout-all' can revoke them.
+    # Read before a commit expires the object (and reading it again would load the row again).
+    user_id, claims = user.id, user.token_claims()
+
+    # If the hashing parameters have changed since the password was stored, store a new hash now
+    # (this is the only time the plain password is known).
+    if user.password_needs_rehash():
+        user.set_password(password)
+        db.session.commit()
 
     # If login is successful, create an access token and a refresh token.
     # The 'identity' is the "owner" of the token, here we store the user's ID in it.
-    access_token = create_access_token(identity=user.id)
-    refresh_token = create_refresh_token(identity=user.id)
+    access_token = create_access_token(identity=user_id, user_claims=claims)
+    refresh_token = create_refresh_token(identity=user_id, user_claims=claims)
     # Return the tokens to the client.
     return jsonify(access_token=access_token, refresh_token=refresh_token)
 
@@ -46,6 +72,7 @@ def login():
 # Endpoint for refreshing the access token.
 @bp.route("/refresh", methods=["POST"])
 @jwt_refresh_token_required  # This endpoint can only be accessed with a valid REFRESH token.
+@query_budget(max_queries=1)
 def refresh():
     # Read the user ID from the refresh token.
     user_id = get_jwt_identity()
@@ -53,8 +80,8 @@ def refresh():
     user = User.query.get(user_id)
     if not user:
         return error_response(401, "Unknown user.")
-    # Create a new access token.
-    access_token = create_access_token(identity=user.id)
+    # Create a new access token (of the user's current token generation).
+    access_token = create_access_token(identity=user.id, user_claims=user.token_claims())
     return jsonify(access_token=access_token)
 
 
@@ -62,11 +89,15 @@ def refresh():
 @bp.route("/logout", methods=["DELETE"])
 @jwt_required  # This endpoint can only be accessed with a valid ACCESS token.
 def logout_access_token():
-    # Read the unique identifier (jti) of the token.
-    jti = get_raw_jwt()["jti"]
+    # Read the unique identifier (jti) and the expiry (exp) of the token.
+    token = get_raw_jwt()
+    jti = token["jti"]
     # Add the jti to the 'TokenBlocklist' table, indicating that this token is invalid.
-    db.session.add(TokenBlocklist(jti=jti, created_at=datetime.now()))
+    # The row is kept until the token expires (see 'flask blocklist-prune').
+    db.session.add(TokenBlocklist(jti=jti, created_at=datetime.now(), expires_at=datetime.utcfromtimestamp(token["exp"])))
     db.session.commit()
+    # Tell the revocation store (and through it the other workers) about the revoked token.
+    current_app.extensions["revocation_store"].revoke(jti)
     return jsonify(message="Successfully logged out.")
 
 
@@ -75,7 +106,37 @@ def logout_access_token():
 @jwt_refresh_token_required  # This endpoint can only be accessed with a valid REFRESH token.
 def logout_refresh_token():
     # Same logic as for logout_access_token, but for the refresh token.
-    jti = get_raw_jwt()["jti"]
-    db.session.add(TokenBlocklist(jti=jti, created_at=datetime.now()))
+    token = get_raw_jwt()
+    jti = token["jti"]
+    db.session.add(TokenBlocklist(jti=jti, created_at=datetime.now(), expires_at=datetime.utcfromtimestamp(token["exp"])))
     db.session.commit()
+    current_app.extensions["revocation_store"].revoke(jti)
     return jsonify(message="Successfully logged out.")
+
+
+# Endpoint for logging out everywhere (revoking every token of the user).
+@bp.route("/logout-all", methods=["DELETE"])
+@jwt_required  # This endpoint can only be accessed with a valid ACCESS token.
+def logout_all():
+    user_id = get_jwt_identity()
+    user = User.query.get(user_id)
+    if user is None:
+        return error_response(401, "Unknown user.")
+    # A new token generation revokes all tokens issued so far, without adding rows to 'TokenBlocklist'.
+    user.revoke_tokens()
+    db.session.commit()
+    current_app.extensions["revocation_store"].revoke_user(user_id, User.current_token_generation(user_id))
+    return jsonify(message="Successfully logged out everywhere.")
+
+
+# Endpoint publishing the public keys that verify our tokens (JSON Web Key Set).
+@bp.route("/jwks.json", methods=["GET"])
+def jwks():
+    keyring = current_app.extensions.get("jwt_keyring")
+    # Tokens signed with JWT_SECRET_KEY have no public key to publish.
+    if keyring is None:
+        return error_response(404, "Tokens are not signed with a public key.")
+    response = jsonify(keyring.jwks())
+    # Other services may cache the keys until the next scan of the key directory.
+    response.headers["Cache-Control"] = f"public, max-age={keyring.reload_interval}"
+    return response
@@ -0,0 +1,80 @@
+# Removal of expired rows from the 'token_blocklist' table, from the CLI or a background thread.
+import threading
+import time
+from datetime import datetime
+from models import db, TokenBlocklist
+
+
+class PruneStats:
+    """Counters of the pruning runs, exported on '/metrics'."""
+
+    def __init__(self):
+        self.runs = 0
+        self.deleted_total = 0
+        self.last_deleted = 0
+        self.last_duration = 0.0
+        self.last_run_at = None
+        # Rows left after the last run (None before the first one): '/metrics' exports it without counting them.
+        self.rows = None
+
+    def record(self, deleted, duration, rows):
+        self.runs += 1
+        self.rows = rows
+        self.deleted_total += deleted
+        self.last_deleted = deleted
+        self.last_duration = duration
+        self.last_run_at = time.time()
+
+    @property
+    def rows_per_second(self):
+        return self.last_deleted / self.last_duration if self.last_duration else 0.0
+
+
+def legacy_cutoff(config):
+    """
+    Rows written before 'expires_at' existed have no expiry. They are deleted once older than
+    the longest token lifetime (refresh tokens, 30 days by default).
+    """
+    lifetime = config.get("JWT_REFRESH_TOKEN_EXPIRES")
+    if not lifetime:
+        return datetime.min
+    return datetime.now() - lifetime
+
+
+def blocklist_size():
+    return db.session.query(db.func.count(TokenBlocklist.id)).scalar()
+
+
+def prune(app, batch_size=500, pause=0.0):
+    """Deletes the expired rows and records the run, with the rows left; returns (deleted rows, seconds)."""
+    started = time.perf_counter()
+    deleted = TokenBlocklist.prune_expired(datetime.utcnow(), legacy_cutoff(app.config), batch_size, pause)
+    duration = time.perf_counter() - started
+    app.extensions["blocklist_stats"].record(deleted, duration, blocklist_size())
+    return deleted, duration
+
+
+class BlocklistSweeper(threading.Thread):
+    """Daemon thread pruning the blocklist every 'interval' seconds (BLOCKLIST_PRUNE_INTERVAL)."""
+
+    def __init__(self, app, interval, batch_size, pause):
+        threading.Thread.__init__(self, name="blocklist-sweeper", daemon=True)
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    prune(self.app, self.batch_size, self.pause)
+                except Exception:
+                    self.app.logger.exception("Pruning the token blocklist failed.")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,154 @@
+# Response compression negotiated with 'Accept-Encoding': gzip (standard library), brotli and
+# zstd (when the 'brotli' and 'zstandard' packages are installed). Only responses of the
+# compressible content types above COMPRESSION_MIN_BYTES are compressed; streamed responses are
+# compressed chunk by chunk, each chunk flushed so that the client still receives them at once.
+import zlib
+from flask import current_app, request
+from app.metrics import timed
+
+
+class GzipCodec:
+    name = "gzip"
+
+    def compress(self, data, level):
+        # 'wbits=31' writes the gzip header and trailer (without a file name or timestamp).
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+class BrotliCodec:
+    name = "br"
+
+    def __init__(self):
+        import brotli
+        self._brotli = brotli
+
+    def compress(self, data, level):
+        return self._brotli.compress(data, quality=level)
+
+    def stream(self, level):
+        compressor = self._brotli.Compressor(quality=level)
+        return lambda chunk: compressor.process(chunk) + compressor.flush(), compressor.finish
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self):
+        import zstandard
+        self._zstandard = zstandard
+
+    def compress(self, data, level):
+        return self._zstandard.ZstdCompressor(level=level).compress(data)
+
+    def stream(self, level):
+        compressor = self._zstandard.ZstdCompressor(level=level).compressobj()
+        flush_block = self._zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return lambda chunk: compressor.compress(chunk) + compressor.flush(flush_block), compressor.flush
+
+
+CODECS = {"br": BrotliCodec, "zstd": ZstdCodec, "gzip": GzipCodec}
+
+
+def available_codecs(names):
+    """The codecs among 'names' whose library is installed, in the same order."""
+    codecs = []
+    for name in names:
+        if name not in CODECS:
+            raise ValueError(f"Unsupported compression: {name}")
+        try:
+            codecs.append(CODECS[name]())
+        except ImportError:
+            continue
+    return codecs
+
+
+class Compression:
+    """
+    Compresses responses with the encoding the client prefers among 'codecs' (in the server's
+    order of preference when the client does not care). 'levels' maps every compressible
+    content type to the level of each encoding.
+    """
+
+    def __init__(self, codecs, levels, min_bytes=1024):
+        self.codecs = {codec.name: codec for codec in codecs}
+        self.levels = levels
+        self.min_bytes = min_bytes
+
+    def negotiate(self):
+        """The encoding to use for the current request, or None."""
+        if not self.codecs:
+            return None
+        encoding = request.accept_encodings.best_match(list(self.codecs))
+        # 'best_match' also returns an encoding accepted through '*'.
+        return encoding if encoding and request.accept_encodings[encoding] > 0 else None
+
+    def compressible(self, response):
+        return (response.status_code == 200 and response.mimetype in self.levels
+                and "Content-Encoding" not in response.headers and not response.direct_passthrough)
+
+    def compress(self, response, encoding):
+        """Compresses 'response' in place; small responses are left alone. Returns True if it was compressed."""
+        if not self.compressible(response):
+            return False
+        # The response depends on 'Accept-Encoding' even when it is too small to be compressed.
+        response.vary.add("Accept-Encoding")
+        if encoding is None:
+            return False
+        codec = self.codecs[encoding]
+        level = self.levels[response.mimetype][encoding]
+        if response.is_streamed:
+            response.response = self._stream(response.response, codec, level)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_bytes:
+                return False
+            with timed("compression"):
+                response.set_data(codec.compress(data, level))
+        response.headers["Content-Encoding"] = encoding
+        # A strong ETag identifies the bytes sent: every encoding gets its own.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(encoded_etag(etag, encoding))
+        return True
+
+    @staticmethod
+    def _stream(chunks, codec, level):
+        compress, finish = codec.stream(level)
+        for chunk in chunks:
+            data = compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield finish()
+
+    def after_request(self, response):
+        self.compress(response, self.negotiate())
+        return response
+
+
+def encoded_etag(etag, encoding):
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def negotiate():
+    """The encoding of the current request's response, or None (compression disabled or not accepted)."""
+    compression = current_app.extensions.get("compression")
+    return compression.negotiate() if compression is not None else None
+
+
+def compress(response, encoding):
+    """Compresses a response ahead of the 'after_request' hook (the response cache stores the result)."""
+    compression = current_app.extensions.get("compression")
+    return compression is not None and compression.compress(response, encoding)
+
+
+def init_app(app):
+    """Compresses the responses of 'app' (COMPRESSION_ENABLED)."""
+    codecs = available_codecs(app.config["COMPRESSION_ALGORITHMS"])
+    compression = app.extensions["compression"] = Compression(
+        codecs, app.config["COMPRESSION_LEVELS"], app.config["COMPRESSION_MIN_BYTES"])
+    app.after_request(compression.after_request)
@@ -1,11 +1,13 @@
-from flask import jsonify
+from app.serialization import jsonify
 from werkzeug.http import HTTP_STATUS_CODES
 
 
-def error_response(status_code, message=None):
+def error_response(status_code, message=None, **extra):
     payload = {"error": HTTP_STATUS_CODES.get(status_code, "Unknown error")}
     if message:
         payload["message"] = message
+    # Additional fields, e.g. the per-item results of a bulk request.
+    payload.update(extra)
     response = jsonify(payload)
     response.status_code = status_code
     return response
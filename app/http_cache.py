@@ -0,0 +1,89 @@
+# HTTP caching helpers: ETags derived from per-table version counters and conditional GET, and the
+# ETags of single rows, derived from their version column and sent back in 'If-Match' to update them.
+import hashlib
+from functools import wraps
+from flask import current_app, g, make_response, request
+from app.compression import encoded_etag, negotiate
+from models import TableVersion
+
+
+def make_etag(*parts):
+    """Builds a strong ETag value from the request and the given version parts."""
+    key = "|".join([request.full_path, request.headers.get("Accept", "")] + [str(part) for part in parts])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def table_version(table):
+    """
+    The version of a table, read once per request: the key of a cached response, the ETag of
+    @conditional and its view all use the same one.
+    """
+    # 'g' outlives the request when the application context is shared (e.g. in tests): its versions are stale.
+    if g.get("table_versions_request") is not request._get_current_object():
+        g.table_versions_request = request._get_current_object()
+        g.table_versions = {}
+    versions = g.table_versions
+    if table not in versions:
+        versions[table] = TableVersion.current(table)
+    return versions[table]
+
+
+def not_modified(etag):
+    """A '304 Not Modified' response if the client already holds the response tagged 'etag', else None."""
+    # A client that received a compressed response holds the ETag of its encoding.
+    for tag in (encoded_etag(etag, negotiate()), etag):
+        if request.if_none_match.contains(tag):
+            return add_validators(current_app.response_class(status=304), tag)
+    return None
+
+
+def add_validators(response, etag):
+    """Sets the ETag and the caching headers of a conditional GET response."""
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = current_app.config["HTTP_CACHE_CONTROL"]
+    response.vary.add("Accept")
+    return response
+
+
+def row_etag(version):
+    """The ETag of a single row: its version, the same for GET, PUT and DELETE of its URL."""
+    return f"v{version}"
+
+
+def if_match_versions():
+    """
+    The row versions accepted by the 'If-Match' header: None without the header or with '*'
+    (any version), else a set, empty when no tag is a row ETag (the precondition then fails).
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    versions = set()
+    # Weak tags never match 'If-Match'. A compressed response's ETag ends with its encoding.
+    for tag in if_match.as_set():
+        tag = tag.rsplit("-", 1)[0]
+        if tag.startswith("v") and tag[1:].isdigit():
+            versions.add(int(tag[1:]))
+    return versions
+
+
+def conditional(*tables):
+    """
+    Decorator for GET endpoints whose response only depends on the given tables.
+    The ETag is computed from the table versions before the view runs, so a matching
+    'If-None-Match' is answered with 304 without reading or serializing any row.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = make_etag(*[table_version(table) for table in tables])
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            response = make_response(view(*args, **kwargs))
+            # Errors (e.g. 404) are not cached.
+            if response.status_code != 200:
+                return response
+            return add_validators(response, etag)
+        return wrapper
+    return decorator
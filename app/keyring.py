@@ -0,0 +1,147 @@
+# Key ring for asymmetric JWT signing (RS256, ES256, PS256, ...).
+# Every key is a PEM file named '<kid>.pem' in one directory: private keys can sign and verify,
+# public keys only verify. The key id (kid) goes into the token header, so verifiers pick the
+# right public key and old keys keep verifying while their tokens are still valid.
+import base64
+import os
+import threading
+import time
+
+
+# JWK names of the elliptic curves of the ES* algorithms.
+CURVES = {"secp256r1": "P-256", "secp384r1": "P-384", "secp521r1": "P-521"}
+
+
+def b64_uint(value, length=None):
+    """Unsigned integer -> base64url without padding, as JWKs encode key parameters."""
+    data = value.to_bytes(length or max(1, (value.bit_length() + 7) // 8), "big")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class Key:
+    """A parsed key of the ring; 'created_at' is the modification time of its file."""
+
+    def __init__(self, kid, public_key, private_key=None, created_at=0.0):
+        self.kid = kid
+        self.public_key = public_key
+        self.private_key = private_key
+        self.created_at = created_at
+
+    def jwk(self, algorithm):
+        numbers = self.public_key.public_numbers()
+        if hasattr(numbers, "n"):
+            jwk = {"kty": "RSA", "n": b64_uint(numbers.n), "e": b64_uint(numbers.e)}
+        else:
+            size = (self.public_key.curve.key_size + 7) // 8
+            jwk = {"kty": "EC", "crv": CURVES[self.public_key.curve.name],
+                   "x": b64_uint(numbers.x, size), "y": b64_uint(numbers.y, size)}
+        jwk.update(kid=self.kid, alg=algorithm, use="sig")
+        return jwk
+
+
+class KeyRing:
+    """
+    The signing and verification keys of the application (requires the 'cryptography' package).
+
+    The directory is scanned again at most every 'reload_interval' seconds, so keys can be
+    added and removed without a restart; files that did not change are not parsed again.
+    Rotation overlaps on both ends:
+      - a new private key is published (JWKS) 'activation_delay' seconds before it signs,
+        so other services have fetched it by the time they see its tokens,
+      - the previous key keeps verifying until its file is removed, which should happen
+        once the longest-lived token it signed (a refresh token) has expired.
+    'active_kid' pins the signing key instead.
+    """
+
+    def __init__(self, path, algorithm, active_kid=None, activation_delay=0, reload_interval=60):
+        try:
+            from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+        except ImportError:
+            raise RuntimeError("The 'cryptography' package is required for JWT_KEYS_DIR.")
+        self._load_private = load_pem_private_key
+        self._load_public = load_pem_public_key
+        self.path = path
+        self.algorithm = algorithm
+        self.active_kid = active_kid
+        self.activation_delay = activation_delay
+        self.reload_interval = reload_interval
+        self._keys = {}
+        # File name -> (modification time, parsed key), to skip parsing unchanged files.
+        self._parsed = {}
+        self._loaded_at = float("-inf")
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _parse(self, kid, data, created_at):
+        if b"PRIVATE KEY" in data:
+            private_key = self._load_private(data, password=None)
+            return Key(kid, private_key.public_key(), private_key, created_at)
+        return Key(kid, self._load_public(data), created_at=created_at)
+
+    def reload(self):
+        parsed = {}
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".pem"):
+                continue
+            filename = os.path.join(self.path, name)
+            mtime = os.stat(filename).st_mtime
+            cached = self._parsed.get(name)
+            if cached is None or cached[0] != mtime:
+                with open(filename, "rb") as f:
+                    cached = (mtime, self._parse(name[:-len(".pem")], f.read(), mtime))
+            parsed[name] = cached
+        with self._lock:
+            self._parsed = parsed
+            self._keys = {key.kid: key for _, key in parsed.values()}
+            self._loaded_at = time.monotonic()
+
+    def _maybe_reload(self, interval=None):
+        if time.monotonic() - self._loaded_at >= (self.reload_interval if interval is None else interval):
+            self.reload()
+
+    def signing_key(self):
+        """The key new tokens are signed with."""
+        self._maybe_reload()
+        keys = self._keys
+        if self.active_kid:
+            key = keys.get(self.active_kid)
+            if key is None or key.private_key is None:
+                raise RuntimeError(f"No private key '{self.active_kid}.pem' in {self.path}.")
+            return key
+        private_keys = sorted((key for key in keys.values() if key.private_key is not None), key=lambda key: key.created_at)
+        if not private_keys:
+            raise RuntimeError(f"No private key in {self.path}.")
+        now = time.time()
+        active = [key for key in private_keys if now - key.created_at >= self.activation_delay]
+        # A fresh key ring has no key past the delay yet; its newest key is used right away.
+        return (active or private_keys)[-1]
+
+    def verification_key(self, kid):
+        """The parsed public key of 'kid', or None if the ring has no such key."""
+        self._maybe_reload()
+        key = self._keys.get(kid)
+        if key is None and kid:
+            # The key may have been added since the last scan (e.g. by another instance); look at most once per second.
+            self._maybe_reload(interval=1)
+            key = self._keys.get(kid)
+        return key.public_key if key is not None else None
+
+    def jwks(self):
+        """The public keys as a JSON Web Key Set, oldest first."""
+        self._maybe_reload()
+        keys = sorted(self._keys.values(), key=lambda key: key.created_at)
+        return {"keys": [key.jwk(self.algorithm) for key in keys]}
+
+
+def generate_private_key(algorithm):
+    """A new private key in PEM format for 'algorithm' (RSA for RS*/PS*, the matching curve for ES*)."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+    if algorithm.startswith("ES"):
+        curve = {"ES256": ec.SECP256R1, "ES384": ec.SECP384R1, "ES512": ec.SECP521R1}[algorithm]
+        key = ec.generate_private_key(curve())
+    elif algorithm.startswith(("RS", "PS")):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        raise ValueError(f"Unsupported algorithm for a key ring: {algorithm}")
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
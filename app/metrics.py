@@ -0,0 +1,282 @@
+# Request instrumentation: per-endpoint latency histograms, SQL query count and time per request
+# and serialization time, exported in the Prometheus text format on '/metrics'.
+# Slow requests can optionally be profiled by sampling the stacks of the thread serving them.
+import ipaddress
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, request
+from flask.json import JSONEncoder
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Upper bounds of the histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, like a Prometheus histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yields (le, cumulative count) for every bucket and '+Inf'."""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield repr(float(bound)), total
+        yield "+Inf", self.count
+
+
+class RequestMetrics:
+    """What happened during one request: SQL statements and the time spent per phase."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.phases = Counter()
+
+
+def current_request_metrics():
+    """The metrics of the request being served, or None (CLI commands, disabled metrics)."""
+    return g.get("request_metrics") if has_app_context() else None
+
+
+@contextmanager
+def timed(phase):
+    """Adds the time spent in the block to 'phase' of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = current_request_metrics()
+        if metrics is not None:
+            metrics.phases[phase] += time.perf_counter() - started
+
+
+# The listeners are registered once for every engine (primary and replicas) and only record
+# anything while a request with metrics is being served.
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    metrics = current_request_metrics()
+    if metrics is not None:
+        metrics.queries += 1
+        metrics.phases["sql"] += time.perf_counter() - started
+
+
+class TimedJSONEncoder(JSONEncoder):
+    """Flask's JSON encoder, adding the time spent encoding responses to the 'serialization' phase."""
+
+    def encode(self, o):
+        with timed("serialization"):
+            return JSONEncoder.encode(self, o)
+
+
+def stack_of(frame):
+    """The stack of 'frame' in the folded format of flame graph tools: 'outer;...;inner'."""
+    names = []
+    while frame is not None:
+        names.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Samples the stacks of the threads serving requests every 'interval' seconds.
+    The samples of a request are kept until it ends; the ones of slow requests are written to 'directory'.
+    """
+
+    def __init__(self, interval, directory):
+        threading.Thread.__init__(self, name="request-profiler", daemon=True)
+        self.interval = interval
+        self.directory = directory
+        self.dumps = 0
+        self._requests = {}
+        self._lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def begin(self):
+        with self._lock:
+            self._requests[threading.get_ident()] = Counter()
+
+    def end(self):
+        with self._lock:
+            return self._requests.pop(threading.get_ident(), Counter())
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._requests.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[stack_of(frame)] += 1
+
+    def dump(self, samples, endpoint, duration):
+        """Writes the samples of a slow request, one 'stack count' line per stack (ready for flamegraph.pl)."""
+        os.makedirs(self.directory, exist_ok=True)
+        filename = os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{endpoint}-{int(duration * 1000)}ms.folded")
+        with open(filename, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.dumps += 1
+        return filename
+
+    def stop(self):
+        self.stopped.set()
+
+
+class Metrics:
+    """The histograms of the application, keyed by endpoint (and method and status for the latency)."""
+
+    def __init__(self, slow_request_seconds=0.0, profiler=None):
+        self.slow_request_seconds = slow_request_seconds
+        self.profiler = profiler
+        self.latency = {}
+        self.queries = {}
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, histograms, key, buckets, value):
+        with self._lock:
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def before_request(self):
+        g.request_metrics = RequestMetrics()
+        if self.profiler is not None:
+            self.profiler.begin()
+
+    def after_request(self, response):
+        metrics = g.pop("request_metrics", None)
+        if metrics is None:
+            return response
+        duration = time.perf_counter() - metrics.started
+        endpoint = request.endpoint or "unmatched"
+        self._observe(self.latency, (endpoint, request.method, str(response.status_code)), LATENCY_BUCKETS, duration)
+        self._observe(self.queries, (endpoint,), QUERY_COUNT_BUCKETS, metrics.queries)
+        for phase, seconds in metrics.phases.items():
+            self._observe(self.phases, (endpoint, phase), LATENCY_BUCKETS, seconds)
+        if self.profiler is not None:
+            samples = self.profiler.end()
+            if samples and duration >= self.slow_request_seconds:
+                filename = self.profiler.dump(samples, endpoint, duration)
+                current_app.logger.warning("Slow request %s %s (%.0f ms), profile written to %s.",
+                                           request.method, request.path, duration * 1000, filename)
+        return response
+
+
+def format_labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def histogram_lines(name, help, label_names, histograms):
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} histogram"
+    for key, histogram in sorted(histograms.items()):
+        for le, count in histogram.samples():
+            yield f"{name}_bucket{format_labels(label_names, key, le=le)} {count}"
+        yield f"{name}_sum{format_labels(label_names, key)} {histogram.sum}"
+        yield f"{name}_count{format_labels(label_names, key)} {histogram.count}"
+
+
+def value_lines(name, help, kind, value):
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} {kind}"
+    yield f"{name} {value}"
+
+
+def render(app):
+    """All metrics of the application in the Prometheus text format."""
+    metrics = app.extensions["metrics"]
+    with metrics._lock:
+        lines = list(histogram_lines("http_request_duration_seconds", "Time to produce the response.",
+                                     ("endpoint", "method", "status"), metrics.latency))
+        lines += histogram_lines("http_request_sql_queries", "SQL statements executed per request.",
+                                 ("endpoint",), metrics.queries)
+        lines += histogram_lines("http_request_phase_seconds", "Time per request spent in SQL, serialization and token checks.",
+                                 ("endpoint", "phase"), metrics.phases)
+    cache = app.extensions.get("response_cache")
+    if cache is not None:
+        stats = cache.stats()
+        lines += value_lines("response_cache_hits_total", "Responses served from the cache.", "counter", stats["hits"])
+        lines += value_lines("response_cache_misses_total", "Cacheable responses not found in the cache.", "counter", stats["misses"])
+        lines += value_lines("response_cache_evictions_total", "Entries evicted to stay within the size limit.", "counter", stats["evictions"])
+    store = app.extensions["revocation_store"]
+    lines += value_lines("revocation_cache_entries", "Cached revocation answers.", "gauge", len(store.cache))
+    lines += value_lines("revocation_generation_entries", "Cached token generations of users.", "gauge", len(store.generations))
+    prune = app.extensions["blocklist_stats"]
+    # Counted by the pruning runs of this process, not on every scrape.
+    if prune.rows is not None:
+        lines += value_lines("blocklist_rows", "Rows of the token blocklist after the last pruning run.", "gauge", prune.rows)
+    lines += value_lines("blocklist_prune_runs_total", "Runs of the token blocklist pruning.", "counter", prune.runs)
+    lines += value_lines("blocklist_pruned_rows_total", "Expired rows deleted from the token blocklist.", "counter", prune.deleted_total)
+    lines += value_lines("blocklist_prune_rows_per_second", "Deletion rate of the last pruning run.", "gauge", prune.rows_per_second)
+    if metrics.profiler is not None:
+        lines += value_lines("slow_request_profiles_total", "Profiles written for slow requests.", "counter", metrics.profiler.dumps)
+    return "\n".join(lines) + "\n"
+
+
+def is_allowed(address, networks):
+    """Whether the client 'address' is in one of 'networks' (e.g. '10.0.0.0/8')."""
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def metrics_view():
+    # Imported here because app.errors imports this module (through app.serialization).
+    from app.errors import error_response
+
+    # Only the scrapers' addresses (METRICS_ALLOWED_NETWORKS) see the metrics; the others get a 404.
+    if not is_allowed(request.remote_addr, current_app.config["METRICS_ALLOWED_NETWORKS"]):
+        return error_response(404)
+    return current_app.response_class(render(current_app), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    """Registers the instrumentation and the '/metrics' endpoint (METRICS_ENABLED)."""
+    profiler = None
+    if app.config["PROFILE_SLOW_REQUEST_MS"] > 0:
+        profiler = SamplingProfiler(app.config["PROFILE_SAMPLE_INTERVAL_MS"] / 1000, app.config["PROFILE_DIR"])
+        profiler.start()
+    metrics = app.extensions["metrics"] = Metrics(app.config["PROFILE_SLOW_REQUEST_MS"] / 1000, profiler)
+    app.json_encoder = TimedJSONEncoder
+
+    @app.before_request
+    def start_request_metrics():
+        # '/metrics' itself is not measured.
+        if request.endpoint != "metrics":
+            metrics.before_request()
+
+    app.after_request(metrics.after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,142 @@
+# Query budgets: count and time the SQL statements of a block of code or of an endpoint,
+# and complain when there are too many, when they take too long or when the same statement
+# runs several times (the usual sign of a query per row, "N+1").
+import logging
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from flask import current_app, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+# The budgets open in the current thread; every statement is recorded by all of them.
+_local = threading.local()
+
+
+def open_budgets():
+    if not hasattr(_local, "budgets"):
+        _local.budgets = []
+    return _local.budgets
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("budget_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["budget_started"].pop()
+    for budget in open_budgets():
+        budget.statements.append((statement, seconds))
+    # Slow statements are logged wherever they come from (SLOW_QUERY_MS, 0 disables it).
+    if has_app_context():
+        threshold = current_app.config.get("SLOW_QUERY_MS") or 0
+        if threshold and seconds * 1000 >= threshold:
+            logger.warning("Slow query (%.1f ms): %s", seconds * 1000, statement)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a budget is exceeded in 'raise' mode (an AssertionError, so tests fail with the report)."""
+
+
+class QueryBudget:
+    """
+    Context manager recording the statements executed inside it:
+
+        with QueryBudget(max_queries=2):
+            client.get("/api/ships")
+
+    On exit the budget is checked: more than 'max_queries' statements, more than 'max_seconds'
+    in total or a repeated statement (unless 'allow_duplicates') raise QueryBudgetExceeded
+    ('mode="raise"') or log a warning ('mode="warn"'). Statements slower than 'slow_seconds'
+    are listed in the report.
+    """
+
+    def __init__(self, max_queries=None, max_seconds=None, allow_duplicates=False, slow_seconds=None,
+                 mode="raise", name="block"):
+        self.max_queries = max_queries
+        self.max_seconds = max_seconds
+        self.allow_duplicates = allow_duplicates
+        self.slow_seconds = slow_seconds
+        self.mode = mode
+        self.name = name
+        self.statements = []
+
+    def __enter__(self):
+        open_budgets().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        open_budgets().remove(self)
+        # An exception of the block itself is more interesting than the budget.
+        if exc_type is None:
+            self.check()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def seconds(self):
+        return sum(seconds for _, seconds in self.statements)
+
+    def duplicates(self):
+        """The statements executed more than once, with their count, most frequent first."""
+        counts = Counter(statement for statement, _ in self.statements)
+        return [(statement, count) for statement, count in counts.most_common() if count > 1]
+
+    def slow_statements(self):
+        if not self.slow_seconds:
+            return []
+        return [(statement, seconds) for statement, seconds in self.statements if seconds >= self.slow_seconds]
+
+    def problems(self):
+        problems = []
+        if self.max_queries is not None and self.count > self.max_queries:
+            problems.append(f"{self.count} queries, the budget is {self.max_queries}")
+        if self.max_seconds is not None and self.seconds > self.max_seconds:
+            problems.append(f"{self.seconds * 1000:.1f} ms in queries, the budget is {self.max_seconds * 1000:.1f} ms")
+        if not self.allow_duplicates and self.duplicates():
+            problems.append(f"{len(self.duplicates())} statements executed more than once")
+        if self.slow_statements():
+            problems.append(f"{len(self.slow_statements())} slow statements")
+        return problems
+
+    def report(self):
+        lines = [f"Query budget of {self.name} exceeded: " + "; ".join(self.problems()) + "."]
+        for statement, count in self.duplicates():
+            lines.append(f"  {count}x {statement}")
+        for statement, seconds in self.slow_statements():
+            lines.append(f"  {seconds * 1000:.1f} ms {statement}")
+        return "\n".join(lines)
+
+    def check(self):
+        if not self.problems() or self.mode == "off":
+            return
+        if self.mode == "raise":
+            raise QueryBudgetExceeded(self.report())
+        logger.warning(self.report())
+
+
+def query_budget(max_queries=None, max_seconds=None, allow_duplicates=False):
+    """
+    Decorator putting an endpoint on a query budget. QUERY_BUDGET_MODE decides what happens
+    when it is exceeded: 'off' (not even counted), 'warn' (logged) or 'raise' (used by the tests).
+    Statements of streamed responses run after the view has returned and are not counted.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            mode = current_app.config["QUERY_BUDGET_MODE"]
+            if mode == "off":
+                return view(*args, **kwargs)
+            slow_seconds = (current_app.config["SLOW_QUERY_MS"] or 0) / 1000
+            with QueryBudget(max_queries, max_seconds, allow_duplicates, slow_seconds, mode, name=request.endpoint):
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,119 @@
+# Token bucket rate limiting for the login endpoint.
+# A bucket holds up to 'capacity' tokens and regains 'rate' tokens per second;
+# an attempt is allowed while there is a token to take.
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryRateLimitStore:
+    """Buckets of this worker; the least recently used ones are dropped above 'max_keys'."""
+
+    shared = False
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, capacity, rate, cost=1):
+        """
+        Takes 'cost' tokens (0 only checks). Returns 0 if allowed,
+        otherwise the seconds until a token is available again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens < max(cost, 1):
+                self._buckets[key] = (tokens, now)
+                return (max(cost, 1) - tokens) / rate
+            self._buckets[key] = (tokens - cost, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+# The same token bucket as a Redis script, so that it is updated atomically by every worker.
+REDIS_TOKEN_BUCKET = """
+local capacity, rate, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+local needed = math.max(cost, 1)
+local retry_after = 0
+if tokens < needed then
+    retry_after = (needed - tokens) / rate
+else
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisRateLimitStore:
+    """Buckets shared by all workers (requires the 'redis' package)."""
+
+    shared = True
+
+    def __init__(self, url, prefix="ratelimit:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The 'redis' package is required for a redis:// rate limit store.")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(REDIS_TOKEN_BUCKET)
+
+    def hit(self, key, capacity, rate, cost=1):
+        return float(self._script(keys=[self.prefix + key], args=[capacity, rate, cost, time.time()]))
+
+    def reset(self, key):
+        self._client.delete(self.prefix + key)
+
+
+def create_store(url):
+    """Creates a rate limit store from a URL ('memory://' or 'redis://...')."""
+    if not url or url.startswith("memory://"):
+        return MemoryRateLimitStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRateLimitStore(url)
+    raise ValueError(f"Unsupported rate limit store: {url}")
+
+
+class LoginLimiter:
+    """
+    Two limits for '/auth/login', both checked before any database query or password hash:
+      - every attempt from a client IP takes a token of the IP's bucket,
+      - every attempt for a username from a client IP takes a token of their bucket, and a
+        successful login refills it. The token is taken before the password is checked, so that
+        concurrent attempts cannot all get through; only failed attempts keep it. The bucket is not
+        the username's alone: guessing from one IP cannot lock the user out of the others.
+    """
+
+    def __init__(self, store, ip_capacity=20, ip_rate=20 / 60, user_capacity=5, user_rate=5 / 300):
+        self.store = store
+        self.ip_capacity = ip_capacity
+        self.ip_rate = ip_rate
+        self.user_capacity = user_capacity
+        self.user_rate = user_rate
+
+    def check(self, ip, username):
+        """Returns the seconds the client has to wait, or 0 if the attempt may proceed."""
+        retry_after = self.store.hit(f"ip:{ip}", self.ip_capacity, self.ip_rate)
+        if retry_after:
+            return math.ceil(retry_after)
+        return math.ceil(self.store.hit(f"user:{username}:{ip}", self.user_capacity, self.user_rate))
+
+    def succeeded(self, ip, username):
+        """Gives back the token of a successful attempt, and those of the failed ones before it."""
+        self.store.reset(f"user:{username}:{ip}")
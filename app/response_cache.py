@@ -0,0 +1,225 @@
+# Server-side cache of serialized GET responses.
+# Entries are invalidated by the write endpoints through generation counters:
+# every key contains the current generation of its collection or item, so bumping
+# a generation makes the old entries unreachable (they age out of the LRU).
+# The counters of the in-process backend only see the writes of their own worker, so its keys
+# also contain the version of the table in the database, which every write increments.
+# Compressed variants are stored next to the plain entry, so a hot collection is compressed once.
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, request
+from app import compression
+from app.http_cache import table_version
+
+
+def encode_entry(response):
+    """Serializes a response into bytes: a JSON header line followed by the body."""
+    headers = [(name, value) for name, value in response.headers.items() if name != "Content-Length"]
+    head = json.dumps({"status": response.status_code, "headers": headers})
+    return head.encode("utf-8") + b"\n" + response.get_data()
+
+
+def decode_entry(data):
+    head, body = data.split(b"\n", 1)
+    entry = json.loads(head.decode("utf-8"))
+    return entry["status"], entry["headers"], body
+
+
+class LocalCacheBackend:
+    """
+    In-process backend: an LRU bounded by the total size of the stored values.
+    It is not 'shared' with the other workers (the tests make one 'shared' to stand in for Redis).
+    """
+
+    def __init__(self, max_bytes, shared=False):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Generation counters are kept apart from the entries, so they are never evicted.
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Backend shared by all workers (requires the 'redis' package); Redis does the LRU eviction."""
+
+    shared = True
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The 'redis' package is required for a redis:// response cache.")
+        self._client = redis.Redis.from_url(url)
+        self.evictions = 0
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=max(1, int(ttl)))
+
+    def counter(self, key):
+        return int(self._client.get(key) or 0)
+
+    def incr(self, key):
+        self._client.incr(key)
+
+
+def create_backend(url, max_bytes):
+    """Creates a cache backend from a URL ('memory://' or 'redis://...')."""
+    if not url or url.startswith("memory://"):
+        return LocalCacheBackend(max_bytes)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url)
+    raise ValueError(f"Unsupported response cache backend: {url}")
+
+
+class ResponseCache:
+    """Stores serialized GET responses keyed by route and query arguments."""
+
+    def __init__(self, backend, ttl=60):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.backend.evictions}
+
+    def generation(self, counter, namespace):
+        """The generation of a key; with an in-process backend, it includes the version of the table 'namespace'."""
+        generation = self.backend.counter(counter)
+        if not self.backend.shared:
+            # The writes of the other workers only reach this one through the database.
+            return f"{generation}.{table_version(namespace)}"
+        return generation
+
+    def collection_key(self, namespace):
+        # Collections depend on the query arguments and on Accept (JSON or NDJSON).
+        # The arguments are encoded again, so that an '&' or '=' inside a value cannot pass for another argument.
+        args = urlencode(sorted(request.args.items(multi=True)))
+        generation = self.generation(f"{namespace}:gen", namespace)
+        return f"{namespace}:list:{generation}:{request.path}?{args}|{request.headers.get('Accept', '')}"
+
+    def item_key(self, namespace, item_id):
+        generation = self.generation(f"{namespace}:{item_id}:gen", namespace)
+        return f"{namespace}:item:{item_id}:{generation}"
+
+    def invalidate(self, namespace, *item_ids):
+        """Called by the write endpoints: drops every cached collection and the given items."""
+        self.backend.incr(f"{namespace}:gen")
+        for item_id in item_ids:
+            self.backend.incr(f"{namespace}:{item_id}:gen")
+
+    def lookup(self, key, encoding=None):
+        """The cached response, compressed with 'encoding' if that variant is stored."""
+        data = self.backend.get(variant_key(key, encoding)) if encoding else None
+        if data is None:
+            data = self.backend.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        status, headers, body = decode_entry(data)
+        response = current_app.response_class(body, status=status, headers=headers)
+        # A cached ETag still allows answering 304 without touching the database.
+        if request.if_none_match and request.if_none_match.contains(response.get_etag()[0] or ""):
+            response = current_app.response_class(status=304, headers=[
+                (name, value) for name, value in headers if name in ("ETag", "Cache-Control", "Vary")
+            ])
+        return response
+
+    def store(self, key, response):
+        # Only complete, successful responses are cached (not errors, 304s or streams).
+        if response.status_code == 200 and not response.is_streamed:
+            self.backend.set(key, encode_entry(response), self.ttl)
+
+
+def variant_key(key, encoding):
+    return f"{key}|{encoding}"
+
+
+def invalidate(namespace, *item_ids):
+    """Invalidates the cached responses of a namespace (e.g. 'ships') after a write."""
+    cache = current_app.extensions.get("response_cache")
+    if cache is not None:
+        cache.invalidate(namespace, *item_ids)
+
+
+def cached(namespace, item=None):
+    """
+    Decorator for GET endpoints. 'item' names the URL argument holding the item id
+    (e.g. 'id' for /ships/<int:id>); without it the endpoint is a collection.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get("response_cache")
+            # Item responses do not depend on query arguments; requests with arguments are not cached.
+            if cache is None or (item is not None and request.args):
+                return view(*args, **kwargs)
+            key = cache.item_key(namespace, kwargs[item]) if item is not None else cache.collection_key(namespace)
+            encoding = compression.negotiate()
+            response = cache.lookup(key, encoding)
+            if response is not None:
+                # A plain entry served to a client accepting 'encoding': compress it once for the next ones.
+                if "Content-Encoding" not in response.headers and compression.compress(response, encoding):
+                    cache.store(variant_key(key, encoding), response)
+                response.headers["X-Cache"] = "HIT"
+                return response
+            # The key was computed before running the view: if a write happens meanwhile,
+            # the response is stored under the old generation and never served.
+            response = current_app.make_response(view(*args, **kwargs))
+            cache.store(key, response)
+            if compression.compress(response, encoding):
+                cache.store(variant_key(key, encoding), response)
+            response.headers["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
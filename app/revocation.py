@@ -0,0 +1,323 @@
+# In-process store of revoked JWT identifiers (jti) and of the current token generation of each user.
+# It sits in front of the 'token_blocklist' and 'users' tables so that most protected requests
+# can be answered without a database round-trip (with a backend shared by the workers, see 'RevocationStore').
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A small thread-safe LRU cache with a per-entry time-to-live.
+    The oldest entries are dropped when 'max_size' is reached.
+    """
+
+    def __init__(self, max_size=10000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            # Expired entries behave as if they were never stored.
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            # Mark the entry as the most recently used one.
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            # Evict the least recently used entries above the size limit.
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class BloomFilter:
+    """
+    A probabilistic set: 'in' may give false positives but never false negatives,
+    so a negative answer means "definitely not revoked".
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        # Standard sizing formulas for the bit array and the number of hash functions.
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: derive all positions from two halves of one digest.
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class MemoryRevocationBackend:
+    """
+    An event log in memory, seen by the stores attached to the same instance only. 'memory://' creates
+    one per application, which no other process sees: it is not 'shared', and the stores attached to
+    it only remember revocations (the tests attach several stores to a 'shared' one, standing in for
+    workers attached to the same Redis server). The oldest events are dropped above 'max_events'.
+    """
+
+    def __init__(self, shared=False, max_events=10000):
+        self.shared = shared
+        self.max_events = max_events
+        self._events = []
+        # Number of events dropped from the start of the log: cursors count every event ever published.
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        with self._lock:
+            self._events.append(event)
+            excess = len(self._events) - self.max_events
+            if excess > 0:
+                del self._events[:excess]
+                self._offset += excess
+
+    def position(self):
+        """The cursor after the last event published."""
+        with self._lock:
+            return self._offset + len(self._events)
+
+    def read(self, cursor):
+        """Returns the new cursor, the events published after 'cursor', and False if some of them were dropped."""
+        with self._lock:
+            start = cursor - self._offset
+            return self._offset + len(self._events), self._events[max(start, 0):], start >= 0
+
+
+# Appends an event and drops the oldest ones above the size of the log (KEYS: log, offset; ARGV: event, size).
+REDIS_PUBLISH = """
+local length = redis.call('RPUSH', KEYS[1], ARGV[1])
+local excess = length - tonumber(ARGV[2])
+if excess > 0 then
+    redis.call('LTRIM', KEYS[1], excess, -1)
+    redis.call('INCRBY', KEYS[2], excess)
+end
+"""
+
+# Returns the offset of the log, the index of the cursor in it (negative if events were dropped) and the events after it.
+REDIS_READ = """
+local offset = tonumber(redis.call('GET', KEYS[2]) or '0')
+local start = tonumber(ARGV[1]) - offset
+return {offset, start, redis.call('LRANGE', KEYS[1], math.max(start, 0), -1)}
+"""
+
+
+class RedisRevocationBackend:
+    """
+    Shared backend storing the event log in a Redis list (requires the 'redis' package).
+    The list keeps the last 'max_events' events; '<key>:offset' counts the ones dropped before them.
+    """
+
+    shared = True
+
+    def __init__(self, url, key="revoked_tokens", max_events=10000):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The 'redis' package is required for a redis:// revocation backend.")
+        self.key = key
+        self.max_events = max_events
+        self._client = redis.Redis.from_url(url)
+        self._publish = self._client.register_script(REDIS_PUBLISH)
+        self._read = self._client.register_script(REDIS_READ)
+
+    def publish(self, event):
+        self._publish(keys=[self.key, f"{self.key}:offset"], args=[json.dumps(event), self.max_events])
+
+    def position(self):
+        offset, length = self._client.pipeline().get(f"{self.key}:offset").llen(self.key).execute()
+        return int(offset or 0) + length
+
+    def read(self, cursor):
+        offset, start, events = self._read(keys=[self.key, f"{self.key}:offset"], args=[cursor])
+        return offset + max(start, 0) + len(events), [json.loads(event) for event in events], start >= 0
+
+
+# The generation cached for a user that no longer exists: every token of the user is revoked.
+USER_DELETED = -1
+
+
+def create_backend(url, max_events=10000):
+    """Creates a revocation backend from a URL ('memory://' or 'redis://...')."""
+    if not url or url.startswith("memory://"):
+        return MemoryRevocationBackend(max_events=max_events)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRevocationBackend(url, max_events=max_events)
+    raise ValueError(f"Unsupported revocation backend: {url}")
+
+
+class RevocationStore:
+    """
+    Answers "is this jti revoked?" with as few database queries as possible.
+
+    Lookup order:
+      1. events from the shared backend are applied (revocations made by other workers),
+      2. the LRU cache of recent answers is checked,
+      3. the Bloom filter (if enabled) answers "definitely not revoked",
+      4. only then the 'loader' callback (the database query) is called.
+
+    "Not revoked" is only answered from memory with a shared backend, which tells every worker about
+    every revocation. Without one (memory://), a token revoked by another process would be accepted
+    until its answer expired: only revocations are cached, and the other tokens are looked up.
+
+    Besides single tokens, all tokens of a user can be revoked at once: tokens carry the
+    user's token generation, and tokens of an older generation than the current one are revoked.
+    Generations are only cached with a shared backend too: a new generation made by another
+    process, or a new user given the id of a deleted one, would not reach the cache otherwise.
+    Without one, 'is_token_revoked' checks the jti and the generation of a token with one query.
+    """
+
+    def __init__(self, backend=None, max_size=10000, ttl=3600, bloom_capacity=0, bloom_error_rate=0.01,
+                 sync_interval=1.0):
+        self.backend = backend or MemoryRevocationBackend()
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+        # User id -> current token generation (USER_DELETED for deleted users).
+        self.generations = LRUCache(max_size=max_size, ttl=ttl)
+        # The Bloom filter only answers "not revoked", which needs a shared backend.
+        self.bloom_capacity = bloom_capacity if self.backend.shared else 0
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom = BloomFilter(self.bloom_capacity, bloom_error_rate) if self.bloom_capacity else None
+        self.sync_interval = sync_interval
+        # The Bloom filter can only answer negatively after it has been filled from the database.
+        self.warm = False
+        # The revocations published before the store was created are in the database: they are not replayed.
+        self._cursor = self.backend.position()
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+
+    def _add(self, jti):
+        if self.bloom is not None:
+            self.bloom.add(jti)
+        self.cache.set(jti, True)
+
+    def sync(self, force=False):
+        """Applies the events published to the shared backend since the last call."""
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        with self._lock:
+            self._last_sync = now
+            self._cursor, events, complete = self.backend.read(self._cursor)
+            if not complete:
+                # Events were dropped from the log before they were read: start over from the database.
+                self.reset()
+        for event in events:
+            if event.get("type") == "jti":
+                self._add(event["jti"])
+            elif event.get("type") == "generation":
+                self.generations.set(event["user_id"], event["generation"])
+
+    def reset(self):
+        """Forgets every cached answer; the Bloom filter is filled again on the next check."""
+        self.cache.clear()
+        self.generations.clear()
+        if self.bloom is not None:
+            self.bloom = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+        self.warm = False
+
+    def load(self, jtis):
+        """Fills the Bloom filter with all revoked identifiers (done once, on cold start)."""
+        if self.bloom is not None:
+            for jti in jtis:
+                self.bloom.add(jti)
+        self.warm = True
+
+    def revoke(self, jti):
+        """Marks a jti as revoked locally and announces it to the other workers."""
+        self._add(jti)
+        self.backend.publish({"type": "jti", "jti": jti})
+
+    def is_revoked(self, jti, loader, warmer=None):
+        """
+        Checks a jti. 'loader(jti)' queries the database and is only called when the
+        cache and the Bloom filter cannot answer; 'warmer()' returns every revoked jti
+        and is used to fill the Bloom filter on the first call.
+        """
+        self.sync()
+        cached = self.cache.get(jti)
+        if cached is not None:
+            return cached
+        if self.bloom is not None:
+            if not self.warm and warmer is not None:
+                with self._lock:
+                    if not self.warm:
+                        self.load(warmer())
+            if self.warm and jti not in self.bloom:
+                return False
+        # Filter positive or cold start: ask the database and remember the answer.
+        revoked = bool(loader(jti))
+        if revoked or self.backend.shared:
+            self.cache.set(jti, revoked)
+        return revoked
+
+    def revoke_user(self, user_id, generation):
+        """
+        Records the new token generation of a user (USER_DELETED once the user is deleted),
+        revoking the user's older tokens here and in the other workers.
+        """
+        self.generations.set(user_id, generation)
+        self.backend.publish({"type": "generation", "user_id": user_id, "generation": generation})
+
+    def is_generation_revoked(self, user_id, generation, loader):
+        """
+        Checks the generation a token was issued with. 'loader(user_id)' returns the current
+        generation from the database (None if the user does not exist) and is only called
+        when the generation of the user is not cached.
+        """
+        self.sync()
+        current = self.generations.get(user_id) if self.backend.shared else None
+        if current is None:
+            current = loader(user_id)
+            current = USER_DELETED if current is None else current
+            if self.backend.shared:
+                self.generations.set(user_id, current)
+        return current == USER_DELETED or generation < current
+
+    def is_token_revoked(self, jti, user_id, generation, loader):
+        """
+        Checks a jti and the generation of its token together, for a store whose backend is not shared
+        (neither answer can then come from memory, except for the revocations made here).
+        'loader(jti, user_id)' returns the current generation of the user (None if the user does not
+        exist) and whether the jti is in the blocklist, from a single database query.
+        """
+        self.sync()
+        if self.cache.get(jti):
+            return True
+        current, revoked = loader(jti, user_id)
+        if revoked:
+            self.cache.set(jti, True)
+        return revoked or current is None or generation < current
@@ -0,0 +1,141 @@
+# In-process inverted index of the ships for '/api/ships/search': prefix matching on the words of
+# 'model', 'manufacturer' and 'roles', filters and facet counts on 'affiliation', 'category' and 'ship_class'.
+# The index remembers the version of the 'ships' table it reflects (see TableVersion): the write
+# endpoints of this worker apply their change to it, a write of another worker makes it rebuild.
+import bisect
+import re
+import threading
+from collections import Counter
+from flask import current_app
+
+
+TEXT_FIELDS = ("model", "manufacturer", "roles")
+FACETS = ("affiliation", "category", "ship_class")
+WORD = re.compile(r"\w+")
+
+
+def words(value):
+    """The lowercase words of a value ('roles' is a list of strings)."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        value = " ".join(str(item) for item in value)
+    return WORD.findall(str(value).lower())
+
+
+class ShipIndex:
+    """Word -> ship ids postings, with a sorted word list for prefix lookups."""
+
+    def __init__(self):
+        # The version of the 'ships' table the index reflects; None until it is built.
+        self.version = None
+        self.rebuilds = 0
+        self._postings = {}
+        self._words = []
+        # Ship id -> (its words, its facet values).
+        self._ships = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry(ship):
+        return {word for field in TEXT_FIELDS for word in words(ship.get(field))}, tuple(ship.get(name) for name in FACETS)
+
+    def _add(self, ship):
+        ship_words, _ = self._ships[ship["id"]] = self._entry(ship)
+        for word in ship_words:
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = set()
+                bisect.insort(self._words, word)
+            postings.add(ship["id"])
+
+    def _remove(self, ship_id):
+        ship = self._ships.pop(ship_id, None)
+        if ship is not None:
+            for word in ship[0]:
+                self._postings[word].discard(ship_id)
+
+    def rebuild(self, ships, version):
+        """Replaces the content of the index with 'ships' (dicts), read at table 'version'."""
+        with self._lock:
+            self._postings, self._words, self._ships = {}, [], {}
+            for ship in ships:
+                ship_words, _ = self._ships[ship["id"]] = self._entry(ship)
+                # The word list is sorted once at the end instead of on every insertion.
+                for word in ship_words:
+                    self._postings.setdefault(word, set()).add(ship["id"])
+            self._words = sorted(self._postings)
+            self.version = version
+            self.rebuilds += 1
+
+    def refresh(self, version, loader):
+        """Rebuilds the index from 'loader()' unless it already reflects table 'version'."""
+        if self.version != version:
+            self.rebuild(loader(), version)
+
+    def apply(self, ships=(), deleted=()):
+        """
+        Applies one write of this worker (which bumped the table version once): 'ships' are the
+        new or updated ships, 'deleted' the ids of the deleted ones. If another worker wrote in the
+        meantime, the versions no longer match and the next search rebuilds the index anyway.
+        """
+        with self._lock:
+            if self.version is None:
+                return
+            for ship_id in deleted:
+                self._remove(ship_id)
+            for ship in ships:
+                self._remove(ship["id"])
+                self._add(ship)
+            self.version += 1
+
+    def invalidate(self):
+        with self._lock:
+            self.version = None
+
+    def _prefix_matches(self, prefix):
+        matches = set()
+        for word in self._words[bisect.bisect_left(self._words, prefix):]:
+            if not word.startswith(prefix):
+                break
+            matches |= self._postings[word]
+        return matches
+
+    def search(self, query="", filters=None):
+        """
+        Returns the ids (ascending) of the ships having, for every word of 'query', a word starting
+        with it, and matching the facet 'filters' (name -> value); and the facet counts of those ships.
+        """
+        filters = filters or {}
+        with self._lock:
+            ids = None
+            for term in words(query):
+                matches = self._prefix_matches(term)
+                ids = matches if ids is None else ids & matches
+                if not ids:
+                    break
+            if ids is None:
+                ids = set(self._ships)
+            for i, name in enumerate(FACETS):
+                if filters.get(name) is not None:
+                    ids = {ship_id for ship_id in ids if self._ships[ship_id][1][i] == filters[name]}
+            facets = {name: Counter() for name in FACETS}
+            for ship_id in ids:
+                for name, value in zip(FACETS, self._ships[ship_id][1]):
+                    if value is not None:
+                        facets[name][value] += 1
+        return sorted(ids), {name: dict(counts.most_common()) for name, counts in facets.items()}
+
+
+def update_index(ships=(), deleted=()):
+    """Called by the write endpoints after committing a change to one or a few ships."""
+    index = current_app.extensions.get("ship_index")
+    if index is not None:
+        index.apply(ships, deleted)
+
+
+def invalidate_index():
+    """Called after writes that are not worth applying one by one (bulk requests): the next search rebuilds."""
+    index = current_app.extensions.get("ship_index")
+    if index is not None:
+        index.invalidate()
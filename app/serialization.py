@@ -0,0 +1,154 @@
+# Fast JSON responses: a pluggable JSON library (orjson or ujson when installed, otherwise the
+# standard library) and a column-oriented serializer turning Core result rows directly into bytes.
+from flask import current_app, json as flask_json, jsonify as flask_jsonify
+from sqlalchemy import JSON, Text, select, type_coerce
+from app.metrics import timed
+
+
+class StdlibJSONBackend:
+    """Flask's JSON encoder (the standard library 'json' module)."""
+
+    name = "json"
+
+    def __init__(self):
+        # One encoder per 'sort_keys': flask.json.dumps would create one per call, which
+        # costs more than encoding the short values of the RowSerializer.
+        self._encoders = {
+            sort_keys: flask_json.JSONEncoder(sort_keys=sort_keys, separators=(",", ":"))
+            for sort_keys in (False, True)
+        }
+
+    def dumps(self, obj, sort_keys=False):
+        return self._encoders[sort_keys].encode(obj).encode("utf-8")
+
+
+class OrjsonBackend:
+    """'orjson' (written in Rust); dates, UUIDs and decimals are encoded as Flask does."""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._dumps = orjson.dumps
+        self._sort_keys = orjson.OPT_SORT_KEYS
+        # Dates are passed to Flask's encoder, which writes them as HTTP dates, not ISO 8601.
+        self._options = orjson.OPT_PASSTHROUGH_DATETIME
+        self._default = flask_json.JSONEncoder().default
+
+    def dumps(self, obj, sort_keys=False):
+        options = self._options | self._sort_keys if sort_keys else self._options
+        return self._dumps(obj, default=self._default, option=options)
+
+
+class UjsonBackend:
+    """'ujson' (written in C)."""
+
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self._dumps = ujson.dumps
+
+    def dumps(self, obj, sort_keys=False):
+        return self._dumps(obj, sort_keys=sort_keys, ensure_ascii=False, escape_forward_slashes=False).encode("utf-8")
+
+
+BACKENDS = {"orjson": OrjsonBackend, "ujson": UjsonBackend, "json": StdlibJSONBackend}
+
+
+def create_backend(name="auto"):
+    """Creates the JSON backend 'name'; 'auto' picks the fastest one installed."""
+    if name == "auto":
+        for backend in BACKENDS.values():
+            try:
+                return backend()
+            except ImportError:
+                continue
+    if name not in BACKENDS:
+        raise ValueError(f"Unsupported JSON library: {name}")
+    try:
+        return BACKENDS[name]()
+    except ImportError:
+        raise RuntimeError(f"The '{name}' package is not installed.")
+
+
+def get_backend():
+    return current_app.extensions.get("json_backend") or StdlibJSONBackend()
+
+
+def json_response(body, status=200):
+    """A response with an already encoded JSON body."""
+    return current_app.response_class(body + b"\n", status=status, mimetype=current_app.config["JSONIFY_MIMETYPE"])
+
+
+def jsonify(*args, **kwargs):
+    """Like flask.jsonify, but encoded with the configured JSON library."""
+    # Pretty printing (debug mode) is left to Flask.
+    if current_app.config["JSONIFY_PRETTYPRINT_REGULAR"] or current_app.debug:
+        return flask_jsonify(*args, **kwargs)
+    if args and kwargs:
+        raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+    data = args[0] if len(args) == 1 else args or kwargs
+    with timed("serialization"):
+        body = get_backend().dumps(data, sort_keys=current_app.config["JSON_SORT_KEYS"])
+    return json_response(body)
+
+
+class RowSerializer:
+    """
+    Encodes the rows of a Core SELECT as JSON objects, column by column:
+      - the '"name":' prefix of every column is encoded once,
+      - every distinct value of a column is encoded once per call (values like manufacturers
+        repeat constantly, so most of them cost a dictionary lookup),
+      - JSON columns are selected as the text stored in the database and copied as-is,
+        instead of being parsed by SQLAlchemy and encoded again.
+    No ORM objects and no dicts are created.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._raw = [isinstance(column.type, JSON) for column in self.columns]
+        self._prefixes = [f'{"{" if i == 0 else ","}"{column.name}":'.encode("utf-8") for i, column in enumerate(self.columns)]
+
+    def select(self):
+        """The SELECT of the columns, JSON columns as text; the rows keep the column names."""
+        return select(*[
+            type_coerce(column, Text).label(column.name) if raw else column
+            for column, raw in zip(self.columns, self._raw)
+        ])
+
+    def _encode_columns(self, rows):
+        """Returns, per row, the encoded '"name":value' parts."""
+        dumps = get_backend().dumps
+        encoded = []
+        for prefix, raw, column, values in zip(self._prefixes, self._raw, self.columns, zip(*rows)):
+            if raw:
+                encoded.append([prefix + (value.encode("utf-8") if value is not None else b"null") for value in values])
+            elif column.primary_key:
+                # Unique values: nothing to gain from remembering them.
+                encoded.append([prefix + dumps(value) for value in values])
+            else:
+                seen = {}
+                parts = []
+                for value in values:
+                    part = seen.get(value)
+                    if part is None:
+                        part = seen[value] = prefix + dumps(value)
+                    parts.append(part)
+                encoded.append(parts)
+        return zip(*encoded)
+
+    def dumps(self, rows):
+        """The rows as a JSON array of objects."""
+        with timed("serialization"):
+            if not rows:
+                return b"[]"
+            return b"[" + b"},".join(b"".join(parts) for parts in self._encode_columns(rows)) + b"}]"
+
+    def dumps_one(self, row):
+        return self.dumps([row])[1:-1]
+
+    def lines(self, rows):
+        """The rows as NDJSON, one object per line."""
+        with timed("serialization"):
+            return b"".join(b"".join(parts) + b"}\n" for parts in self._encode_columns(rows))
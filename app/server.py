@@ -0,0 +1,291 @@
+# Multi-process production server ('flask serve' or 'python -m app.server').
+# The master process creates the application once and forks the workers, which share the code and
+# the loaded data copy-on-write; each worker serves the inherited listening socket with a pool of
+# threads. SIGHUP recycles the workers: they are replaced one at a time by new forks of the same
+# application (a new one is serving before an old one stops), which picks up no code or configuration
+# change; deploying those takes a restart. SIGTERM or SIGINT stop the workers after their requests in
+# flight, and the master logs the request rate of every worker from counters in shared memory.
+import gc
+import logging
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from app import init_stores
+from app.blocklist import BlocklistSweeper
+from app.metrics import SamplingProfiler
+from models import db
+
+
+logger = logging.getLogger(__name__)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """A werkzeug server handling the connections with a fixed number of threads."""
+
+    def __init__(self, threads, *args, **kwargs):
+        BaseWSGIServer.__init__(self, *args, **kwargs)
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix="request")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """No access log line per request (the master reports the request rates)."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class RequestCounter:
+    """WSGI middleware counting the requests of a worker in its slot of a shared array."""
+
+    def __init__(self, app, counts, slot):
+        self.app = app
+        self.counts = counts
+        self.slot = slot
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.counts[self.slot] += 1
+        return self.app(environ, start_response)
+
+
+def dispose_engines(app):
+    """Closes the pooled connections of the primary and the replicas: a connection must never be shared by two processes."""
+    with app.app_context():
+        for bind in [None] + list(app.config["SQLALCHEMY_BINDS"] or {}):
+            db.get_engine(app, bind=bind).dispose()
+
+
+def local_stores(app):
+    """
+    The settings of the stores each worker keeps to itself ('memory://'), which no other worker sees:
+    revocations are then looked up in the database, cached responses read the version of their table
+    on every request, and every worker enforces the login rate limits on its own.
+    """
+    stores = [("REVOCATION_BACKEND_URL", app.extensions["revocation_store"].backend),
+              ("RESPONSE_CACHE_URL", getattr(app.extensions.get("response_cache"), "backend", None)),
+              ("LOGIN_RATE_LIMIT_URL", getattr(app.extensions.get("login_limiter"), "store", None))]
+    return [name for name, store in stores if store is not None and not store.shared]
+
+
+def after_fork(app, slot=0):
+    """
+    Prepares the forked worker of 'slot': no connection of the master is reused, the in-memory stores
+    are created again, and the background threads, which do not survive a fork, are started again.
+    The blocklist sweeper only runs in the worker of the first slot: several would delete the same
+    rows at the same time.
+    """
+    dispose_engines(app)
+    init_stores(app)
+    sweeper = app.extensions.get("blocklist_sweeper")
+    if sweeper is not None and slot == 0:
+        app.extensions["blocklist_sweeper"] = BlocklistSweeper(app, sweeper.interval, sweeper.batch_size, sweeper.pause)
+        app.extensions["blocklist_sweeper"].start()
+    metrics = app.extensions.get("metrics")
+    if metrics is not None and metrics.profiler is not None:
+        metrics.profiler = SamplingProfiler(metrics.profiler.interval, metrics.profiler.directory)
+        metrics.profiler.start()
+
+
+class Arbiter:
+    """
+    The master process: preloads the application with 'factory', forks 'workers' workers serving
+    'host:port' with 'threads' threads each, and keeps them running until it is stopped.
+    """
+
+    def __init__(self, factory, host="127.0.0.1", port=5000, workers=2, threads=8, stats_interval=60.0,
+                 graceful_timeout=30.0, app=None):
+        self.factory = factory
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.slots = workers
+        self.stats_interval = stats_interval
+        self.graceful_timeout = graceful_timeout
+        self.app = app
+        # Worker pid -> slot; slots index the shared request counters.
+        self.workers = {}
+        # Workers asked to stop, pid -> deadline after which they are killed.
+        self.retiring = {}
+        self.recycle_requested = False
+        self.stopping = False
+
+    def preload(self):
+        # The application is loaded with the garbage collector off and its objects frozen before forking:
+        # a collection in a worker would otherwise write to (and so copy) every page holding them.
+        gc.disable()
+        if self.app is None:
+            self.app = self.factory()
+        local = local_stores(self.app)
+        if self.slots > 1 and local:
+            logger.warning("WARNING: each of the %d workers keeps its own store, which the others do not see, for "
+                           "the 'memory://' settings: %s. Set them to a shared 'redis://' URL.", self.slots, ", ".join(local))
+        # The master serves no request and prunes nothing: its sweeper is stopped (a worker starts one).
+        sweeper = self.app.extensions.get("blocklist_sweeper")
+        if sweeper is not None:
+            sweeper.stop()
+            sweeper.join()
+        dispose_engines(self.app)
+        gc.freeze()
+
+    def run(self):
+        self.preload()
+        self.socket = socket.create_server((self.host, self.port), backlog=2048)
+        self.socket.set_inheritable(True)
+        # Requests served per slot, incremented by the workers.
+        self.counts = multiprocessing.RawArray("Q", self.slots)
+        signal.signal(signal.SIGHUP, self.handle_recycle)
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        logger.info("Listening on %s:%d with %d workers of %d threads.", self.host, self.socket.getsockname()[1],
+                    self.slots, self.threads)
+        for slot in range(self.slots):
+            self.spawn(slot)
+        last_report, last_counts = time.monotonic(), list(self.counts)
+        try:
+            while not self.stopping:
+                time.sleep(0.2)
+                self.reap()
+                if self.recycle_requested:
+                    self.recycle()
+                if self.stats_interval and time.monotonic() - last_report >= self.stats_interval:
+                    last_report, last_counts = self.report(last_report, last_counts)
+        finally:
+            self.stop()
+
+    def handle_recycle(self, signum, frame):
+        self.recycle_requested = True
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def spawn(self, slot):
+        """Forks a worker for 'slot'; returns its pid and the pipe on which it reports being ready."""
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            code = 1
+            try:
+                self.run_worker(slot, ready_write)
+                code = 0
+            except Exception:
+                logger.exception("Worker %d failed.", os.getpid())
+            finally:
+                os._exit(code)
+        os.close(ready_write)
+        self.workers[pid] = slot
+        return pid, ready_read
+
+    def run_worker(self, slot, ready):
+        # Until the server runs, SIGTERM simply ends the worker (the master's handlers are inherited).
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Ctrl-C reaches the whole process group: the master decides when the workers stop.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        gc.enable()
+        after_fork(self.app, slot)
+        server = PooledWSGIServer(self.threads, self.host, self.port, RequestCounter(self.app, self.counts, slot),
+                                  handler=QuietRequestHandler, fd=self.socket.fileno())
+        # 'shutdown' waits for 'serve_forever' to return, so it cannot run in the signal handler's thread.
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        os.write(ready, b"1")
+        os.close(ready)
+        server.serve_forever()
+        # The requests in flight are finished before the worker exits.
+        server.pool.shutdown(wait=True)
+
+    def reap(self):
+        """Collects the exited workers; a worker that exited without being asked to is replaced."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                break
+            slot = self.workers.pop(pid, None)
+            if self.retiring.pop(pid, None) is None and slot is not None and not self.stopping:
+                logger.warning("Worker %d exited (status %d), starting a new one.", pid, status)
+                os.close(self.spawn(slot)[1])
+        # Workers still running after the graceful timeout are killed.
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                self.kill(pid, signal.SIGKILL)
+
+    def retire(self, pid):
+        self.retiring[pid] = time.monotonic() + self.graceful_timeout
+        self.kill(pid, signal.SIGTERM)
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def recycle(self):
+        """
+        Replaces the workers one at a time with new forks of the application loaded by the master.
+        Nothing is reloaded: the master has imported the code, and 'config.Config' read the environment
+        when it was imported, so calling the factory again would create the same application.
+        """
+        self.recycle_requested = False
+        logger.info("Recycling the workers.")
+        for pid, slot in list(self.workers.items()):
+            if pid in self.retiring:
+                continue
+            new_pid, ready = self.spawn(slot)
+            # The old worker keeps serving until the new one accepts connections.
+            if not select.select([ready], [], [], self.graceful_timeout)[0] or not os.read(ready, 1):
+                logger.warning("Worker %d did not start, keeping worker %d.", new_pid, pid)
+                os.close(ready)
+                continue
+            os.close(ready)
+            self.retire(pid)
+            self.reap()
+
+    def report(self, last_report, last_counts):
+        """Logs the requests per second of every worker since the last report."""
+        now, counts = time.monotonic(), list(self.counts)
+        elapsed = now - last_report
+        slots = {slot: pid for pid, slot in self.workers.items() if pid not in self.retiring}
+        rates = [f"{slots.get(slot, '-')}: {(count - last) / elapsed:.1f}/s"
+                 for slot, (count, last) in enumerate(zip(counts, last_counts))]
+        logger.info("Requests per worker: %s (total %.1f/s)", ", ".join(rates), (sum(counts) - sum(last_counts)) / elapsed)
+        return now, counts
+
+    def stop(self):
+        self.stopping = True
+        for pid in list(self.workers):
+            if pid not in self.retiring:
+                self.retire(pid)
+        while self.workers:
+            self.reap()
+            time.sleep(0.1)
+        self.socket.close()
+        logger.info("Stopped.")
+
+
+if __name__ == "__main__":
+    from flask.cli import ScriptInfo
+    from app import create_app
+    from commands import serve
+    serve(obj=ScriptInfo(create_app=lambda *args: create_app()))
@@ -0,0 +1,78 @@
+# Cold start of the application: the report of 'flask startup-profile'. A fresh interpreter imports
+# the application, creates it, connects to the database and serves a first request, timing each
+# phase; '-X importtime' attributes the import time to the packages it is spent in.
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+
+
+# Run by the child interpreter: the import of the 'app' package is the first phase, so it cannot live in it.
+MEASURE = """
+import time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter() - started
+from app.startup import measure
+measure(create_app, imported)
+"""
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+\d+ \| +(\S+)$")
+
+
+def measure(create_app, imported):
+    """Times the phases after the imports and prints the report as JSON on the last line."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from migrations import pending
+    from models import db
+
+    phases = [("imports", imported)]
+    connections = []
+    event.listen(Engine, "connect", lambda *args: connections.append(1))
+
+    started = time.perf_counter()
+    app = create_app()
+    phases.append(("create_app", time.perf_counter() - started))
+    startup_connections = len(connections)
+
+    with app.app_context():
+        started = time.perf_counter()
+        with db.engine.connect() as connection:
+            phases.append(("database connection", time.perf_counter() - started))
+            started = time.perf_counter()
+            migrations = [version for version, _, _ in pending(connection)]
+            phases.append(("schema version check", time.perf_counter() - started))
+
+    started = time.perf_counter()
+    status = app.test_client().get("/api/ships?limit=1").status_code
+    phases.append(("first request", time.perf_counter() - started))
+    print(json.dumps({"phases": phases, "startup_connections": startup_connections,
+                      "pending_migrations": migrations, "first_request_status": status}))
+
+
+def top_imports(importtime_output, count):
+    """The 'count' top-level packages (e.g. 'sqlalchemy') whose modules took the longest to import, in seconds."""
+    packages = Counter()
+    for line in importtime_output.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            # The self time of every module, so that nothing is counted twice.
+            packages[match.group(2).split(".")[0]] += int(match.group(1)) / 1e6
+    return packages.most_common(count)
+
+
+def profile(count=10):
+    """Runs the measurement in a new interpreter; returns its report with the 'count' slowest imports added."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", MEASURE], cwd=root,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        errors = "\n".join(line for line in result.stderr.splitlines() if not IMPORT_TIME.match(line))
+        raise RuntimeError(f"The startup measurement failed:\n{errors[-2000:]}")
+    report = json.loads(result.stdout.splitlines()[-1])
+    report["imports"] = top_imports(result.stderr, count)
+    return report
@@ -0,0 +1 @@
+# Performance benchmarks. Run them as modules, e.g. 'python -m benchmarks.login'.
@@ -0,0 +1,112 @@
+"""
+Concurrent connection scaling of the WSGI and ASGI serving modes.
+
+Seeds a temporary database, then sends single ship and ship page requests from 1, 4, 16, ...
+concurrent clients to (1) the Flask application on a WSGI server with a fixed pool of
+'--wsgi-threads' threads and (2) the ASGI application of asgi.py on uvicorn, and reports
+requests/s and p50/p95 latency. The difference shows with a database that answers over the
+network (a local SQLite file answers before any thread has to wait):
+
+    python -m benchmarks.asgi --database-url mysql+pymysql://user:password@db/ships_bench --max-clients 256
+
+Requires 'uvicorn' and the asyncio driver of the database ('aiomysql' or 'aiosqlite').
+"""
+import http.client
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import click
+from app.asgi import AsyncAPI
+from app.server import PooledWSGIServer, QuietRequestHandler
+from benchmarks.load import make_app, percentile, write_seed_file
+from commands import db_seed
+
+
+def start_wsgi(app, threads):
+    server = PooledWSGIServer(threads, "127.0.0.1", 0, app, handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def start_asgi(app):
+    import uvicorn
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(AsyncAPI(app), host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+    return port, stop
+
+
+def get(port, path):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def run(port, clients, requests, ships):
+    def client_loop(index):
+        rng = random.Random(index)
+        latencies, errors = [], 0
+        for i in range(max(1, requests // clients)):
+            path = f"/api/ships/{rng.randint(1, ships)}" if i % 2 else f"/api/ships?limit=20&after={rng.randint(0, ships)}"
+            started = time.perf_counter()
+            if get(port, path) != 200:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(client_loop, range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latencies, _ in results for latency in latencies)
+    return len(latencies) / elapsed, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.95) * 1000, sum(e for _, e in results)
+
+
+@click.command()
+@click.option("--ships", default=2000, show_default=True, help="Ships to seed.")
+@click.option("--requests", "requests_", default=400, show_default=True, help="Requests per server and client count.")
+@click.option("--max-clients", default=64, show_default=True, help="Largest number of concurrent clients (1, 4, 16, ...).")
+@click.option("--wsgi-threads", default=16, show_default=True, help="Threads of the WSGI server.")
+@click.option("--database-url", default=None, help="Database to run against (default: a temporary SQLite file); its tables must be empty.")
+def main(ships, requests_, max_clients, wsgi_threads, database_url):
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = database_url or f"sqlite:///{os.path.join(directory, 'asgi.db')}"
+        # Without the response cache every request reads the database, in both modes.
+        app = make_app(database_url, "pbkdf2:sha256:1000", False)
+        seed_file = os.path.join(directory, "seed.ndjson")
+        write_seed_file(seed_file, 1, ships)
+        result = app.test_cli_runner().invoke(db_seed, ["--file", seed_file, "--batch-size", "5000", "--workers", "1"])
+        if result.exit_code != 0:
+            raise click.ClickException(f"Seeding failed: {result.output}")
+
+        click.echo(f"{'server':>6} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for name, start in (("wsgi", lambda: start_wsgi(app, wsgi_threads)), ("asgi", lambda: start_asgi(app))):
+            port, stop = start()
+            try:
+                clients = 1
+                while clients <= max_clients:
+                    throughput, p50, p95, errors = run(port, clients, requests_, ships)
+                    click.echo(f"{name:>6} {clients:>8} {throughput:>9.1f} {p50:>8.2f} {p95:>8.2f} {errors:>7}")
+                    clients *= 4
+            finally:
+                stop()
+
+
+if __name__ == "__main__":
+    main()
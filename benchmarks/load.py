@@ -0,0 +1,287 @@
+"""
+Load test of the REST API.
+
+Seeds a fresh database with generated users and ships (through 'flask db-seed'), then runs
+every scenario with 1, 2, 4, ... concurrent clients, either in-process (the WSGI test client)
+or over a real socket (a threaded werkzeug server on localhost), and reports throughput,
+p50/p95/p99 latency and SQL queries per request. The results can be saved as a baseline;
+later runs compared against it exit with status 1 on a regression.
+
+    python -m benchmarks.load --users 50 --ships 20000 --requests 400
+    python -m benchmarks.load --transport socket --save-baseline benchmarks/baseline.json
+    python -m benchmarks.load --compare benchmarks/baseline.json --max-regression 0.25
+
+'--database-url' runs against another database (e.g. a disposable MySQL); its tables must be empty.
+The password hash is cheap by default so that logins do not dominate; 'benchmarks.login' measures hashing.
+"""
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import click
+from werkzeug.serving import make_server
+from app import create_app
+from app.server import QuietRequestHandler
+from commands import db_seed
+from config import Config
+from migrations import migrate
+from models import db
+
+
+AFFILIATIONS = ("Rebel Alliance", "Empire", "Republic", "Separatists", "Independent")
+CATEGORIES = ("Starfighters", "Capital Ships", "Transports", "Freighters", "Shuttles")
+MANUFACTURERS = ("Incom Corporation", "Kuat Drive Yards", "Sienar Fleet Systems", "Corellian Engineering Corporation")
+CLASSES = ("Starfighter", "Star Destroyer", "Light Freighter", "Corvette", "Shuttle")
+ROLES = ("Escort", "Space Superiority Starfighter", "Transport", "Patrol", "Command Ship")
+SCENARIOS = ("login", "refresh", "list_ships", "get_ship", "ship_crud")
+
+
+def write_seed_file(path, users, ships, seed=0):
+    """Writes an NDJSON seed file ('db-seed' format) with 'users' users and 'ships' random ships."""
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(users):
+            f.write(json.dumps({"type": "user", "name": f"load-{i}", "password": f"password-{i}"}) + "\n")
+        for i in range(ships):
+            f.write(json.dumps({
+                "type": "ship", "affiliation": rng.choice(AFFILIATIONS), "category": rng.choice(CATEGORIES),
+                "crew": rng.randint(1, 50000), "length": rng.randint(5, 20000), "manufacturer": rng.choice(MANUFACTURERS),
+                "model": f"Model {i}", "roles": rng.sample(ROLES, rng.randint(1, 3)), "ship_class": rng.choice(CLASSES),
+            }) + "\n")
+
+
+def make_app(database_url, password_method, response_cache):
+    class LoadConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        PASSWORD_HASH_METHOD = password_method
+        RESPONSE_CACHE_ENABLED = response_cache
+        LOGIN_RATE_LIMIT_ENABLED = False
+        QUERY_BUDGET_MODE = "off"
+        # The queries per request are read from the request metrics.
+        METRICS_ENABLED = True
+
+    app = create_app(LoadConfig)
+    with app.app_context():
+        migrate(db.engine)
+    return app
+
+
+class InProcessTransport:
+    """Calls the WSGI application directly, without a socket."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        r = self.app.test_client().open(path, method=method, json=body, headers=headers)
+        return r.status_code, r.get_json(silent=True)
+
+    def close(self):
+        pass
+
+
+class SocketTransport:
+    """Serves the application with a threaded werkzeug server and sends real HTTP requests to it."""
+
+    def __init__(self, app):
+        self.server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_port, timeout=60)
+        try:
+            connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        finally:
+            connection.close()
+        return response.status, json.loads(data) if data and data[:1] in (b"{", b"[") else None
+
+    def close(self):
+        self.server.shutdown()
+
+
+class Client:
+    """One simulated user: logs in once, then runs the requests of a scenario."""
+
+    def __init__(self, transport, index, users, ships):
+        self.transport = transport
+        self.rng = random.Random(index)
+        self.users = users
+        self.ships = ships
+        self.user = index % users
+        self.latencies = []
+        self.errors = 0
+        status, tokens = self.call("POST", "/auth/login", self.credentials(), expected=200, timed=False)
+        self.access_token = tokens["access_token"]
+        self.refresh_token = tokens["refresh_token"]
+
+    def credentials(self):
+        return {"username": f"load-{self.user}", "password": f"password-{self.user}"}
+
+    def call(self, method, path, body=None, token=None, expected=200, timed=True):
+        started = time.perf_counter()
+        status, data = self.transport.request(method, path, body, token)
+        if timed:
+            self.latencies.append(time.perf_counter() - started)
+        if status != expected:
+            self.errors += 1
+        return status, data
+
+    def login(self):
+        self.call("POST", "/auth/login", self.credentials())
+
+    def refresh(self):
+        self.call("POST", "/auth/refresh", token=self.refresh_token)
+
+    def list_ships(self):
+        after = self.rng.randint(0, max(0, self.ships - 100))
+        self.call("GET", f"/api/ships?limit=100&after={after}")
+
+    def get_ship(self):
+        self.call("GET", f"/api/ships/{self.rng.randint(1, self.ships)}")
+
+    def ship_crud(self):
+        # Four requests per round: create, update, read and delete a ship.
+        ship = {"model": "Load Test", "ship_class": "Shuttle", "crew": 3}
+        status, data = self.call("POST", "/api/ships", ship, token=self.access_token, expected=201)
+        if status != 201:
+            return
+        path = f"/api/ships/{data['id']}"
+        self.call("PUT", path, {"crew": 4}, token=self.access_token)
+        self.call("GET", path)
+        self.call("DELETE", path, token=self.access_token, expected=204)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted 'values'."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def query_totals(app):
+    """(SQL statements, requests) recorded by the request metrics so far."""
+    metrics = app.extensions["metrics"]
+    with metrics._lock:
+        histograms = list(metrics.queries.values())
+    return sum(histogram.sum for histogram in histograms), sum(histogram.count for histogram in histograms)
+
+
+def run_scenario(app, transport, scenario, clients, requests, users, ships):
+    """Runs about 'requests' requests of a scenario spread over 'clients' threads."""
+    workers = [Client(transport, i, users, ships) for i in range(clients)]
+    per_round = 4 if scenario == "ship_crud" else 1
+    rounds = max(1, requests // (clients * per_round))
+
+    def client_loop(client):
+        operation = getattr(client, scenario)
+        for _ in range(rounds):
+            operation()
+
+    queries_before, requests_before = query_totals(app)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client_loop, workers))
+    elapsed = time.perf_counter() - started
+    queries_after, requests_after = query_totals(app)
+
+    latencies = sorted(latency for client in workers for latency in client.latencies)
+    served = requests_after - requests_before
+    return {
+        "requests": len(latencies),
+        "errors": sum(client.errors for client in workers),
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "queries": (queries_after - queries_before) / served if served else 0.0,
+    }
+
+
+def regressions(results, baseline, max_regression):
+    """Compares results with a baseline; returns a description of every regression."""
+    found = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result["throughput"] < base["throughput"] * (1 - max_regression):
+            found.append(f"{key}: throughput {result['throughput']:.1f}/s, baseline {base['throughput']:.1f}/s")
+        if result["p95"] > base["p95"] * (1 + max_regression):
+            found.append(f"{key}: p95 {result['p95']:.2f} ms, baseline {base['p95']:.2f} ms")
+        # The number of queries does not depend on the machine: any increase is a regression.
+        if result["queries"] > base["queries"] + 0.01:
+            found.append(f"{key}: {result['queries']:.2f} queries per request, baseline {base['queries']:.2f}")
+        if result["errors"]:
+            found.append(f"{key}: {result['errors']} failed requests")
+    return found
+
+
+@click.command()
+@click.option("--users", default=20, show_default=True, help="Users to seed (one per client, reused round-robin).")
+@click.option("--ships", default=5000, show_default=True, help="Ships to seed.")
+@click.option("--requests", "requests_", default=300, show_default=True, help="Requests per scenario and client count.")
+@click.option("--max-clients", default=4, show_default=True, help="Largest number of concurrent clients (1, 2, 4, ...).")
+@click.option("--scenario", "scenarios", multiple=True, type=click.Choice(SCENARIOS), help="Scenarios to run (default: all).")
+@click.option("--transport", type=click.Choice(["inprocess", "socket"]), default="inprocess", show_default=True)
+@click.option("--database-url", default=None, help="Database to run against (default: a temporary SQLite file).")
+@click.option("--password-method", default="pbkdf2:sha256:1000", show_default=True, help="Password hash of the seeded users.")
+@click.option("--response-cache/--no-response-cache", default=True, show_default=True, help="Server-side cache of GET responses.")
+@click.option("--save-baseline", type=click.Path(dir_okay=False), help="Write the results to this JSON file.")
+@click.option("--compare", type=click.Path(exists=True, dir_okay=False), help="Baseline JSON file to compare with.")
+@click.option("--max-regression", default=0.2, show_default=True, help="Tolerated loss of throughput and p95 latency (0.2 = 20%).")
+def main(users, ships, requests_, max_clients, scenarios, transport, database_url, password_method, response_cache,
+         save_baseline, compare, max_regression):
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = database_url or f"sqlite:///{os.path.join(directory, 'load.db')}"
+        app = make_app(database_url, password_method, response_cache)
+        seed_file = os.path.join(directory, "seed.ndjson")
+        write_seed_file(seed_file, users, ships)
+        started = time.perf_counter()
+        result = app.test_cli_runner().invoke(db_seed, ["--file", seed_file, "--batch-size", "5000", "--workers", "1"])
+        if result.exit_code != 0:
+            raise click.ClickException(f"Seeding failed: {result.output}")
+        click.echo(f"Seeded {users} users and {ships} ships in {time.perf_counter() - started:.1f}s; transport={transport}")
+
+        client_transport = SocketTransport(app) if transport == "socket" else InProcessTransport(app)
+        results = {}
+        click.echo(f"{'scenario':>12} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                   f"{'queries':>8} {'errors':>7}")
+        try:
+            for scenario in scenarios or SCENARIOS:
+                clients = 1
+                while clients <= max_clients:
+                    r = run_scenario(app, client_transport, scenario, clients, requests_, users, ships)
+                    results[f"{transport}:{scenario}:{clients}"] = r
+                    click.echo(f"{scenario:>12} {clients:>8} {r['throughput']:>9.1f} {r['p50']:>8.2f} {r['p95']:>8.2f} "
+                               f"{r['p99']:>8.2f} {r['queries']:>8.2f} {r['errors']:>7}")
+                    clients *= 2
+        finally:
+            client_transport.close()
+
+    if save_baseline:
+        with open(save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        click.echo(f"Baseline written to {save_baseline}.")
+    if compare:
+        with open(compare) as f:
+            found = regressions(results, json.load(f), max_regression)
+        for regression in found:
+            click.echo(f"REGRESSION {regression}")
+        if found:
+            raise SystemExit(1)
+        click.echo("No regression against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
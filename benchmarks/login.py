@@ -0,0 +1,83 @@
+"""
+Login throughput benchmark.
+
+Creates a temporary SQLite database with a single user, then logs in with
+1, 2, 4, ... concurrent clients and reports logins/sec and logins/sec per core.
+
+    python -m benchmarks.login --requests 200 --method pbkdf2:sha256:150000
+"""
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import click
+from app import create_app
+from config import Config
+from migrations import migrate
+from models import db, User
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def make_app(database, method, concurrency, max_pending):
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{database}"
+        PASSWORD_HASH_METHOD = method
+        PASSWORD_HASH_CONCURRENCY = concurrency
+        PASSWORD_HASH_MAX_PENDING = max_pending
+        # The benchmark measures throughput, so requests wait for a slot instead of failing.
+        PASSWORD_HASH_QUEUE_TIMEOUT = 600
+        RESPONSE_CACHE_ENABLED = False
+        LOGIN_RATE_LIMIT_ENABLED = False
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        migrate(db.engine)
+        user = User(name="benchmark")
+        user.set_password("benchmark")
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def run(app, clients, requests):
+    """Sends 'requests' logins from 'clients' threads; returns the elapsed seconds."""
+    def client_loop(count):
+        client = app.test_client()
+        for _ in range(count):
+            r = client.post("/auth/login", json={"username": "benchmark", "password": "benchmark"})
+            assert r.status_code == 200, r.get_data(as_text=True)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client_loop, [requests // clients] * clients))
+    return time.perf_counter() - started
+
+
+@click.command()
+@click.option("--requests", default=100, show_default=True, help="Logins per run.")
+@click.option("--method", default=Config.PASSWORD_HASH_METHOD, show_default=True, help="Password hash method.")
+@click.option("--concurrency", default=available_cores(), show_default=True, help="Password hashes computed at once.")
+@click.option("--max-pending", default=64, show_default=True, help="Password hashes running or waiting at once.")
+@click.option("--max-clients", default=2 * available_cores(), show_default=True, help="Largest number of concurrent clients.")
+def main(requests, method, concurrency, max_pending, max_clients):
+    cores = available_cores()
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(os.path.join(directory, "benchmark.db"), method, concurrency, max_pending)
+        click.echo(f"method={method} hashing concurrency={concurrency} cores={cores}")
+        click.echo(f"{'clients':>8} {'logins/s':>10} {'logins/s/core':>14}")
+        clients = 1
+        while clients <= max_clients:
+            elapsed = run(app, clients, requests)
+            rate = (requests // clients * clients) / elapsed
+            click.echo(f"{clients:>8} {rate:>10.1f} {rate / cores:>14.1f}")
+            clients *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+JSON serialization benchmark of the ship list.
+
+Seeds a temporary SQLite database with generated ships, then serializes them in three ways
+and reports the milliseconds per run:
+  - 'orm':  ORM objects, Ship.to_json() and flask.jsonify (what '/api/ships' used to do),
+  - 'dict': Core rows turned into dicts, encoded by the JSON library,
+  - 'rows': Core rows encoded column by column by the RowSerializer (what '/api/ships' does now),
+with every installed JSON library.
+
+    python -m benchmarks.serialization --ships 20000 --iterations 5
+"""
+import os
+import tempfile
+import time
+import click
+from flask import jsonify as flask_jsonify
+from sqlalchemy import select
+from app.api.ships import SHIP_COLUMNS
+from app.serialization import BACKENDS, RowSerializer, create_backend
+from benchmarks.load import make_app, write_seed_file
+from commands import db_seed
+from models import db, Ship
+
+
+def best_of(function, iterations):
+    """The fastest of 'iterations' runs, in milliseconds."""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+@click.command()
+@click.option("--ships", default=20000, show_default=True, help="Ships to seed and serialize.")
+@click.option("--iterations", default=5, show_default=True, help="Runs per measurement (the fastest is reported).")
+def main(ships, iterations):
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(f"sqlite:///{os.path.join(directory, 'serialization.db')}", "pbkdf2:sha256:1000", False)
+        seed_file = os.path.join(directory, "seed.ndjson")
+        write_seed_file(seed_file, 0, ships)
+        result = app.test_cli_runner().invoke(db_seed, ["--file", seed_file, "--batch-size", "5000", "--workers", "1"])
+        if result.exit_code != 0:
+            raise click.ClickException(f"Seeding failed: {result.output}")
+
+        serializer = RowSerializer(SHIP_COLUMNS.values())
+        click.echo(f"{'library':>8} {'method':>6} {'ms':>9} {'bytes':>10}")
+        with app.test_request_context():
+            for name in BACKENDS:
+                try:
+                    app.extensions["json_backend"] = create_backend(name)
+                except RuntimeError:
+                    click.echo(f"{name:>8} not installed")
+                    continue
+                backend = app.extensions["json_backend"]
+                methods = {
+                    "dict": lambda: backend.dumps([dict(row._mapping) for row in db.session.execute(select(*serializer.columns))]),
+                    "rows": lambda: serializer.dumps(db.session.execute(serializer.select()).all()),
+                }
+                # The ORM path always goes through Flask's encoder: measured once.
+                if name == "json":
+                    methods = dict(orm=lambda: flask_jsonify([ship.to_json() for ship in Ship.query.all()]).get_data(), **methods)
+                for method, function in methods.items():
+                    size = len(function())
+                    db.session.remove()
+                    click.echo(f"{name:>8} {method:>6} {best_of(function, iterations):>9.1f} {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,289 @@
 import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import click
+from flask import current_app
 from flask.cli import with_appcontext
-from models import db, User, Ship
+from werkzeug.security import generate_password_hash
+from migrations import MIGRATIONS, current_version, migrate, pending
+from models import db, User, Ship, TableVersion
+
+
+SHIP_FIELDS = ("affiliation", "category", "crew", "length", "manufacturer", "model", "roles", "ship_class")
+
+
+def iter_json_arrays(f, chunk_size=1 << 16):
+    """
+    Yields (key, item) for every item of the arrays in a top-level JSON object,
+    e.g. ("users", {...}) for '{"users": [{...}]}', reading the file in chunks
+    so that the whole document never has to be in memory.
+    """
+    decoder = json.JSONDecoder()
+    state = {"buffer": "", "pos": 0, "eof": False}
+
+    def fill():
+        chunk = f.read(chunk_size)
+        state["eof"] = not chunk
+        state["buffer"] = state["buffer"][state["pos"]:] + chunk
+        state["pos"] = 0
+
+    def peek():
+        # Returns the next non-whitespace character without consuming it.
+        while True:
+            buffer, pos = state["buffer"], state["pos"]
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            state["pos"] = pos
+            if pos < len(buffer):
+                return buffer[pos]
+            if state["eof"]:
+                raise ValueError("Unexpected end of JSON input.")
+            fill()
+
+    def expect(chars):
+        char = peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON input, got {char!r}.")
+        state["pos"] += 1
+        return char
+
+    def decode():
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(state["buffer"], state["pos"])
+                # A value that ends exactly at the end of the buffer may be cut off (e.g. a number).
+                if end < len(state["buffer"]) or state["eof"]:
+                    state["pos"] = end
+                    return value
+            except json.JSONDecodeError:
+                if state["eof"]:
+                    raise
+            fill()
+
+    expect("{")
+    if peek() == "}":
+        return
+    while True:
+        key = decode()
+        expect(":")
+        if peek() == "[":
+            expect("[")
+            if peek() == "]":
+                expect("]")
+            else:
+                while True:
+                    yield key, decode()
+                    if expect(",]") == "]":
+                        break
+        else:
+            # Values other than arrays are not records; skip them.
+            decode()
+        if expect(",}") == "}":
+            return
+
+
+def iter_seed_records(path):
+    """
+    Yields ("user", record) and ("ship", record) tuples from a seed file.
+    '.ndjson'/'.jsonl' files have one record per line with a "type" of "user" or "ship";
+    other files have the 'data.json' layout: {"users": [...], "ships": [...]}.
+    """
+    with open(path) as f:
+        if path.endswith((".ndjson", ".jsonl")):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record.pop("type", None), record
+        else:
+            for key, record in iter_json_arrays(f):
+                yield {"users": "user", "ships": "ship"}.get(key), record
+
+
+def hash_passwords(passwords, executor):
+    """Hashes the passwords in the process pool (or serially without one) with the configured method."""
+    hash_password = partial(generate_password_hash, method=current_app.config["PASSWORD_HASH_METHOD"],
+                            salt_length=current_app.config["PASSWORD_SALT_LENGTH"])
+    if executor is None:
+        return [hash_password(password) for password in passwords]
+    return list(executor.map(hash_password, passwords, chunksize=max(1, len(passwords) // 32)))
 
 
 @click.command(name='db-seed')
+@click.option('--file', 'path', default='data.json', show_default=True,
+              help="Seed file: JSON ({\"users\": [...], \"ships\": [...]}) or NDJSON with a \"type\" per line.")
+@click.option('--batch-size', default=1000, show_default=True, help="Rows per INSERT batch.")
+@click.option('--workers', default=1, show_default=True,
+              help="Processes used for password hashing (1 hashes in this process; more only pay off for large files).")
 @with_appcontext
-def db_seed():
+def db_seed(path, batch_size, workers):
     """Seeds the database based on the provided data.json file."""
-    try:
-        with open('data.json') as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        click.echo("Error: 'data.json' file not found!")
+    if not os.path.exists(path):
+        click.echo(f"Error: '{path}' file not found!")
         return
+    # The application does not create the tables; 'flask db-migrate' does.
+    with db.engine.connect() as connection:
+        if pending(connection):
+            click.echo("Error: the database schema is not up to date, run 'flask db-migrate' first.")
+            return
 
-    # Seed users
-    if User.query.first() is None:
-        users_data = data.get('users', [])
-        click.echo("Seeding users...")
-        for user_data in users_data:
-            new_user = User(name=user_data['name'])
-            new_user.set_password(user_data['password'])
-            db.session.add(new_user)
-            click.echo(f"  - Added: {new_user.name}")
-    else:
+    # Tables that already contain data are not seeded again.
+    seed_users = User.query.first() is None
+    seed_ships = Ship.query.first() is None
+    if not seed_users:
         click.echo("The 'users' table already contains data, skipping seed.")
-
-    # Seed ships
-    if Ship.query.first() is None:
-        ships_data = data.get('ships', [])
-        click.echo("Seeding ships...")
-        for ship_data in ships_data:
-            new_ship = Ship(
-                affiliation=ship_data['affiliation'],
-                category=ship_data['category'],
-                crew=ship_data['crew'],
-                length=ship_data['length'],
-                manufacturer=ship_data['manufacturer'],
-                model=ship_data['model'],
-                roles=ship_data['roles'],
-                ship_class=ship_data['ship_class']
-            )
-            db.session.add(new_ship)
-            click.echo(f"  - Added: {new_ship.model}")
-    else:
+    if not seed_ships:
         click.echo("The 'ships' table already contains data, skipping seed.")
+    if not seed_users and not seed_ships:
+        return
+
+    counts = {"user": 0, "ship": 0}
+    batches = {"user": [], "ship": []}
+    started = time.perf_counter()
+    # The process pool is only started for a batch of users with more passwords than workers.
+    executor = None
+
+    def flush(kind):
+        nonlocal executor
+        rows = batches[kind]
+        if not rows:
+            return
+        if kind == "user":
+            if executor is None and workers > 1 and len(rows) > workers:
+                executor = ProcessPoolExecutor(max_workers=workers)
+            hashes = hash_passwords([row["password"] for row in rows], executor)
+            rows = [{"name": row["name"], "password": password} for row, password in zip(rows, hashes)]
+            db.session.execute(User.__table__.insert(), rows)
+        else:
+            db.session.execute(Ship.__table__.insert(), [{field: row.get(field) for field in SHIP_FIELDS} for row in rows])
+        TableVersion.bump(f"{kind}s")
+        # Commit every batch, so no transaction grows with the size of the input.
+        db.session.commit()
+        counts[kind] += len(rows)
+        batches[kind] = []
+        click.echo(f"  - {kind}s: {counts[kind]}")
+
+    try:
+        click.echo(f"Seeding from '{path}'...")
+        for kind, record in iter_seed_records(path):
+            if (kind == "user" and seed_users) or (kind == "ship" and seed_ships):
+                batches[kind].append(record)
+                if len(batches[kind]) >= batch_size:
+                    flush(kind)
+        flush("user")
+        flush("ship")
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-    db.session.commit()
-    click.echo("Database seeding finished!")
\ No newline at end of file
+    elapsed = time.perf_counter() - started
+    total = counts["user"] + counts["ship"]
+    click.echo(f"Database seeding finished! {counts['user']} users and {counts['ship']} ships "
+               f"in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s).")
+
+
+@click.command(name='db-migrate')
+@click.option('--status', is_flag=True, help="Only list the migrations that are not applied yet.")
+@with_appcontext
+def db_migrate(status):
+    """Creates or updates the database schema to the latest version."""
+    with db.engine.connect() as connection:
+        version, todo = current_version(connection), pending(connection)
+    click.echo(f"Schema version {version} of {MIGRATIONS[-1][0]}.")
+    if status:
+        for number, description, _ in todo:
+            click.echo(f"  pending {number}: {description}")
+        return
+    started = time.perf_counter()
+    for number, description, _ in migrate(db.engine):
+        click.echo(f"  applied {number}: {description}")
+    if todo:
+        click.echo(f"Migrated to version {MIGRATIONS[-1][0]} in {time.perf_counter() - started:.2f}s.")
+
+
+@click.command(name='blocklist-prune')
+@click.option('--batch-size', default=None, type=int, help="Rows deleted per batch (default: BLOCKLIST_PRUNE_BATCH_SIZE).")
+@click.option('--pause', default=None, type=float, help="Seconds between batches (default: BLOCKLIST_PRUNE_PAUSE).")
+@with_appcontext
+def blocklist_prune(batch_size, pause):
+    """Deletes the revoked tokens that have expired from the token_blocklist table."""
+    # Imported here because the 'app' package itself imports this module.
+    from app.blocklist import prune
+
+    batch_size = batch_size or current_app.config["BLOCKLIST_PRUNE_BATCH_SIZE"]
+    pause = current_app.config["BLOCKLIST_PRUNE_PAUSE"] if pause is None else pause
+    deleted, duration = prune(current_app, batch_size, pause)
+    left = current_app.extensions["blocklist_stats"].rows
+    click.echo(f"Deleted {deleted} of {deleted + left} rows in {duration:.2f}s "
+               f"({deleted / duration if duration else 0:.0f} rows/s), {left} rows left.")
+
+
+@click.command(name='jwt-key-generate')
+@click.option('--kid', default=None, help="Key id, the file name without '.pem' (default: the current UTC time).")
+@click.option('--algorithm', default=None, help="Algorithm the key is for (default: JWT_ALGORITHM).")
+@with_appcontext
+def jwt_key_generate(kid, algorithm):
+    """Adds a new private key to JWT_KEYS_DIR (it signs tokens after JWT_KEY_ACTIVATION_DELAY seconds)."""
+    from app.keyring import generate_private_key
+
+    path = current_app.config["JWT_KEYS_DIR"]
+    if not path:
+        raise click.UsageError("JWT_KEYS_DIR is not set.")
+    kid = kid or time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    filename = os.path.join(path, f"{kid}.pem")
+    if os.path.exists(filename):
+        raise click.UsageError(f"{filename} already exists.")
+    os.makedirs(path, exist_ok=True)
+    # The private key is only readable by its owner.
+    descriptor = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, "wb") as f:
+        f.write(generate_private_key(algorithm or current_app.config["JWT_ALGORITHM"]))
+    click.echo(f"Created {filename}.")
+
+
+@click.command(name='serve')
+@click.option('--host', default=None, help="Address to listen on (default: SERVER_HOST).")
+@click.option('--port', default=None, type=int, help="Port to listen on (default: SERVER_PORT).")
+@click.option('--workers', default=None, type=int, help="Worker processes (default: SERVER_WORKERS, the number of CPUs).")
+@click.option('--threads', default=None, type=int, help="Threads per worker (default: SERVER_THREADS).")
+@with_appcontext
+def serve(host, port, workers, threads):
+    """Serves the application with pre-forked worker processes; SIGHUP recycles them one at a time."""
+    from app import create_app
+    from app.server import Arbiter
+
+    config = current_app.config
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(message)s")
+    # The application loaded by the 'flask' command is the one the workers are forked from.
+    Arbiter(
+        create_app, host or config["SERVER_HOST"], config["SERVER_PORT"] if port is None else port,
+        workers=workers or config["SERVER_WORKERS"], threads=threads or config["SERVER_THREADS"],
+        stats_interval=config["SERVER_STATS_INTERVAL"], graceful_timeout=config["SERVER_GRACEFUL_TIMEOUT"],
+        app=current_app._get_current_object(),
+    ).run()
+
+
+@click.command(name='startup-profile')
+@click.option('--imports', 'count', default=10, show_default=True, help="Number of slowest imports listed.")
+def startup_profile(count):
+    """Reports where the cold start of a worker goes: imports, application creation and database."""
+    # Imported here because the 'app' package itself imports this module.
+    from app.startup import profile
+
+    try:
+        report = profile(count)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{'phase':<24} {'ms':>9}")
+    for phase, seconds in report["phases"]:
+        click.echo(f"{phase:<24} {seconds * 1000:>9.1f}")
+    click.echo(f"Database connections opened by create_app: {report['startup_connections']}")
+    if report["pending_migrations"]:
+        click.echo(f"Pending migrations: {report['pending_migrations']} (run 'flask db-migrate').")
+    click.echo(f"First request: HTTP {report['first_request_status']}")
+    click.echo("Import time by package (ms):")
+    for package, seconds in report["imports"]:
+        click.echo(f"  {package:<22} {seconds * 1000:>9.1f}")
@@ -4,11 +4,140 @@ from dotenv import load_dotenv
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, ".env"))
 
+def engine_options():
+    """Connection pool options of the engine; the ones not set in the environment keep SQLAlchemy's defaults."""
+    options = {"pool_pre_ping": (os.environ.get("DB_POOL_PRE_PING") or "1") == "1"}
+    for name, option, convert in (("DB_POOL_SIZE", "pool_size", int), ("DB_MAX_OVERFLOW", "max_overflow", int),
+                                  ("DB_POOL_TIMEOUT", "pool_timeout", float), ("DB_POOL_RECYCLE", "pool_recycle", int)):
+        if os.environ.get(name):
+            options[option] = convert(os.environ[name])
+    return options
+
+
 class Config(object):
     SECRET_KEY = os.environ.get("SECRET_KEY") or b"\xb0\xb3\n\xe1\xeep'\xdc\x9a\x1bm\xa4\xce\x81\xd5\x9fW^\xd0h"
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY") or b'\x1c\x7f~\xe6\xb5<P3,9\x80\x15nXQEvK\x11%\xabF\x17\x8fc\xdc@2\x91\xe6'
     JWT_ERROR_MESSAGE_KEY = "error"
+    # Signing algorithm: HS256 signs with JWT_SECRET_KEY. For RS256, ES256 or PS256 set JWT_KEYS_DIR to a directory
+    # of PEM keys named '<kid>.pem' (requires the 'cryptography' package); their public keys are served on '/auth/jwks.json'.
+    JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM") or "HS256"
+    JWT_KEYS_DIR = os.environ.get("JWT_KEYS_DIR")
+    # Key id that signs new tokens; by default the newest private key older than JWT_KEY_ACTIVATION_DELAY.
+    JWT_ACTIVE_KID = os.environ.get("JWT_ACTIVE_KID")
+    # Seconds a new key is published before it signs tokens, so other services can fetch it first.
+    JWT_KEY_ACTIVATION_DELAY = int(os.environ.get("JWT_KEY_ACTIVATION_DELAY") or 300)
+    # Seconds between scans of JWT_KEYS_DIR (also the 'max-age' of the JWKS response).
+    JWT_KEYS_RELOAD_INTERVAL = int(os.environ.get("JWT_KEYS_RELOAD_INTERVAL") or 60)
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING.
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options()
+    # Comma separated URLs of read replicas; GET requests to the API read from them.
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in (os.environ.get("DATABASE_REPLICA_URLS") or "").split(",") if uri]
+    # Seconds a replica's health check result is trusted.
+    REPLICA_HEALTH_CHECK_INTERVAL = float(os.environ.get("REPLICA_HEALTH_CHECK_INTERVAL") or 10)
+    # Seconds after a write during which the client that wrote reads from the primary (read-your-writes).
+    REPLICA_STICKY_SECONDS = float(os.environ.get("REPLICA_STICKY_SECONDS") or 5)
+    # Database of the async handlers of the ASGI mode (asgi.py); by default DATABASE_URL with its asyncio driver
+    # ('mysql+aiomysql://', 'sqlite+aiosqlite://').
+    ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL")
+    # Threads running the synchronous Flask routes in the ASGI mode.
+    ASGI_THREADS = int(os.environ.get("ASGI_THREADS") or 16)
     JWT_BLACKLIST_ENABLED = True
     JWT_BLACKLIST_TOKEN_CHECKS = ["access", "refresh"]
+    # In-process cache of revoked tokens in front of the 'token_blocklist' table.
+    REVOCATION_CACHE_SIZE = int(os.environ.get("REVOCATION_CACHE_SIZE") or 10000)
+    REVOCATION_CACHE_TTL = int(os.environ.get("REVOCATION_CACHE_TTL") or 3600)
+    # Expected number of revoked tokens for the Bloom filter (0 disables the filter).
+    REVOCATION_BLOOM_CAPACITY = int(os.environ.get("REVOCATION_BLOOM_CAPACITY") or 100000)
+    # Shared backend used to tell the other workers about revocations ('memory://' or 'redis://...').
+    # 'memory://' reaches no other process: only revoked tokens are cached, the others are looked up in the database.
+    REVOCATION_BACKEND_URL = os.environ.get("REVOCATION_BACKEND_URL") or "memory://"
+    # Revocations kept in the backend's event log; a worker that falls further behind forgets its cached answers.
+    REVOCATION_EVENT_LOG_SIZE = int(os.environ.get("REVOCATION_EVENT_LOG_SIZE") or 10000)
+    # How often (in seconds) a worker reads the revocations published by the other workers.
+    REVOCATION_SYNC_INTERVAL = float(os.environ.get("REVOCATION_SYNC_INTERVAL") or 1.0)
+    # JSON library of the responses: 'auto' (orjson, then ujson, then the standard library), 'orjson', 'ujson' or 'json'.
+    JSON_LIBRARY = os.environ.get("JSON_LIBRARY") or "auto"
+    # Compression of the responses, negotiated with 'Accept-Encoding'.
+    COMPRESSION_ENABLED = (os.environ.get("COMPRESSION_ENABLED") or "1") == "1"
+    # Encodings offered, preferred first; 'br' and 'zstd' require the 'brotli' and 'zstandard' packages and are skipped without them.
+    COMPRESSION_ALGORITHMS = (os.environ.get("COMPRESSION_ALGORITHMS") or "zstd,br,gzip").split(",")
+    # Smaller responses are sent as they are: compressing them saves less than it costs.
+    COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES") or 1024)
+    # Compressible content types and the level of each encoding. Streamed NDJSON is compressed while
+    # the client waits, so it gets fast levels; complete JSON responses are often compressed once and cached.
+    COMPRESSION_LEVELS = {
+        "application/json": {"gzip": 6, "br": 5, "zstd": 6},
+        "application/x-ndjson": {"gzip": 1, "br": 1, "zstd": 1},
+        "text/plain": {"gzip": 6, "br": 5, "zstd": 6},
+    }
+    # Largest page that 'GET /api/ships?limit=' returns.
+    SHIPS_PAGE_SIZE_MAX = int(os.environ.get("SHIPS_PAGE_SIZE_MAX") or 1000)
+    # Ships per page of 'GET /api/ships/search' when no 'limit' is given.
+    SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE") or 20)
+    # Number of rows fetched per batch when a collection is streamed as NDJSON.
+    STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE") or 500)
+    # Largest number of operations accepted by 'POST /api/ships/bulk'.
+    BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS") or 10000)
+    # 'Cache-Control' of the GET endpoints with an ETag: clients may store the response but must revalidate it.
+    HTTP_CACHE_CONTROL = os.environ.get("HTTP_CACHE_CONTROL") or "public, no-cache"
+    # Server-side cache of GET responses, invalidated by the write endpoints.
+    RESPONSE_CACHE_ENABLED = (os.environ.get("RESPONSE_CACHE_ENABLED") or "1") == "1"
+    # Backend of the cache: 'memory://' (per worker) or 'redis://...' (shared by all workers).
+    RESPONSE_CACHE_URL = os.environ.get("RESPONSE_CACHE_URL") or "memory://"
+    # Total size of the cached responses of the in-memory backend, in bytes.
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES") or 64 * 1024 * 1024)
+    # Seconds a cached response is served for.
+    RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL") or 60)
+    # What endpoints on a query budget do when they exceed it: 'off', 'warn' (log) or 'raise' (used by the tests).
+    QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE") or "off"
+    # Statements slower than this many milliseconds are logged (0 disables it).
+    SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS") or 0)
+    # Latency histograms, SQL and serialization time per endpoint on '/metrics' (Prometheus format).
+    METRICS_ENABLED = (os.environ.get("METRICS_ENABLED") or "1") == "1"
+    # Networks of the clients allowed to read '/metrics', comma-separated (by default the local host only).
+    METRICS_ALLOWED_NETWORKS = [network.strip() for network in
+                                (os.environ.get("METRICS_ALLOWED_NETWORKS") or "127.0.0.1/32,::1/128").split(",") if network.strip()]
+    # Requests slower than this many milliseconds are profiled (0 disables the sampling profiler).
+    PROFILE_SLOW_REQUEST_MS = int(os.environ.get("PROFILE_SLOW_REQUEST_MS") or 0)
+    # Milliseconds between two stack samples of the profiled requests.
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS") or 5)
+    # Directory receiving the folded stacks of slow requests (input for flame graph tools).
+    PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(basedir, "profiles")
+    # 'flask serve' (or 'python -m app.server'): address, worker processes and threads per worker.
+    SERVER_HOST = os.environ.get("SERVER_HOST") or "127.0.0.1"
+    SERVER_PORT = int(os.environ.get("SERVER_PORT") or 5000)
+    SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS") or os.cpu_count() or 1)
+    SERVER_THREADS = int(os.environ.get("SERVER_THREADS") or 8)
+    # Seconds between two logs of the request rate of every worker (0 disables them).
+    SERVER_STATS_INTERVAL = float(os.environ.get("SERVER_STATS_INTERVAL") or 60)
+    # Seconds a stopping worker has to finish its requests in flight before it is killed.
+    SERVER_GRACEFUL_TIMEOUT = float(os.environ.get("SERVER_GRACEFUL_TIMEOUT") or 30)
+    # Password hashing method and cost (werkzeug format, e.g. 'pbkdf2:sha256:600000') and salt length.
+    # Stored hashes made with other parameters are rehashed on the next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or "pbkdf2:sha256:150000"
+    PASSWORD_SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH") or 8)
+    # Password hashes computed at once (in the request threads), and how many may be running or waiting at once.
+    PASSWORD_HASH_CONCURRENCY = int(os.environ.get("PASSWORD_HASH_CONCURRENCY") or 4)
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING") or 16)
+    # Seconds a waiting request waits for its turn before getting '503 Service Unavailable'.
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT") or 2)
+    # Number of reverse proxies (load balancer, CDN) in front of the application: the client IP is read from the
+    # 'X-Forwarded-For' header they add (and the scheme from 'X-Forwarded-Proto'). 0 trusts no such header.
+    TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT") or 0)
+    # Rate limiting of '/auth/login', checked before any database query or password hash.
+    LOGIN_RATE_LIMIT_ENABLED = (os.environ.get("LOGIN_RATE_LIMIT_ENABLED") or "1") == "1"
+    # Store of the limits: 'memory://' (per worker) or 'redis://...' (shared by all workers).
+    LOGIN_RATE_LIMIT_URL = os.environ.get("LOGIN_RATE_LIMIT_URL") or "memory://"
+    # Attempts per client IP: a burst of LOGIN_IP_BURST, then LOGIN_IP_PER_MINUTE.
+    LOGIN_IP_BURST = int(os.environ.get("LOGIN_IP_BURST") or 20)
+    LOGIN_IP_PER_MINUTE = float(os.environ.get("LOGIN_IP_PER_MINUTE") or 20)
+    # Failed attempts per username and client IP: LOGIN_USER_FAILURES, regained over LOGIN_USER_FAILURE_WINDOW seconds.
+    LOGIN_USER_FAILURES = int(os.environ.get("LOGIN_USER_FAILURES") or 5)
+    LOGIN_USER_FAILURE_WINDOW = float(os.environ.get("LOGIN_USER_FAILURE_WINDOW") or 300)
+    # Seconds between two runs of the background thread deleting expired blocklist rows (0: only 'flask blocklist-prune').
+    BLOCKLIST_PRUNE_INTERVAL = float(os.environ.get("BLOCKLIST_PRUNE_INTERVAL") or 0)
+    # Rows deleted per batch and seconds to pause between batches.
+    BLOCKLIST_PRUNE_BATCH_SIZE = int(os.environ.get("BLOCKLIST_PRUNE_BATCH_SIZE") or 500)
+    BLOCKLIST_PRUNE_PAUSE = float(os.environ.get("BLOCKLIST_PRUNE_PAUSE") or 0.05)
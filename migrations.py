@@ -0,0 +1,130 @@
+# Versioned schema migrations, applied with 'flask db-migrate' (the application itself never creates
+# or alters tables). The 'schema_version' table holds the number of the last migration applied.
+# A migration only adds what is missing, so databases created by earlier versions of the application
+# (whose tables came from 'db.create_all()') are brought up to date the same way as new ones.
+from sqlalchemy import Column, DateTime, Index, Integer, JSON, MetaData, String, Table, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+
+# (version, description, function(connection)), in the order they are applied.
+MIGRATIONS = []
+
+schema_version = Table("schema_version", MetaData(), Column("version", Integer, nullable=False))
+
+
+def migration(version, description):
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        return function
+    return register
+
+
+def add_column(connection, table, column):
+    """Adds 'column' to 'table' unless it exists."""
+    if column.name in {c["name"] for c in inspect(connection).get_columns(table)}:
+        return
+    Table(table, MetaData(), column)
+    connection.execute(text(f"ALTER TABLE {table} ADD {CreateColumn(column).compile(dialect=connection.dialect)}"))
+
+
+def create_index(connection, table, column):
+    """Creates the index 'ix_<table>_<column>' (the name SQLAlchemy gives to 'index=True') unless it exists."""
+    name = f"ix_{table}_{column}"
+    if name in {index["name"] for index in inspect(connection).get_indexes(table)}:
+        return
+    Index(name, Table(table, MetaData(), Column(column)).c[column]).create(connection)
+
+
+@migration(1, "Create the users, ships and token_blocklist tables")
+def create_tables(connection):
+    # The tables as the application first created them; the following migrations add to them.
+    metadata = MetaData()
+    Table("users", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("name", String(80), unique=True, nullable=False),
+          Column("password", String(255), nullable=False))
+    Table("ships", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("affiliation", String(100)),
+          Column("category", String(100)),
+          Column("crew", Integer),
+          Column("length", Integer),
+          Column("manufacturer", String(200)),
+          Column("model", String(100)),
+          Column("roles", JSON),
+          Column("ship_class", String(100)))
+    Table("token_blocklist", metadata,
+          Column("id", Integer, primary_key=True),
+          Column("jti", String(36), nullable=False, index=True),
+          Column("created_at", DateTime, nullable=False))
+    metadata.create_all(connection)
+
+
+@migration(2, "Add the table_versions table")
+def create_table_versions(connection):
+    Table("table_versions", MetaData(),
+          Column("name", String(64), primary_key=True),
+          Column("version", Integer, nullable=False)).create(connection, checkfirst=True)
+
+
+@migration(3, "Add token_blocklist.expires_at")
+def add_blocklist_expiry(connection):
+    add_column(connection, "token_blocklist", Column("expires_at", DateTime))
+    create_index(connection, "token_blocklist", "expires_at")
+
+
+@migration(4, "Add users.token_generation")
+def add_token_generation(connection):
+    add_column(connection, "users", Column("token_generation", Integer, nullable=False, server_default="0"))
+
+
+@migration(5, "Index the filter columns of ships")
+def index_ship_filters(connection):
+    for column in ("affiliation", "category", "manufacturer", "ship_class"):
+        create_index(connection, "ships", column)
+
+
+@migration(6, "Add ships.version and users.version")
+def add_row_versions(connection):
+    for table in ("ships", "users"):
+        add_column(connection, table, Column("version", Integer, nullable=False, server_default="1"))
+
+
+@migration(7, "Add the rows of table_versions for ships and users")
+def seed_table_versions(connection):
+    # 'TableVersion.bump' only updates the row of a table: inserting it on the first write raced.
+    table_versions = Table("table_versions", MetaData(),
+                           Column("name", String(64), primary_key=True),
+                           Column("version", Integer, nullable=False))
+    existing = set(connection.execute(select(table_versions.c.name)).scalars())
+    for name in ("ships", "users"):
+        if name not in existing:
+            connection.execute(table_versions.insert().values(name=name, version=0))
+
+
+def current_version(connection):
+    """The version of the schema (0 for a database without the 'schema_version' table)."""
+    if not inspect(connection).has_table(schema_version.name):
+        return 0
+    return connection.execute(select(schema_version.c.version)).scalar() or 0
+
+
+def pending(connection):
+    """The migrations not applied yet, as (version, description, function)."""
+    version = current_version(connection)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def migrate(engine):
+    """Applies the pending migrations, each in its own transaction; returns them."""
+    with engine.begin() as connection:
+        schema_version.create(connection, checkfirst=True)
+        if connection.execute(select(schema_version.c.version)).first() is None:
+            connection.execute(schema_version.insert().values(version=0))
+        todo = pending(connection)
+    for version, description, function in todo:
+        # MySQL commits DDL statements implicitly: the version is recorded right after each migration.
+        with engine.begin() as connection:
+            function(connection)
+            connection.execute(schema_version.update().values(version=version))
+    return todo
@@ -1,7 +1,9 @@
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+import time
+from routing import RoutingSQLAlchemy
+from passwords import get_hasher
 
-db = SQLAlchemy()
+# Flask-SQLAlchemy with read replica routing (see routing.py).
+db = RoutingSQLAlchemy()
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -9,12 +11,33 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
+    # Embedded in every token issued to the user; incrementing it revokes all of them at once.
+    token_generation = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Incremented by every update through the API; the ETag of '/api/users/<id>' (see app/api/writes.py).
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
+    # The hashing method, its cost and its concurrency are configured per application (see passwords.py).
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = get_hasher().hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return get_hasher().verify(self.password, password)
+
+    def password_needs_rehash(self):
+        return get_hasher().needs_rehash(self.password)
+
+    def revoke_tokens(self):
+        """Starts a new token generation (incremented in SQL, so concurrent calls cannot lose an increment)."""
+        self.token_generation = User.token_generation + 1
+
+    @classmethod
+    def current_token_generation(cls, user_id):
+        """The token generation of a user, read from the database (None if the user does not exist)."""
+        return db.session.query(cls.token_generation).filter_by(id=user_id).scalar()
+
+    def token_claims(self):
+        """The custom claims of the user's tokens."""
+        return {"gen": self.token_generation}
 
     def to_json(self):
         return {
@@ -26,14 +49,17 @@ class Ship(db.Model):
     __tablename__ = 'ships'
 
     id = db.Column(db.Integer, primary_key=True)
-    affiliation = db.Column(db.String(100))
-    category = db.Column(db.String(100))
+    # Indexed: the exact match filters of 'GET /api/ships' (text search goes through app/search.py).
+    affiliation = db.Column(db.String(100), index=True)
+    category = db.Column(db.String(100), index=True)
     crew = db.Column(db.Integer)
     length = db.Column(db.Integer)
-    manufacturer = db.Column(db.String(200))
+    manufacturer = db.Column(db.String(200), index=True)
     model = db.Column(db.String(100))
     roles = db.Column(db.JSON)
-    ship_class = db.Column(db.String(100))
+    ship_class = db.Column(db.String(100), index=True)
+    # Incremented by every update through the API; the ETag of '/api/ships/<id>' (see app/api/writes.py).
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
     def to_json(self):
         return {
@@ -53,4 +79,51 @@ class TokenBlocklist(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False, index=True)
-    created_at = db.Column(db.DateTime, nullable=False)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, nullable=False)
+    # The expiry of the revoked token (UTC). Once it has passed, the token is rejected anyway and the row can go.
+    expires_at = db.Column(db.DateTime, index=True)
+
+    @classmethod
+    def prune_expired(cls, now, legacy_before, batch_size=500, pause=0.0):
+        """
+        Deletes the rows of expired tokens in batches of 'batch_size', committing after each
+        batch so no lock is held for long; 'pause' seconds between batches leave room for other
+        queries. Rows without 'expires_at' are deleted once created before 'legacy_before'.
+        Returns the number of deleted rows.
+        """
+        expired = db.or_(cls.expires_at < now, db.and_(cls.expires_at.is_(None), cls.created_at < legacy_before))
+        deleted = 0
+        while True:
+            ids = [id for (id,) in db.session.query(cls.id).filter(expired).order_by(cls.id).limit(batch_size)]
+            if not ids:
+                return deleted
+            cls.query.filter(cls.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+            if pause:
+                time.sleep(pause)
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+
+    # One row per table, e.g. 'ships'; the version is incremented by every write to that table.
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def current(cls, name):
+        """Returns the current version of a table (0 if it has never been written)."""
+        version = db.session.query(cls.version).filter_by(name=name).scalar()
+        return version or 0
+
+    @classmethod
+    def bump(cls, name):
+        """
+        Increments the version of a table. Call it before committing a write,
+        so the new version becomes visible in the same transaction as the change.
+        The row of the table exists beforehand (see migration 7): two concurrent first writes
+        would otherwise both insert it, and one of them would fail.
+        """
+        updated = cls.query.filter_by(name=name).update({cls.version: cls.version + 1}, synchronize_session=False)
+        if updated == 0:
+            raise RuntimeError(f"No version row for table '{name}': run 'flask db-migrate'.")
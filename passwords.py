@@ -0,0 +1,73 @@
+import threading
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hashes are already running or waiting."""
+
+
+def normalize_method(method):
+    """'pbkdf2:sha256' -> 'pbkdf2:sha256:150000', the form werkzeug stores in the hash."""
+    if method.startswith("pbkdf2:") and method.count(":") == 1:
+        return f"{method}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords with a configurable method and cost.
+
+    The hashes are computed in the calling (request) thread: hashlib releases the GIL while
+    hashing, so the request threads use several cores. At most 'concurrency' hashes run at once
+    (0: no limit) and at most 'max_pending' may be running or waiting. A call beyond 'max_pending'
+    raises PasswordHasherBusy at once; a waiting one raises it after 'queue_timeout' seconds.
+    The request thread is held while it waits and while it hashes: the limits only keep the
+    hashes from taking every core and every request thread.
+    """
+
+    def __init__(self, method="pbkdf2:sha256", salt_length=8, concurrency=0, max_pending=16, queue_timeout=2.0):
+        self.method = normalize_method(method)
+        self.salt_length = salt_length
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._running = threading.BoundedSemaphore(concurrency) if concurrency else None
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            if self._running is None:
+                return function(*args)
+            if not self._running.acquire(timeout=self.queue_timeout):
+                raise PasswordHasherBusy()
+            try:
+                return function(*args)
+            finally:
+                self._running.release()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if the hash was made with another method, cost or salt length than the configured ones."""
+        if pwhash.count("$") < 2:
+            return True
+        method, salt, _ = pwhash.split("$", 2)
+        return method != self.method or len(salt) != self.salt_length
+
+
+# Used outside of an application (e.g. in a Python shell): werkzeug's defaults, in the calling thread.
+default_hasher = PasswordHasher()
+
+
+def get_hasher():
+    """Returns the password hasher of the current application."""
+    if has_app_context():
+        return current_app.extensions.get("password_hasher", default_hasher)
+    return default_hasher
@@ -0,0 +1,129 @@
+import itertools
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
+
+
+# The cookie (or request header) holding the time until which a client that wrote reads from the primary.
+STICKY_COOKIE = "read_primary_until"
+STICKY_HEADER = "X-Read-Primary-Until"
+
+
+class ReplicaSet:
+    """
+    The read replicas of the primary database, used round-robin.
+    Each replica is pinged at most once per 'health_check_interval' seconds;
+    replicas that fail the check are skipped until they pass it again.
+    A client that wrote reads from the primary for 'sticky_seconds' (read-your-writes): the end of
+    that window is sent back to it in a cookie and a header, so every worker sees it, and the reads
+    of the other clients keep going to the replicas.
+    """
+
+    def __init__(self, db, binds, health_check_interval=10.0, sticky_seconds=5.0):
+        self.db = db
+        # The replicas are Flask-SQLAlchemy binds, so their engines are created lazily on first use.
+        self.binds = list(binds)
+        self.health_check_interval = health_check_interval
+        self.sticky_seconds = sticky_seconds
+        self._counter = itertools.count()
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def mark_write(self):
+        """Called after a commit that wrote something: the client's reads go to the primary for 'sticky_seconds'."""
+        if has_request_context():
+            # A wall-clock time, the same for every worker.
+            g.read_primary_until = time.time() + self.sticky_seconds
+
+    def after_request(self, response):
+        """Tells a client that wrote until when it reads from the primary."""
+        until = g.pop("read_primary_until", None)
+        if until is not None and self.binds:
+            response.set_cookie(STICKY_COOKIE, f"{until:.3f}", max_age=self.sticky_seconds, httponly=True, samesite="Lax")
+            response.headers[STICKY_HEADER] = f"{until:.3f}"
+        return response
+
+    def is_sticky(self):
+        """Whether the client of the request wrote less than 'sticky_seconds' ago (cookie, or header sent back by API clients)."""
+        if "read_primary_until" in g:
+            # It wrote during this request.
+            return True
+        until = request.cookies.get(STICKY_COOKIE) or request.headers.get(STICKY_HEADER)
+        try:
+            return until is not None and float(until) > time.time()
+        except ValueError:
+            return False
+
+    def is_healthy(self, bind):
+        now = time.monotonic()
+        checked_at, healthy = self._health.get(bind, (float("-inf"), True))
+        if now - checked_at < self.health_check_interval:
+            return healthy
+        try:
+            with self.db.get_engine(current_app, bind=bind).connect() as connection:
+                connection.execute(text("SELECT 1"))
+            healthy = True
+        except SQLAlchemyError:
+            healthy = False
+        self._health[bind] = (now, healthy)
+        return healthy
+
+    def choose(self):
+        """Returns the engine of the next healthy replica, or None if the primary has to be used."""
+        if not self.binds or self.is_sticky():
+            return None
+        for _ in range(len(self.binds)):
+            with self._lock:
+                bind = self.binds[next(self._counter) % len(self.binds)]
+            if self.is_healthy(bind):
+                return self.db.get_engine(current_app, bind=bind)
+        return None
+
+
+class RoutingSession(SignallingSession):
+    """
+    Sends the queries of GET requests to the 'api' blueprint to a read replica
+    and everything else (writes, authentication, CLI commands) to the primary.
+    Once the session has written something, it stays on the primary until the commit, and then the
+    client that wrote does (see 'ReplicaSet').
+    """
+
+    def __init__(self, db, **options):
+        self.wrote = False
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.wrote = True
+        elif not self.wrote and has_request_context() and request.method in ("GET", "HEAD") \
+                and request.blueprint == "api":
+            replicas = self.app.extensions.get("db_replicas")
+            engine = replicas.choose() if replicas is not None else None
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def commit(self):
+        SignallingSession.commit(self)
+        # Read-your-writes: the next reads of this client must see the change, so they skip the replicas.
+        if self.wrote:
+            self.wrote = False
+            replicas = self.app.extensions.get("db_replicas")
+            if replicas is not None:
+                replicas.mark_write()
+
+    def rollback(self):
+        SignallingSession.rollback(self)
+        # Nothing was written.
+        self.wrote = False
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with a session that routes reads to replicas."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -1,5 +1,8 @@
 import pytest
 from app import create_app
+from app.query_budget import QueryBudget
+from migrations import migrate
+from models import db
 
 
 class Authentication:
@@ -15,10 +18,20 @@ class Authentication:
         self.headers = {"Authorization": "Bearer {}".format(self.access_token)}
 
 
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    """Brings the schema of the test database up to date, once per test run."""
+    app = create_app()
+    with app.app_context():
+        migrate(db.engine)
+
+
 @pytest.fixture
 def app():
     app = create_app()
     app.testing = True
+    # Endpoints exceeding their query budget fail the test.
+    app.config["QUERY_BUDGET_MODE"] = "raise"
 
     with app.app_context():
         yield app
@@ -33,3 +46,14 @@ def client(app):
 @pytest.fixture
 def auth(client):
     return Authentication(client)
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Puts a block on a query budget, e.g.:
+
+        with query_budget(max_queries=2) as budget:
+            client.get("/api/ships")
+    """
+    return QueryBudget
@@ -115,3 +115,30 @@ def test_logout_refresh_token(client, auth):
     assert r.status_code == 401
     assert r.is_json
     assert r.get_json().get("error") == "Token has been revoked"
+
+
+def test_logout_all_revokes_every_token_of_the_user(client, auth):
+    client.post("/api/users", json={"name": "logout-all-user", "password": "secret"})
+    auth.login(username="logout-all-user", password="secret")
+    first_session = auth.headers, auth.refresh_token
+    auth.login(username="logout-all-user", password="secret")
+    assert decode_token(auth.access_token)["user_claims"] == {"gen": 0}
+    r = client.delete("/auth/logout-all", headers=auth.headers)
+    assert r.status_code == 200
+    assert r.get_json().get("message") == "Successfully logged out everywhere."
+    for headers, refresh_token in (first_session, (auth.headers, auth.refresh_token)):
+        assert client.delete("/auth/logout", headers=headers).status_code == 401
+        assert client.post("/auth/refresh", headers={"Authorization": "Bearer {}".format(refresh_token)}).status_code == 401
+    # A new login gets tokens of the new generation.
+    auth.login(username="logout-all-user", password="secret")
+    assert decode_token(auth.access_token)["user_claims"] == {"gen": 1}
+    assert client.delete("/auth/logout", headers=auth.headers).status_code == 200
+
+
+def test_password_change_revokes_tokens(client, auth):
+    r = client.post("/api/users", json={"name": "password-change-user", "password": "secret"})
+    auth.login(id=r.get_json()["id"], username="password-change-user", password="secret")
+    old_refresh_token = auth.refresh_token
+    assert client.put("/api/users/{}".format(auth.id), headers=auth.headers, json={"password": "new-secret"}).status_code == 200
+    assert client.put("/api/users/{}".format(auth.id), headers=auth.headers, json={"name": "other-name"}).status_code == 401
+    assert client.post("/auth/refresh", headers={"Authorization": "Bearer {}".format(old_refresh_token)}).status_code == 401
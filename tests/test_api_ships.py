@@ -1,3 +1,7 @@
+import json
+from models import db, Ship
+
+
 def test_get_ships(client):
     r = client.get("/api/ships")
     assert r.status_code == 200
@@ -135,3 +139,247 @@ def test_delete_ship_that_does_not_exist(client, auth):
     auth.login()
     assert client.delete("/api/ships/0", headers=auth.headers).status_code == 404
     assert client.delete("/api/ships/99", headers=auth.headers).status_code == 404
+
+
+def test_get_ships_with_limit_and_cursor(client):
+    r = client.get("/api/ships?limit=2")
+    assert r.status_code == 200
+    page1 = r.get_json()
+    assert len(page1) == 2
+    assert page1[0]["id"] < page1[1]["id"]
+    assert "Link" in r.headers
+    assert "after={}".format(page1[1]["id"]) in r.headers["Link"]
+    page2 = client.get("/api/ships?limit=2&after={}".format(page1[1]["id"])).get_json()
+    assert page2[0]["id"] > page1[1]["id"]
+
+
+def test_get_ships_last_page_has_no_next_link(client):
+    r = client.get("/api/ships?limit=1000")
+    assert r.status_code == 200
+    assert "Link" not in r.headers
+
+
+def test_get_ships_with_fields(client):
+    ships = client.get("/api/ships?fields=model,crew").get_json()
+    assert len(ships) > 0
+    assert set(ships[0].keys()) == {"id", "model", "crew"}
+
+
+def test_get_ships_with_unknown_field(client):
+    assert client.get("/api/ships?fields=model,password").status_code == 400
+
+
+def test_get_ships_with_filters(client):
+    ships = client.get("/api/ships?affiliation=Empire&min_crew=1&max_length=100").get_json()
+    for ship in ships:
+        assert ship["affiliation"] == "Empire"
+        assert ship["crew"] >= 1
+        assert ship["length"] <= 100
+
+
+def test_get_ships_with_invalid_parameters(client):
+    assert client.get("/api/ships?limit=abc").status_code == 400
+    assert client.get("/api/ships?limit=0").status_code == 400
+    assert client.get("/api/ships?min_crew=many").status_code == 400
+
+
+def test_get_ships_as_stream(client):
+    r = client.get("/api/ships?stream=1")
+    assert r.status_code == 200
+    assert r.mimetype == "application/x-ndjson"
+    lines = r.get_data(as_text=True).splitlines()
+    assert len(lines) == len(client.get("/api/ships").get_json())
+    assert json.loads(lines[0])["id"] > 0
+
+
+def test_get_ships_as_stream_with_accept_header(client):
+    r = client.get("/api/ships?limit=2&fields=model", headers={"Accept": "application/x-ndjson"})
+    assert r.mimetype == "application/x-ndjson"
+    lines = r.get_data(as_text=True).splitlines()
+    assert len(lines) == 2
+    assert set(json.loads(lines[0]).keys()) == {"id", "model"}
+
+
+def test_bulk_ships(client, auth):
+    client.post("/api/users", json={"name": "bulk-user", "password": "secret"})
+    auth.login(username="bulk-user", password="secret")
+    r = client.post("/api/ships", json={"model": "Old", "ship_class": "Class"}, headers=auth.headers)
+    old_id = r.get_json()["id"]
+    r = client.post("/api/ships", json={"model": "Doomed", "ship_class": "Class"}, headers=auth.headers)
+    doomed_id = r.get_json()["id"]
+    r = client.post("/api/ships/bulk", json=[
+        {"op": "create", "data": {"model": "Bulk 1", "ship_class": "Class", "crew": 2}},
+        {"op": "create", "data": {"model": "Bulk 2", "ship_class": "Class", "roles": ["Role"]}},
+        {"op": "update", "id": old_id, "data": {"model": "New"}},
+        {"op": "delete", "id": doomed_id},
+    ], headers=auth.headers)
+    assert r.status_code == 200
+    results = r.get_json()["results"]
+    assert [result["status"] for result in results] == [201, 201, 200, 204]
+    assert client.get("/api/ships/{}".format(results[0]["id"])).get_json()["crew"] == 2
+    assert client.get("/api/ships/{}".format(results[1]["id"])).get_json()["roles"] == ["Role"]
+    assert client.get("/api/ships/{}".format(old_id)).get_json()["model"] == "New"
+    assert client.get("/api/ships/{}".format(doomed_id)).status_code == 404
+
+
+def test_bulk_ships_as_ndjson(client, auth):
+    client.post("/api/users", json={"name": "bulk-user", "password": "secret"})
+    auth.login(username="bulk-user", password="secret")
+    body = "\n".join(json.dumps({"op": "create", "data": {"model": "NDJSON {}".format(i), "ship_class": "Class"}}) for i in range(3))
+    r = client.post("/api/ships/bulk?return_ids=0", data=body, content_type="application/x-ndjson", headers=auth.headers)
+    assert r.status_code == 200
+    assert [result["status"] for result in r.get_json()["results"]] == [201, 201, 201]
+
+
+def test_bulk_ships_is_all_or_nothing(client, auth):
+    client.post("/api/users", json={"name": "bulk-user", "password": "secret"})
+    auth.login(username="bulk-user", password="secret")
+    count = len(client.get("/api/ships").get_json())
+    r = client.post("/api/ships/bulk", json=[
+        {"op": "create", "data": {"model": "Valid", "ship_class": "Class"}},
+        {"op": "create", "data": {"model": "Invalid", "crew": "BAD"}},
+        {"op": "update", "id": 99999, "data": {"model": "?"}},
+        {"op": "fly"},
+    ], headers=auth.headers)
+    assert r.status_code == 400
+    results = r.get_json()["results"]
+    assert [result["status"] for result in results] == [200, 400, 404, 400]
+    assert results[1]["message"] == {"ship_class": "Missing data for required field.", "crew": "Not a valid int."}
+    assert len(client.get("/api/ships").get_json()) == count
+
+
+def test_bulk_ships_without_login(client):
+    assert client.post("/api/ships/bulk", json=[{"op": "delete", "id": 1}]).status_code == 401
+
+
+def test_get_ships_with_etag(client, auth):
+    r = client.get("/api/ships")
+    etag = r.headers["ETag"]
+    assert "no-cache" in r.headers["Cache-Control"]
+    r = client.get("/api/ships", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.get_data() == b""
+    assert client.get("/api/ships?limit=1", headers={"If-None-Match": etag}).status_code == 200
+    client.post("/api/users", json={"name": "etag-user", "password": "secret"})
+    auth.login(username="etag-user", password="secret")
+    client.post("/api/ships", json={"model": "Model", "ship_class": "Class"}, headers=auth.headers)
+    r = client.get("/api/ships", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+
+
+def test_get_ship_with_etag(client):
+    etag = client.get("/api/ships/3").headers["ETag"]
+    assert client.get("/api/ships/3", headers={"If-None-Match": etag}).status_code == 304
+    assert "ETag" not in client.get("/api/ships/999").headers
+
+
+def test_ship_stats(client):
+    ships = client.get("/api/ships").get_json()
+    r = client.get("/api/ships/stats?group_by=affiliation&metrics=count,sum:crew,max:length")
+    assert r.status_code == 200
+    groups = r.get_json()["groups"]
+    assert sum(group["count"] for group in groups) == len(ships)
+    empire = [group for group in groups if group["affiliation"] == "Empire"][0]
+    empire_ships = [ship for ship in ships if ship["affiliation"] == "Empire"]
+    assert empire["count"] == len(empire_ships)
+    assert empire["sum_crew"] == sum(ship["crew"] or 0 for ship in empire_ships)
+    assert empire["max_length"] == max(ship["length"] or 0 for ship in empire_ships)
+
+
+def test_ship_stats_histogram(client):
+    data = client.get("/api/ships/stats?histogram=length&bin_width=500&category=Starfighters").get_json()
+    assert data["bin_width"] == 500
+    lengths = [ship["length"] for ship in client.get("/api/ships?category=Starfighters").get_json()]
+    for group in data["groups"]:
+        if group["length_bin"] is None:
+            assert group["count"] == lengths.count(None)
+        else:
+            assert group["count"] == sum(1 for length in lengths if length is not None and 0 <= length - group["length_bin"] < 500)
+    assert len(client.get("/api/ships/stats?histogram=crew&bins=3").get_json()["groups"]) <= 4
+
+
+def test_ship_stats_skip_values_that_are_not_numbers(client):
+    # SQLite stores what does not convert to an integer as it is (the create endpoint used to accept it).
+    db.session.execute(Ship.__table__.insert().values(model="Bad crew", ship_class="Class", crew="BAD"))
+    db.session.commit()
+    try:
+        r = client.get("/api/ships/stats?histogram=crew&bins=3&metrics=count,max:crew,avg:crew")
+        assert r.status_code == 200
+        groups = r.get_json()["groups"]
+        assert all(isinstance(group["max_crew"], int) for group in groups if group["crew_bin"] is not None)
+        assert [group["max_crew"] for group in groups if group["crew_bin"] is None] == [None]
+    finally:
+        db.session.execute(Ship.__table__.delete().where(Ship.model == "Bad crew"))
+        db.session.commit()
+
+
+def test_ship_stats_with_invalid_parameters(client):
+    assert client.get("/api/ships/stats?group_by=model").status_code == 400
+    assert client.get("/api/ships/stats?metrics=avg:model").status_code == 400
+    assert client.get("/api/ships/stats?histogram=roles").status_code == 400
+    assert client.get("/api/ships/stats?histogram=crew&bin_width=0").status_code == 400
+
+
+def test_ship_stats_are_invalidated_by_writes(client, auth):
+    client.post("/api/users", json={"name": "stats-user", "password": "secret"})
+    auth.login(username="stats-user", password="secret")
+    count = client.get("/api/ships/stats").get_json()["groups"][0]["count"]
+    assert client.get("/api/ships/stats").headers["X-Cache"] == "HIT"
+    client.post("/api/ships", json={"model": "Counted", "ship_class": "Class"}, headers=auth.headers)
+    assert client.get("/api/ships/stats").get_json()["groups"][0]["count"] == count + 1
+
+
+def test_update_and_delete_ship_with_if_match(client, auth):
+    client.post("/api/users", json={"name": "if-match-ship-user", "password": "secret"})
+    auth.login(username="if-match-ship-user", password="secret")
+    r = client.post("/api/ships", json={"model": "Model", "ship_class": "Class"}, headers=auth.headers)
+    path = r.headers["Location"]
+    etag = client.get(path).headers["ETag"]
+    assert r.headers["ETag"] == etag
+
+    r = client.put(path, json={"crew": 3}, headers=dict(auth.headers, **{"If-Match": etag}))
+    assert r.status_code == 200
+    assert r.get_json()["crew"] == 3
+    assert r.get_json()["model"] == "Model"
+    assert "version" not in r.get_json()
+    new_etag = r.headers["ETag"]
+    assert new_etag != etag
+    assert client.get(path).headers["ETag"] == new_etag
+
+    # A write based on the version read before is refused instead of overwriting the change.
+    r = client.put(path, json={"crew": 4}, headers=dict(auth.headers, **{"If-Match": etag}))
+    assert r.status_code == 412
+    assert r.headers["ETag"] == new_etag
+    assert client.get(path).get_json()["crew"] == 3
+    # Without an attribute to set, nothing is written (the 'If-Match' check still applies).
+    r = client.put(path, json={"unknown": 0}, headers=dict(auth.headers, **{"If-Match": new_etag}))
+    assert r.status_code == 200
+    assert r.headers["ETag"] == new_etag
+    assert client.put(path, json={"unknown": 0}, headers=dict(auth.headers, **{"If-Match": etag})).status_code == 412
+    assert client.delete(path, headers=dict(auth.headers, **{"If-Match": etag})).status_code == 412
+    assert client.delete(path, headers=dict(auth.headers, **{"If-Match": new_etag})).status_code == 204
+    assert client.put(path, json={"crew": 5}, headers=dict(auth.headers, **{"If-Match": "*"})).status_code == 404
+
+
+def test_patch_ship(client, auth, query_budget):
+    client.post("/api/users", json={"name": "patch-ship-user", "password": "secret"})
+    auth.login(username="patch-ship-user", password="secret")
+    path = client.post("/api/ships", json={"model": "Model", "ship_class": "Class", "roles": ["A"]}, headers=auth.headers).headers["Location"]
+    etag = client.get(path).headers["ETag"]
+
+    # The token's generation and jti (one query: memory:// caches neither for a valid token), the UPDATE,
+    # the row read back and the table version.
+    with query_budget(max_queries=4):
+        r = client.patch(path, json={"crew": 7, "roles": ["B", "C"]}, headers=dict(auth.headers, **{"If-Match": etag}))
+    assert r.status_code == 200
+    ship = r.get_json()
+    assert (ship["crew"], ship["roles"], ship["model"]) == (7, ["B", "C"], "Model")
+    assert client.get(path).get_json() == ship
+    assert client.patch(path, json={"crew": 8}, headers=dict(auth.headers, **{"If-Match": etag})).status_code == 412
+
+    r = client.patch(path, json={"crew": "many", "model": None, "colour": "red"}, headers=auth.headers)
+    assert r.status_code == 400
+    assert set(r.get_json()["message"]) == {"crew", "model", "colour"}
+    assert client.patch(path, json={}, headers=auth.headers).status_code == 400
+    assert client.patch("/api/ships/100000", json={"crew": 1}, headers=auth.headers).status_code == 404
@@ -1,3 +1,4 @@
+import json
 from flask_jwt_extended import create_access_token
 
 
@@ -110,9 +111,10 @@ def test_update_non_existing_user(client):
 def test_update_user_ensures_request_data_id_matches_resource_id(client, auth):
     """If request data contains an (optional) "id" then it has to match the resource id."""
     auth.login()
-    assert client.put("/api/users/{}".format(auth.id), headers=auth.headers, json={"id": auth.id, "name": "??", "password": "????"}).status_code == 200
-    assert client.put("/api/users/{}".format(auth.id), headers=auth.headers, json={"name": "??", "password": "????"}).status_code == 200
-    r = client.put("/api/users/{}".format(auth.id), headers=auth.headers, json={"id": auth.id + 1, "name": "??", "password": "????"})
+    # Without "password": a password change would revoke the token used here.
+    assert client.put("/api/users/{}".format(auth.id), headers=auth.headers, json={"id": auth.id, "name": "??"}).status_code == 200
+    assert client.put("/api/users/{}".format(auth.id), headers=auth.headers, json={"name": "??"}).status_code == 200
+    r = client.put("/api/users/{}".format(auth.id), headers=auth.headers, json={"id": auth.id + 1, "name": "??"})
     assert r.status_code == 400
     json = r.get_json()
     assert "message" in json
@@ -134,12 +136,83 @@ def test_delete_user_without_login(client):
     assert client.delete("/api/users/1").status_code == 401
 
 
-def test_delete_user_that_does_not_exist(client, auth):
-    auth.login()
-    assert client.delete("/api/users/{}".format(auth.id), headers=auth.headers).status_code == 204
-    assert client.delete("/api/users/{}".format(auth.id), headers=auth.headers).status_code == 404
+def test_delete_user_that_does_not_exist(client):
+    # A valid token (without a token generation, so only its jti is checked) for an id no user ever had.
+    r = client.delete("/api/users/99", headers={"Authorization": "Bearer " + create_access_token(identity=99)})
+    assert r.status_code == 404
+
+
+def test_delete_user_revokes_its_tokens(client, auth):
+    user_id = client.post("/api/users", json={"name": "deleted-user", "password": "secret"}).get_json()["id"]
+    auth.login(username="deleted-user", password="secret")
+    assert client.delete("/api/users/{}".format(user_id), headers=auth.headers).status_code == 204
+    assert client.delete("/api/users/{}".format(user_id), headers=auth.headers).status_code == 401
 
 
 def test_delete_different_user_is_forbidden(client, auth):
     auth.login()
     assert client.delete("/api/users/2", headers=auth.headers).status_code == 403
+
+
+def test_get_users_as_stream(client):
+    r = client.get("/api/users", headers={"Accept": "application/x-ndjson"})
+    assert r.status_code == 200
+    assert r.mimetype == "application/x-ndjson"
+    users = [json.loads(line) for line in r.get_data(as_text=True).splitlines()]
+    assert users == client.get("/api/users").get_json()
+
+
+def test_get_users_with_etag(client):
+    etag = client.get("/api/users").headers["ETag"]
+    assert client.get("/api/users", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/api/users", json={"name": "etag-test-{}".format(etag[:8]), "password": "secret"})
+    assert client.get("/api/users", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_update_and_delete_user_with_if_match(client, auth):
+    user_id = client.post("/api/users", json={"name": "if-match-user", "password": "secret"}).get_json()["id"]
+    client.post("/api/users", json={"name": "if-match-other", "password": "secret"})
+    auth.login(username="if-match-user", password="secret")
+    path = "/api/users/{}".format(user_id)
+    etag = client.get(path).headers["ETag"]
+
+    r = client.put(path, json={"name": "if-match-renamed"}, headers=dict(auth.headers, **{"If-Match": etag}))
+    assert r.status_code == 200
+    assert r.get_json() == {"id": user_id, "name": "if-match-renamed"}
+    assert r.headers["ETag"] != etag
+    assert client.put(path, json={"name": "if-match-again"}, headers=dict(auth.headers, **{"If-Match": etag})).status_code == 412
+    assert client.delete(path, headers=dict(auth.headers, **{"If-Match": etag})).status_code == 412
+    r = client.put(path, json={"name": "if-match-other"}, headers=auth.headers)
+    assert r.status_code == 400
+    assert r.get_json()["message"] == "Username is already taken."
+    r = client.put(path, json={"name": None}, headers=auth.headers)
+    assert r.status_code == 400
+    assert r.get_json()["message"] == {"name": "Field may not be null."}
+
+    # Without a field to change, nothing is written: the ETag stays the same.
+    etag = client.get(path).headers["ETag"]
+    r = client.put(path, json={"id": user_id}, headers=dict(auth.headers, **{"If-Match": etag}))
+    assert r.status_code == 200
+    assert r.get_json() == {"id": user_id, "name": "if-match-renamed"}
+    assert r.headers["ETag"] == etag == client.get(path).headers["ETag"]
+
+    # A password change revokes the tokens issued so far.
+    etag = client.get(path).headers["ETag"]
+    assert client.put(path, json={"password": "new-secret"}, headers=dict(auth.headers, **{"If-Match": etag})).status_code == 200
+    assert client.delete(path, headers=auth.headers).status_code == 401
+
+
+def test_patch_user(client, auth):
+    user_id = client.post("/api/users", json={"name": "patch-user", "password": "secret"}).get_json()["id"]
+    auth.login(username="patch-user", password="secret")
+    path = "/api/users/{}".format(user_id)
+
+    r = client.patch(path, json={"name": "patch-user-renamed"}, headers=auth.headers)
+    assert r.status_code == 200
+    assert r.get_json() == {"id": user_id, "name": "patch-user-renamed"}
+    r = client.patch(path, json={"name": "?", "password": 1234, "id": user_id}, headers=auth.headers)
+    assert r.status_code == 400
+    assert r.get_json()["message"] == {"name": "Shorter than minimum length 2.", "password": "Not a valid string.",
+                                       "id": "Unknown field."}
+    assert client.patch("/api/users/{}".format(user_id + 1), json={"name": "other"}, headers=auth.headers).status_code == 403
+    assert client.post("/auth/login", json={"username": "patch-user-renamed", "password": "secret"}).status_code == 200
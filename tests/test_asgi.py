@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from app.asgi import async_database_url, wsgi_environ
+
+
+def test_async_database_url():
+    assert async_database_url("mysql+pymysql://u:p@db/ships") == "mysql+aiomysql://u:p@db/ships"
+    assert async_database_url("sqlite:////tmp/app.db") == "sqlite+aiosqlite:////tmp/app.db"
+    with pytest.raises(ValueError):
+        async_database_url("oracle://db")
+
+
+def test_wsgi_environ():
+    scope = {"type": "http", "method": "POST", "path": "/api/ships", "query_string": b"a=1",
+             "headers": [(b"content-type", b"application/json"), (b"accept", b"a"), (b"accept", b"b")],
+             "server": ("localhost", 8000), "client": ("10.0.0.1", 1234)}
+    environ = wsgi_environ(scope, b"{}")
+    assert environ["CONTENT_TYPE"] == "application/json"
+    assert environ["CONTENT_LENGTH"] == "2"
+    assert environ["HTTP_ACCEPT"] == "a,b"
+    assert environ["QUERY_STRING"] == "a=1"
+    assert environ["REMOTE_ADDR"] == "10.0.0.1"
+    assert environ["wsgi.input"].read() == b"{}"
+
+
+def call(api, method, path, query=b"", headers=(), body=b""):
+    """Sends one request to the ASGI application; returns (status, headers, body)."""
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "headers": list(headers),
+             "http_version": "1.1", "scheme": "http", "server": ("localhost", 80), "client": ("127.0.0.1", 1)}
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(api(scope, receive, send))
+    return sent[0]["status"], dict(sent[0]["headers"]), b"".join(message.get("body", b"") for message in sent[1:])
+
+
+@pytest.fixture
+def api(app):
+    pytest.importorskip("aiosqlite")
+    from app.asgi import AsyncAPI
+    return AsyncAPI(app, threads=2)
+
+
+def test_async_handlers_answer_like_the_flask_views(api, client):
+    for path, query in (("/api/ships", b"limit=3&fields=model"), ("/api/ships/1", b""), ("/api/users", b"")):
+        status, headers, body = call(api, "GET", path, query)
+        expected = client.get(f"{path}?{query.decode()}")
+        assert status == 200
+        assert body == expected.data
+        assert headers[b"etag"] == expected.headers["ETag"].encode()
+    assert b"after=3" in call(api, "GET", "/api/ships", b"limit=3")[1][b"link"]
+    assert call(api, "GET", "/api/ships/100000")[0] == 404
+    assert call(api, "GET", "/api/ships", b"limit=x")[0] == 400
+
+
+def test_async_handlers_answer_304(api):
+    etag = call(api, "GET", "/api/ships/1")[1][b"etag"]
+    assert call(api, "GET", "/api/ships/1", headers=[(b"if-none-match", etag)])[0] == 304
+
+
+def test_other_routes_go_to_the_flask_application(api):
+    status, headers, body = call(api, "POST", "/api/ships", headers=[(b"content-type", b"application/json")], body=b"{}")
+    assert status == 401
+    status, headers, body = call(api, "GET", "/api/ships", b"stream=1")
+    assert headers[b"content-type"] == b"application/x-ndjson"
+    assert len(body.splitlines()) > 1
@@ -0,0 +1,88 @@
+import time
+from datetime import datetime, timedelta
+from flask_jwt_extended import decode_token
+from app import create_app
+from app.blocklist import blocklist_size, prune
+from app.server import after_fork
+from config import Config
+from models import db, TokenBlocklist
+
+
+def add_token(jti, expires_at, created_at=None):
+    db.session.add(TokenBlocklist(jti=jti, created_at=created_at or datetime.now(), expires_at=expires_at))
+    db.session.commit()
+
+
+def jtis():
+    return {token.jti for token in TokenBlocklist.query.all()}
+
+
+def test_prune_deletes_only_expired_tokens(app):
+    now = datetime.utcnow()
+    add_token("prune-expired-1", now - timedelta(minutes=1))
+    add_token("prune-expired-2", now - timedelta(days=1))
+    add_token("prune-valid", now + timedelta(minutes=10))
+    add_token("prune-legacy-old", None, created_at=datetime.now() - timedelta(days=31))
+    add_token("prune-legacy-new", None)
+    size = blocklist_size()
+    deleted, _ = prune(app, batch_size=1)
+    assert deleted >= 3
+    assert blocklist_size() == size - deleted
+    remaining = jtis()
+    assert "prune-valid" in remaining
+    assert "prune-legacy-new" in remaining
+    assert not remaining & {"prune-expired-1", "prune-expired-2", "prune-legacy-old"}
+    stats = app.extensions["blocklist_stats"]
+    assert stats.runs == 1
+    assert stats.deleted_total == deleted
+    assert stats.rows == blocklist_size()
+
+
+def test_logout_stores_token_expiry(client, auth):
+    client.post("/api/users", json={"name": "expiry-user", "password": "secret"})
+    auth.login(username="expiry-user", password="secret")
+    client.delete("/auth/logout", headers=auth.headers)
+    token = decode_token(auth.access_token)
+    row = TokenBlocklist.query.filter_by(jti=token["jti"]).first()
+    assert row.expires_at == datetime.utcfromtimestamp(token["exp"])
+
+
+def test_blocklist_prune_command(app):
+    add_token("prune-command", datetime.utcnow() - timedelta(minutes=1))
+    result = app.test_cli_runner().invoke(args=["blocklist-prune", "--pause", "0"])
+    assert result.exit_code == 0
+    assert "Deleted" in result.output
+    assert "prune-command" not in jtis()
+
+
+def test_background_sweeper(app):
+    class SweeperConfig(Config):
+        BLOCKLIST_PRUNE_INTERVAL = 0.05
+        BLOCKLIST_PRUNE_PAUSE = 0
+
+    add_token("prune-sweeper", datetime.utcnow() - timedelta(minutes=1))
+    sweeper_app = create_app(SweeperConfig)
+    try:
+        for _ in range(40):
+            if sweeper_app.extensions["blocklist_stats"].runs:
+                break
+            time.sleep(0.05)
+        db.session.expire_all()
+        assert "prune-sweeper" not in jtis()
+    finally:
+        sweeper_app.extensions["blocklist_sweeper"].stop()
+
+
+def test_sweeper_runs_in_the_first_worker_only():
+    class SweeperConfig(Config):
+        BLOCKLIST_PRUNE_INTERVAL = 60
+
+    sweeper_app = create_app(SweeperConfig)
+    sweeper = sweeper_app.extensions["blocklist_sweeper"]
+    sweeper.stop()
+    after_fork(sweeper_app, slot=1)
+    assert sweeper_app.extensions["blocklist_sweeper"] is sweeper
+    after_fork(sweeper_app, slot=0)
+    assert sweeper_app.extensions["blocklist_sweeper"] is not sweeper
+    assert sweeper_app.extensions["blocklist_sweeper"].is_alive()
+    sweeper_app.extensions["blocklist_sweeper"].stop()
@@ -0,0 +1,32 @@
+import io
+import json
+import pytest
+from commands import iter_json_arrays, iter_seed_records
+
+
+def test_iter_json_arrays_reads_in_small_chunks():
+    data = {"users": [{"name": "a", "password": "b"}], "meta": {"version": 12345}, "ships": [{"crew": 123456}, {"crew": 7}], "empty": []}
+    items = list(iter_json_arrays(io.StringIO(json.dumps(data, indent=2)), chunk_size=3))
+    assert items == [("users", {"name": "a", "password": "b"}), ("ships", {"crew": 123456}), ("ships", {"crew": 7})]
+
+
+def test_iter_json_arrays_with_empty_object():
+    assert list(iter_json_arrays(io.StringIO("{ }"))) == []
+
+
+def test_iter_json_arrays_with_truncated_input():
+    with pytest.raises(ValueError):
+        list(iter_json_arrays(io.StringIO('{"ships": [{"crew": 1}, ')))
+
+
+def test_iter_seed_records_from_data_json():
+    records = list(iter_seed_records("data.json"))
+    assert records[0][0] == "user"
+    assert records[0][1]["name"] == "user"
+    assert sum(1 for kind, _ in records if kind == "ship") == 15
+
+
+def test_iter_seed_records_from_ndjson(tmp_path):
+    path = tmp_path / "seed.ndjson"
+    path.write_text('{"type": "user", "name": "a", "password": "b"}\n\n{"type": "ship", "model": "X"}\n')
+    assert list(iter_seed_records(str(path))) == [("user", {"name": "a", "password": "b"}), ("ship", {"model": "X"})]
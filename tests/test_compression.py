@@ -0,0 +1,61 @@
+import gzip
+import json
+from app.compression import Compression, GzipCodec
+
+
+def test_large_responses_are_compressed(client):
+    plain = client.get("/api/ships", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    r = client.get("/api/ships", headers={"Accept-Encoding": "gzip, deflate"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in r.headers["Vary"]
+    assert json.loads(gzip.decompress(r.data)) == plain.get_json()
+    assert int(r.headers["Content-Length"]) == len(r.data) < len(plain.data)
+    # Each encoding has its own strong ETag.
+    assert r.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+
+
+def test_small_responses_and_refused_encodings_are_not_compressed(client):
+    r = client.get("/api/ships/1", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in r.headers
+    assert "Accept-Encoding" in r.headers["Vary"]
+    r = client.get("/api/ships", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in r.headers
+
+
+def test_compressed_etag_is_revalidated(client):
+    headers = {"Accept-Encoding": "gzip"}
+    etag = client.get("/api/ships?limit=50", headers=headers).headers["ETag"]
+    r = client.get("/api/ships?limit=50", headers=dict(headers, **{"If-None-Match": etag}))
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+
+
+def test_cached_responses_are_compressed_once(app, client):
+    backend = app.extensions["response_cache"].backend
+    first = client.get("/api/ships", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["X-Cache"] == "MISS"
+    assert sum(key.endswith("|gzip") for key in backend._entries) == 1
+    second = client.get("/api/ships", headers={"Accept-Encoding": "gzip"})
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.headers["Content-Encoding"] == "gzip"
+    assert second.data == first.data
+    # Clients without compression get the plain entry.
+    assert "Content-Encoding" not in client.get("/api/ships").headers
+
+
+def test_streamed_responses_are_compressed_chunk_by_chunk(client):
+    r = client.get("/api/ships?stream=1", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(r.data).decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == client.get("/api/ships").get_json()
+
+
+def test_levels_depend_on_the_content_type(app):
+    compression = Compression([GzipCodec()], {"application/json": {"gzip": 9}}, min_bytes=10)
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = app.response_class("x" * 100, mimetype="application/json")
+        assert compression.compress(response, compression.negotiate())
+        assert gzip.decompress(response.get_data()) == b"x" * 100
+        text = app.response_class("x" * 100, mimetype="text/html")
+        assert not compression.compress(text, "gzip")
@@ -38,3 +38,10 @@ def test_generic_500_error(app):
     response = error_response(500)
     assert response.status_code == 500
     assert response.get_json()["error"] == "Internal Server Error"
+
+
+def test_error_with_extra_fields(app):
+    response = error_response(400, "Invalid items.", results=[{"index": 0}])
+    json = response.get_json()
+    assert json["message"] == "Invalid items."
+    assert json["results"] == [{"index": 0}]
@@ -0,0 +1,104 @@
+import os
+import time
+import jwt
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app
+from config import Config
+
+pytest.importorskip("cryptography")
+
+from app.keyring import KeyRing, generate_private_key  # noqa: E402
+
+
+def write_key(directory, kid, algorithm="RS256", age=3600):
+    filename = os.path.join(directory, f"{kid}.pem")
+    with open(filename, "wb") as f:
+        f.write(generate_private_key(algorithm))
+    created_at = time.time() - age
+    os.utime(filename, (created_at, created_at))
+
+
+@pytest.fixture
+def keys_dir(tmp_path):
+    write_key(str(tmp_path), "old", age=7200)
+    write_key(str(tmp_path), "current", age=3600)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def keyring_app(keys_dir):
+    class KeyRingConfig(Config):
+        JWT_ALGORITHM = "RS256"
+        JWT_KEYS_DIR = keys_dir
+
+    app = create_app(KeyRingConfig)
+    with app.app_context():
+        yield app
+
+
+def test_keyring_signs_with_newest_active_key(keys_dir):
+    keyring = KeyRing(keys_dir, "RS256", activation_delay=300)
+    assert keyring.signing_key().kid == "current"
+    # A new key is published first and only signs once the activation delay has passed.
+    write_key(keys_dir, "next", age=10)
+    keyring.reload()
+    assert keyring.signing_key().kid == "current"
+    assert [key["kid"] for key in keyring.jwks()["keys"]] == ["old", "current", "next"]
+    assert KeyRing(keys_dir, "RS256", active_kid="next").signing_key().kid == "next"
+
+
+def test_keyring_keeps_parsed_keys(keys_dir):
+    keyring = KeyRing(keys_dir, "RS256")
+    key = keyring.verification_key("current")
+    keyring.reload()
+    assert keyring.verification_key("current") is key
+    assert keyring.verification_key("unknown") is None
+
+
+def test_keyring_supports_elliptic_curve_keys(tmp_path):
+    write_key(str(tmp_path), "ec", algorithm="ES256")
+    keyring = KeyRing(str(tmp_path), "ES256")
+    token = jwt.encode({"sub": 1}, keyring.signing_key().private_key, "ES256")
+    assert jwt.decode(token, keyring.verification_key("ec"), algorithms=["ES256"]) == {"sub": 1}
+    assert keyring.jwks()["keys"][0]["crv"] == "P-256"
+
+
+def test_tokens_are_signed_with_the_active_key(keyring_app):
+    token = create_access_token(identity=1)
+    assert jwt.get_unverified_header(token)["kid"] == "current"
+    assert jwt.get_unverified_header(token)["alg"] == "RS256"
+    public_key = keyring_app.extensions["jwt_keyring"].verification_key("current")
+    assert jwt.decode(token, public_key, algorithms=["RS256"])["identity"] == 1
+
+
+def test_tokens_of_older_keys_are_accepted(keyring_app):
+    client = keyring_app.test_client()
+    old_key = keyring_app.extensions["jwt_keyring"]._keys["old"]
+    claims = jwt.decode(create_access_token(identity=99), verify=False)
+    token = jwt.encode(claims, old_key.private_key, "RS256", headers={"kid": "old"}).decode("ascii")
+    r = client.put("/api/users/99", json={"name": "??"}, headers={"Authorization": "Bearer " + token})
+    assert r.status_code == 404
+
+
+def test_tokens_of_unknown_keys_are_rejected(keyring_app):
+    client = keyring_app.test_client()
+    token = create_access_token(identity=99)
+    header = jwt.get_unverified_header(token)
+    claims = jwt.decode(token, verify=False)
+    forged = jwt.encode(claims, generate_private_key("RS256"), "RS256", headers=dict(header, kid="unknown")).decode("ascii")
+    r = client.put("/api/users/99", json={"name": "??"}, headers={"Authorization": "Bearer " + forged})
+    assert r.status_code == 422
+
+
+def test_jwks_endpoint(keyring_app):
+    r = keyring_app.test_client().get("/auth/jwks.json")
+    assert r.status_code == 200
+    keys = r.get_json()["keys"]
+    assert [key["kid"] for key in keys] == ["old", "current"]
+    assert all(key["kty"] == "RSA" and key["alg"] == "RS256" for key in keys)
+    assert "max-age=60" in r.headers["Cache-Control"]
+
+
+def test_jwks_endpoint_without_key_ring(client):
+    assert client.get("/auth/jwks.json").status_code == 404
@@ -0,0 +1,72 @@
+import os
+import time
+from app.metrics import Histogram, SamplingProfiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value)
+    assert list(histogram.samples()) == [("0.1", 1), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.count == 4
+    assert histogram.sum == 6.25
+
+
+def test_metrics_endpoint_reports_requests(client):
+    client.get("/api/ships?limit=5&stream=0")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.mimetype == "text/plain"
+    text = r.get_data(as_text=True)
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert 'http_request_duration_seconds_count{endpoint="api.get_ships",method="GET",status="200"} 1' in text
+    assert 'http_request_sql_queries_count{endpoint="api.get_ships"} 1' in text
+    assert 'http_request_phase_seconds_count{endpoint="api.get_ships",phase="serialization"} 1' in text
+    assert "blocklist_prune_runs_total 0" in text
+    # The size of the blocklist is only known after a pruning run.
+    assert "blocklist_rows" not in text
+    # '/metrics' does not measure itself.
+    assert 'endpoint="metrics"' not in text
+
+
+def test_metrics_endpoint_is_restricted_to_allowed_networks(app, client):
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "192.0.2.1"}).status_code == 404
+    app.config["METRICS_ALLOWED_NETWORKS"] = ["192.0.2.0/24"]
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "192.0.2.1"}).status_code == 200
+    assert client.get("/metrics").status_code == 404
+
+
+def test_metrics_report_the_blocklist_size_of_the_last_pruning_run(app, client):
+    app.extensions["blocklist_stats"].record(2, 0.5, 7)
+    assert "blocklist_rows 7" in client.get("/metrics").get_data(as_text=True).splitlines()
+
+
+def test_sql_queries_are_counted_per_request(client):
+    client.get("/api/ships/1")
+    text = client.get("/metrics").get_data(as_text=True)
+    sums = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+    # The version of the table (in the key of the cached response), then the ship and its version (the ETag).
+    assert float(sums['http_request_sql_queries_sum{endpoint="api.get_ship"}']) == 2
+    assert float(sums['http_request_phase_seconds_count{endpoint="api.get_ship",phase="sql"}']) == 1
+
+
+def test_profiler_dumps_folded_stacks(tmp_path):
+    profiler = SamplingProfiler(interval=0.001, directory=str(tmp_path))
+    profiler.start()
+    profiler.begin()
+    busy(0.1)
+    samples = profiler.end()
+    profiler.stop()
+    assert any(stack.endswith("tests.test_metrics.busy") for stack in samples)
+    filename = profiler.dump(samples, "api.get_ships", 0.1)
+    assert os.path.basename(filename).endswith("-api.get_ships-100ms.folded")
+    with open(filename) as f:
+        stack, count = f.readline().rsplit(" ", 1)
+    assert int(count) > 0
+    assert profiler.dumps == 1
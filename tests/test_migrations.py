@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+from app import create_app
+from app.startup import top_imports
+from config import Config
+from migrations import MIGRATIONS, create_tables, current_version, migrate
+from models import db
+
+
+def schema(engine):
+    inspector = inspect(engine)
+    return {table: (sorted((c["name"], str(c["type"]), c["nullable"]) for c in inspector.get_columns(table)),
+                    sorted((i["name"], tuple(i["column_names"])) for i in inspector.get_indexes(table)))
+            for table in inspector.get_table_names() if table != "schema_version"}
+
+
+def test_migrations_create_the_schema_of_the_models(tmp_path):
+    engine = create_engine("sqlite:///{}".format(tmp_path / "new.db"))
+    assert [version for version, _, _ in migrate(engine)] == [version for version, _, _ in MIGRATIONS]
+    assert migrate(engine) == []
+    with engine.connect() as connection:
+        assert current_version(connection) == MIGRATIONS[-1][0]
+
+    models = create_engine("sqlite:///{}".format(tmp_path / "models.db"))
+    db.Model.metadata.create_all(models)
+    assert schema(engine) == schema(models)
+
+
+def test_migrations_update_a_database_created_before_them(tmp_path):
+    # The tables as 'db.create_all()' created them in the first version of the application.
+    engine = create_engine("sqlite:///{}".format(tmp_path / "old.db"))
+    with engine.begin() as connection:
+        create_tables(connection)
+        connection.exec_driver_sql("INSERT INTO users (name, password) VALUES ('old', 'x')")
+    migrate(engine)
+
+    models = create_engine("sqlite:///{}".format(tmp_path / "models.db"))
+    db.Model.metadata.create_all(models)
+    assert schema(engine) == schema(models)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT token_generation FROM users").scalar() == 0
+        assert connection.exec_driver_sql("SELECT name, version FROM table_versions ORDER BY name").all() == [
+            ("ships", 0), ("users", 0)]
+
+
+def test_create_app_does_not_touch_the_database(tmp_path):
+    class NewDatabaseConfig(Config):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///{}".format(tmp_path / "empty.db")
+
+    app = create_app(NewDatabaseConfig)
+    assert not (tmp_path / "empty.db").exists()
+    result = app.test_cli_runner().invoke(args=["db-seed"])
+    assert "flask db-migrate" in result.output
+    result = app.test_cli_runner().invoke(args=["db-migrate"])
+    assert result.exit_code == 0
+    assert "Migrated to version" in result.output
+    assert "ships" in inspect(create_engine(NewDatabaseConfig.SQLALCHEMY_DATABASE_URI)).get_table_names()
+
+
+def test_top_imports():
+    output = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       100 |        100 |     sqlalchemy.sql\n"
+              "import time:        50 |        150 |   sqlalchemy\n"
+              "import time:        20 |        170 | flask\n")
+    [(package, seconds)] = top_imports(output, 1)
+    assert package == "sqlalchemy"
+    assert seconds == pytest.approx(150e-6)
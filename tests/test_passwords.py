@@ -0,0 +1,59 @@
+import pytest
+from passwords import PasswordHasher, PasswordHasherBusy
+from models import User
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", concurrency=2)
+    pwhash = hasher.hash("secret")
+    assert pwhash.startswith("pbkdf2:sha256:1000$")
+    assert hasher.verify(pwhash, "secret")
+    assert not hasher.verify(pwhash, "wrong")
+
+
+def test_needs_rehash():
+    old = PasswordHasher(method="pbkdf2:sha256:1000", salt_length=8)
+    new = PasswordHasher(method="pbkdf2:sha256:2000", salt_length=8)
+    longer_salt = PasswordHasher(method="pbkdf2:sha256:1000", salt_length=16)
+    pwhash = old.hash("secret")
+    assert not old.needs_rehash(pwhash)
+    assert new.needs_rehash(pwhash)
+    assert longer_salt.needs_rehash(pwhash)
+
+
+def test_default_method_includes_iterations():
+    hasher = PasswordHasher(method="pbkdf2:sha256")
+    assert not hasher.needs_rehash(hasher.hash("secret"))
+
+
+def test_busy_hasher_rejects_work():
+    hasher = PasswordHasher(max_pending=1, queue_timeout=0)
+    hasher._slots.acquire()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash("secret")
+
+
+def test_hasher_waits_for_a_running_slot():
+    hasher = PasswordHasher(concurrency=1, max_pending=2, queue_timeout=0)
+    hasher._running.acquire()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash("secret")
+    hasher._running.release()
+    assert hasher.verify(hasher.hash("secret"), "secret")
+
+
+def test_login_rehashes_legacy_password(app, client):
+    app.extensions["password_hasher"] = PasswordHasher(method="pbkdf2:sha256:1000")
+    client.post("/api/users", json={"name": "rehash-user", "password": "secret"})
+    app.extensions["password_hasher"] = PasswordHasher(method="pbkdf2:sha256:2000")
+    assert client.post("/auth/login", json={"username": "rehash-user", "password": "secret"}).status_code == 200
+    assert User.query.filter_by(name="rehash-user").first().password.startswith("pbkdf2:sha256:2000$")
+
+
+def test_busy_hasher_returns_503(app, client):
+    hasher = PasswordHasher(max_pending=1, queue_timeout=0)
+    hasher._slots.acquire()
+    app.extensions["password_hasher"] = hasher
+    r = client.post("/api/users", json={"name": "busy-user", "password": "secret"})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
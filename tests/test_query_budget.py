@@ -0,0 +1,53 @@
+import logging
+import pytest
+from sqlalchemy import text
+from app.query_budget import QueryBudget, QueryBudgetExceeded, query_budget as budget_decorator
+from models import db
+
+
+def test_budget_counts_statements(app):
+    with QueryBudget() as budget:
+        db.session.execute(text("SELECT 1"))
+        db.session.execute(text("SELECT 2"))
+    assert budget.count == 2
+    assert budget.seconds > 0
+    assert budget.duplicates() == []
+
+
+def test_budget_raises_when_exceeded(app):
+    with pytest.raises(QueryBudgetExceeded, match="2 queries, the budget is 1"):
+        with QueryBudget(max_queries=1):
+            db.session.execute(text("SELECT 1"))
+            db.session.execute(text("SELECT 2"))
+
+
+def test_budget_reports_duplicate_statements(app):
+    with pytest.raises(QueryBudgetExceeded) as error:
+        with QueryBudget(name="loop"):
+            for ship_id in (1, 2, 3):
+                db.session.execute(text("SELECT * FROM ships WHERE id = :id"), {"id": ship_id})
+    assert "Query budget of loop exceeded" in str(error.value)
+    assert "3x SELECT * FROM ships WHERE id = ?" in str(error.value)
+
+
+def test_budget_warns_instead_of_raising(app, caplog):
+    with caplog.at_level(logging.WARNING, logger="app.query_budget"):
+        with QueryBudget(max_queries=0, mode="warn"):
+            db.session.execute(text("SELECT 1"))
+    assert "1 queries, the budget is 0" in caplog.text
+
+
+def test_endpoint_decorator_uses_configured_mode(app):
+    view = budget_decorator(max_queries=0)(lambda: db.session.execute(text("SELECT 1")).scalar())
+    with app.test_request_context("/"):
+        with pytest.raises(QueryBudgetExceeded):
+            view()
+        app.config["QUERY_BUDGET_MODE"] = "off"
+        assert view() == 1
+
+
+def test_ship_list_queries_do_not_grow_with_page_size(client, query_budget):
+    for limit in (1, 100):
+        with query_budget(max_queries=2) as budget:
+            assert client.get(f"/api/ships?limit={limit}").status_code == 200
+        assert budget.count == 2
@@ -0,0 +1,70 @@
+import time
+from app import create_app
+from app.ratelimit import MemoryRateLimitStore, LoginLimiter
+from config import Config
+
+
+def test_bucket_allows_burst_then_rejects():
+    store = MemoryRateLimitStore()
+    assert [store.hit("key", capacity=3, rate=1) for _ in range(3)] == [0, 0, 0]
+    assert store.hit("key", capacity=3, rate=1) > 0
+
+
+def test_bucket_refills():
+    store = MemoryRateLimitStore()
+    store.hit("key", capacity=1, rate=100)
+    time.sleep(0.02)
+    assert store.hit("key", capacity=1, rate=100) == 0
+
+
+def test_check_does_not_consume_tokens():
+    store = MemoryRateLimitStore()
+    assert all(store.hit("key", capacity=1, rate=1, cost=0) == 0 for _ in range(5))
+
+
+def test_store_is_bounded():
+    store = MemoryRateLimitStore(max_keys=2)
+    for key in "abc":
+        store.hit(key, capacity=1, rate=1)
+    assert len(store._buckets) == 2
+
+
+def test_login_limiter_counts_attempts_per_user_and_ip():
+    limiter = LoginLimiter(MemoryRateLimitStore(), user_capacity=2, user_rate=0.001)
+    # Every check takes a token, so concurrent attempts cannot all get through.
+    assert limiter.check("1.2.3.4", "user") == 0
+    assert limiter.check("1.2.3.4", "user") == 0
+    assert limiter.check("1.2.3.4", "user") > 0
+    assert limiter.check("1.2.3.4", "other") == 0
+    # Other clients can still log in as the user.
+    assert limiter.check("5.6.7.8", "user") == 0
+    limiter.succeeded("1.2.3.4", "user")
+    assert limiter.check("1.2.3.4", "user") == 0
+
+
+def test_login_is_rejected_after_too_many_failures(client):
+    for _ in range(5):
+        assert client.post("/auth/login", json={"username": "nobody", "password": "?"}).status_code == 401
+    r = client.post("/auth/login", json={"username": "nobody", "password": "?"})
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) > 0
+
+
+def test_login_is_limited_per_ip(app, client):
+    app.extensions["login_limiter"].ip_capacity = 2
+    assert client.post("/auth/login", json={"username": "a", "password": "?"}).status_code == 401
+    assert client.post("/auth/login", json={"username": "b", "password": "?"}).status_code == 401
+    assert client.post("/auth/login", json={"username": "c", "password": "?"}).status_code == 429
+
+
+def test_client_ip_is_read_from_trusted_proxies():
+    class ProxyConfig(Config):
+        TRUSTED_PROXY_COUNT = 1
+
+    client = create_app(ProxyConfig).test_client()
+    client.application.extensions["login_limiter"].ip_capacity = 1
+    for ip in ("1.1.1.1", "2.2.2.2"):
+        headers = {"X-Forwarded-For": ip}
+        assert client.post("/auth/login", json={"username": "a", "password": "?"}, headers=headers).status_code == 401
+    headers = {"X-Forwarded-For": "1.1.1.1"}
+    assert client.post("/auth/login", json={"username": "a", "password": "?"}, headers=headers).status_code == 429
@@ -0,0 +1,85 @@
+from app import create_app
+from app.response_cache import LocalCacheBackend, ResponseCache
+
+
+def test_local_backend_evicts_by_size():
+    backend = LocalCacheBackend(max_bytes=10)
+    backend.set("a", b"12345", ttl=60)
+    backend.set("b", b"12345", ttl=60)
+    assert backend.get("a") == b"12345"
+    backend.set("c", b"12345", ttl=60)
+    assert backend.get("b") is None
+    assert backend.get("a") is not None
+    assert backend.evictions == 1
+    assert backend.size == 10
+
+
+def test_local_backend_expires_entries():
+    backend = LocalCacheBackend(max_bytes=100)
+    backend.set("a", b"1", ttl=0)
+    assert backend.get("a") is None
+    assert backend.size == 0
+
+
+def test_local_backend_ignores_values_larger_than_the_cache():
+    backend = LocalCacheBackend(max_bytes=2)
+    backend.set("a", b"123", ttl=60)
+    assert backend.get("a") is None
+
+
+def test_get_ships_is_served_from_cache(app, client):
+    first = client.get("/api/ships")
+    assert first.headers["X-Cache"] == "MISS"
+    second = client.get("/api/ships")
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.get_json() == first.get_json()
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert client.get("/api/ships", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert client.get("/api/ships?limit=1").headers["X-Cache"] == "MISS"
+    stats = app.extensions["response_cache"].stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+
+
+def test_writes_invalidate_cached_responses(app, client, auth):
+    # A shared backend (standing in for Redis): only the generation counters invalidate the entries.
+    app.extensions["response_cache"] = ResponseCache(LocalCacheBackend(max_bytes=1024 * 1024, shared=True))
+    client.post("/api/users", json={"name": "cache-user", "password": "secret"})
+    auth.login(username="cache-user", password="secret")
+    ship_id = client.post("/api/ships", json={"model": "Cached", "ship_class": "Class"}, headers=auth.headers).get_json()["id"]
+    other_id = client.post("/api/ships", json={"model": "Other", "ship_class": "Class"}, headers=auth.headers).get_json()["id"]
+    client.get("/api/ships")
+    client.get("/api/ships/{}".format(ship_id))
+    client.get("/api/ships/{}".format(other_id))
+    client.put("/api/ships/{}".format(ship_id), json={"model": "Changed"}, headers=auth.headers)
+    r = client.get("/api/ships/{}".format(ship_id))
+    assert r.headers["X-Cache"] == "MISS"
+    assert r.get_json()["model"] == "Changed"
+    assert client.get("/api/ships/{}".format(other_id)).headers["X-Cache"] == "HIT"
+    r = client.get("/api/ships")
+    assert r.headers["X-Cache"] == "MISS"
+    assert "Changed" in [ship["model"] for ship in r.get_json()]
+
+
+def test_errors_are_not_cached(client):
+    assert client.get("/api/users/99999").status_code == 404
+    assert client.get("/api/users/99999").headers.get("X-Cache") == "MISS"
+
+
+def test_writes_of_another_worker_invalidate_cached_responses(client, auth):
+    client.post("/api/users", json={"name": "cache-user-2", "password": "secret"})
+    auth.login(username="cache-user-2", password="secret")
+    ship_id = client.post("/api/ships", json={"model": "Cached", "ship_class": "Class"}, headers=auth.headers).get_json()["id"]
+    # Another worker, with its own in-process cache, on the same database.
+    other = create_app().test_client()
+    assert other.get("/api/ships/{}".format(ship_id)).status_code == 200
+    assert other.get("/api/ships/{}".format(ship_id)).headers["X-Cache"] == "HIT"
+    assert other.get("/api/ships").headers["X-Cache"] == "MISS"
+    assert client.delete("/api/ships/{}".format(ship_id), headers=auth.headers).status_code == 204
+    assert other.get("/api/ships/{}".format(ship_id)).status_code == 404
+    assert ship_id not in [ship["id"] for ship in other.get("/api/ships").get_json()]
+
+
+def test_query_arguments_are_encoded_in_the_key(client):
+    assert client.get("/api/ships?affiliation=Rebel%26category%3DX").headers["X-Cache"] == "MISS"
+    assert client.get("/api/ships?affiliation=Rebel&category=X").headers["X-Cache"] == "MISS"
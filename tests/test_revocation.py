@@ -0,0 +1,195 @@
+import uuid
+from flask_jwt_extended import decode_token
+from app import create_app
+from app.revocation import LRUCache, BloomFilter, MemoryRevocationBackend, RevocationStore, USER_DELETED
+
+
+class Loader:
+    """Counts the simulated database lookups."""
+    def __init__(self, revoked=()):
+        self.revoked = set(revoked)
+        self.calls = 0
+
+    def __call__(self, jti):
+        self.calls += 1
+        return jti in self.revoked
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000)
+    for i in range(1000):
+        bloom.add(f"jti-{i}")
+    assert all(f"jti-{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(1000))
+    assert false_positives < 50
+
+
+def test_store_caches_database_answers():
+    loader = Loader(revoked=["revoked"])
+    store = RevocationStore(backend=MemoryRevocationBackend(shared=True))
+    assert store.is_revoked("revoked", loader) is True
+    assert store.is_revoked("valid", loader) is False
+    assert store.is_revoked("revoked", loader) is True
+    assert store.is_revoked("valid", loader) is False
+    assert loader.calls == 2
+
+
+def test_store_without_shared_backend_only_caches_revocations():
+    loader = Loader(revoked=["revoked"])
+    store = RevocationStore(bloom_capacity=100)
+    assert store.bloom is None
+    assert store.is_revoked("revoked", loader) is True
+    assert store.is_revoked("revoked", loader) is True
+    assert loader.calls == 1
+    # Another process may revoke it at any time: every check asks the database.
+    assert store.is_revoked("valid", loader, warmer=lambda: ["revoked"]) is False
+    assert store.is_revoked("valid", loader) is False
+    assert loader.calls == 3
+
+
+def test_store_with_bloom_filter_skips_database_for_unknown_tokens():
+    loader = Loader(revoked=["revoked"])
+    store = RevocationStore(backend=MemoryRevocationBackend(shared=True), bloom_capacity=100)
+    assert store.is_revoked("valid", loader, warmer=lambda: ["revoked"]) is False
+    assert loader.calls == 0
+    assert store.is_revoked("revoked", loader) is True
+    assert loader.calls == 1
+
+
+def test_store_sees_revocations_of_other_workers():
+    backend = MemoryRevocationBackend(shared=True)
+    worker1 = RevocationStore(backend=backend, sync_interval=0)
+    worker2 = RevocationStore(backend=backend, sync_interval=0)
+    loader = Loader()
+    assert worker2.is_revoked("jti", loader) is False
+    worker1.revoke("jti")
+    assert worker2.is_revoked("jti", loader) is True
+    assert loader.calls == 1
+
+
+def test_event_log_keeps_the_last_events():
+    backend = MemoryRevocationBackend(shared=True, max_events=2)
+    worker1 = RevocationStore(backend=backend, sync_interval=0)
+    worker2 = RevocationStore(backend=backend, sync_interval=0)
+    loader = Loader()
+    assert worker2.is_revoked("jti-0", loader) is False
+    for i in range(3):
+        worker1.revoke(f"jti-{i}")
+    assert backend.position() == 3
+    # worker2 missed an event: its cached answers are dropped and asked to the database again.
+    loader.revoked = {"jti-0"}
+    assert worker2.is_revoked("jti-0", loader) is True
+    assert loader.calls == 2
+    # A new worker starts at the end of the log; the revocations before it are in the database.
+    assert RevocationStore(backend=backend)._cursor == 3
+
+
+def test_store_revokes_older_generations():
+    store = RevocationStore(backend=MemoryRevocationBackend(shared=True))
+    calls = []
+    def load(user_id):
+        calls.append(user_id)
+        return {1: 2}.get(user_id)
+    assert store.is_generation_revoked(1, 2, load) is False
+    assert store.is_generation_revoked(1, 1, load) is True
+    # Unknown (deleted) users have every token revoked.
+    assert store.is_generation_revoked(2, 0, load) is True
+    assert calls == [1, 2]
+
+
+def test_store_without_shared_backend_does_not_cache_generations():
+    store = RevocationStore()
+    generations = {1: 2}
+    assert store.is_generation_revoked(1, 2, generations.get) is False
+    # A password change on another worker.
+    generations[1] = 3
+    assert store.is_generation_revoked(1, 2, generations.get) is True
+    # The user was deleted, then a new user got its id.
+    assert store.is_generation_revoked(2, 0, generations.get) is True
+    generations[2] = 0
+    assert store.is_generation_revoked(2, 0, generations.get) is False
+
+
+def test_store_without_shared_backend_checks_jti_and_generation_together():
+    store = RevocationStore()
+    calls = []
+    def load(jti, user_id):
+        calls.append((jti, user_id))
+        return {1: 2}.get(user_id), jti == "revoked"
+    assert store.is_token_revoked("a", 1, 2, load) is False
+    assert store.is_token_revoked("a", 1, 1, load) is True
+    assert store.is_token_revoked("a", 2, 0, load) is True
+    assert store.is_token_revoked("revoked", 1, 2, load) is True
+    # Revocations are remembered.
+    assert store.is_token_revoked("revoked", 1, 2, load) is True
+    assert calls == [("a", 1), ("a", 1), ("a", 2), ("revoked", 1)]
+
+
+def test_token_check_is_one_query(client, auth, query_budget):
+    client.post("/api/users", json={"name": "one-query-user", "password": "secret"})
+    auth.login(username="one-query-user", password="secret")
+    # Deleting another user is refused before any query of the endpoint.
+    with query_budget(max_queries=1):
+        assert client.delete("/api/users/100000", headers=auth.headers).status_code == 403
+
+
+def test_store_sees_generations_of_other_workers():
+    backend = MemoryRevocationBackend(shared=True)
+    worker1 = RevocationStore(backend=backend, sync_interval=0)
+    worker2 = RevocationStore(backend=backend, sync_interval=0)
+    assert worker2.is_generation_revoked(1, 0, lambda user_id: 0) is False
+    worker1.revoke_user(1, 1)
+    assert worker2.is_generation_revoked(1, 0, lambda user_id: 0) is True
+    assert worker2.is_generation_revoked(1, 1, lambda user_id: 0) is False
+    worker1.revoke_user(1, USER_DELETED)
+    assert worker2.is_generation_revoked(1, 1, lambda user_id: 0) is True
+
+
+def test_logout_updates_revocation_store(app, client, auth):
+    client.post("/api/users", json={"name": "revocation-user", "password": "secret"})
+    auth.login(username="revocation-user", password="secret")
+    assert client.delete("/auth/logout", headers=auth.headers).status_code == 200
+    jti = decode_token(auth.access_token)["jti"]
+    assert app.extensions["revocation_store"].is_revoked(jti, lambda jti: False) is True
+
+
+def test_logout_reaches_another_process_without_shared_backend(client, auth):
+    client.post("/api/users", json={"name": "revocation-user-2", "password": "secret"})
+    auth.login(username="revocation-user-2", password="secret")
+    refresh = {"Authorization": "Bearer {}".format(auth.refresh_token)}
+    # Another worker, with its own memory:// backend, on the same database.
+    other = create_app().test_client()
+    assert other.post("/auth/refresh", headers=refresh).status_code == 200
+    assert client.delete("/auth/logout2", headers=refresh).status_code == 200
+    assert other.post("/auth/refresh", headers=refresh).status_code == 401
+
+
+def test_new_user_with_the_id_of_a_deleted_user_is_not_revoked(app, client, auth):
+    app.extensions["revocation_store"] = RevocationStore(backend=MemoryRevocationBackend(shared=True), sync_interval=0)
+    # New names on every run: the new user must be created.
+    names = ["user-{}".format(uuid.uuid4().hex[:8]) for _ in range(2)]
+    user_id = client.post("/api/users", json={"name": names[0], "password": "secret"}).get_json()["id"]
+    auth.login(username=names[0], password="secret")
+    assert client.delete("/api/users/{}".format(user_id), headers=auth.headers).status_code == 204
+    # On SQLite the new user gets the id of the deleted one.
+    assert client.post("/api/users", json={"name": names[1], "password": "secret"}).status_code == 201
+    auth.login(username=names[1], password="secret")
+    refresh = {"Authorization": "Bearer {}".format(auth.refresh_token)}
+    assert client.post("/auth/refresh", headers=refresh).status_code == 200
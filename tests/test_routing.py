@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import create_engine
+from app import create_app
+from config import Config
+from migrations import migrate
+from models import Ship
+
+
+def make_database(path, model):
+    engine = create_engine("sqlite:///{}".format(path))
+    migrate(engine)
+    with engine.begin() as connection:
+        connection.execute(Ship.__table__.insert(), {"model": model, "ship_class": "Class"})
+    engine.dispose()
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    make_database(tmp_path / "primary.db", "Primary ship")
+    make_database(tmp_path / "replica.db", "Replica ship")
+
+    class ReplicaConfig(Config):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///{}".format(tmp_path / "primary.db")
+        SQLALCHEMY_REPLICA_URIS = ["sqlite:///{}".format(tmp_path / "replica.db"),
+                                   "sqlite:///{}".format(tmp_path / "missing" / "replica.db")]
+        RESPONSE_CACHE_ENABLED = False
+        REPLICA_STICKY_SECONDS = 60
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        yield app
+
+
+def models(client):
+    return [ship["model"] for ship in client.get("/api/ships").get_json()]
+
+
+def test_reads_go_to_healthy_replicas(replica_app):
+    client = replica_app.test_client()
+    # The second replica cannot be opened, so every read goes to the first one.
+    for _ in range(4):
+        assert models(client) == ["Replica ship"]
+
+
+def test_writes_go_to_the_primary_and_reads_stick_to_it(replica_app):
+    client = replica_app.test_client()
+    assert models(client) == ["Replica ship"]
+    assert client.post("/api/users", json={"name": "routing-user", "password": "secret"}).status_code == 201
+    r = client.post("/auth/login", json={"username": "routing-user", "password": "secret"})
+    headers = {"Authorization": "Bearer {}".format(r.get_json()["access_token"])}
+    r = client.post("/api/ships", json={"model": "New ship", "ship_class": "Class"}, headers=headers)
+    assert r.status_code == 201
+    assert models(client) == ["Primary ship", "New ship"]
+    # Other clients keep reading from the replicas.
+    assert models(replica_app.test_client()) == ["Replica ship"]
+    # A client without cookies sends the header back.
+    other = replica_app.test_client(use_cookies=False)
+    assert models(other) == ["Replica ship"]
+    sticky = {"X-Read-Primary-Until": r.headers["X-Read-Primary-Until"]}
+    assert [ship["model"] for ship in other.get("/api/ships", headers=sticky).get_json()] == ["Primary ship", "New ship"]
+
+
+def test_cli_and_auth_use_the_primary(replica_app):
+    assert [ship.model for ship in Ship.query.all()] == ["Primary ship"]
@@ -0,0 +1,74 @@
+from app.search import ShipIndex
+
+SHIPS = [
+    {"id": 1, "model": "T-65 X-Wing", "manufacturer": "Incom Corporation", "roles": ["Escort"],
+     "affiliation": "Rebel Alliance", "category": "Starfighters", "ship_class": "Starfighter"},
+    {"id": 2, "model": "TIE Fighter", "manufacturer": "Sienar Fleet Systems", "roles": ["Space Superiority Starfighter"],
+     "affiliation": "Empire", "category": "Starfighters", "ship_class": "Starfighter"},
+    {"id": 3, "model": "Imperial I-class Star Destroyer", "manufacturer": "Kuat Drive Yards", "roles": None,
+     "affiliation": "Empire", "category": "Capital Ships", "ship_class": "Star Destroyer"},
+]
+
+
+def test_index_matches_every_word_as_a_prefix():
+    index = ShipIndex()
+    index.rebuild(SHIPS, version=1)
+    assert index.search("star")[0] == [2, 3]
+    assert index.search("STAR dest")[0] == [3]
+    assert index.search("incom")[0] == [1]
+    assert index.search("nothing")[0] == []
+    ids, facets = index.search("", {"affiliation": "Empire"})
+    assert ids == [2, 3]
+    assert facets["category"] == {"Starfighters": 1, "Capital Ships": 1}
+    assert facets["affiliation"] == {"Empire": 2}
+
+
+def test_index_applies_writes_and_tracks_the_version():
+    index = ShipIndex()
+    index.apply(ships=[SHIPS[0]])
+    assert index.version is None
+    index.rebuild(SHIPS, version=1)
+    index.apply(ships=[dict(SHIPS[0], model="A-Wing")], deleted=[2])
+    assert index.version == 2
+    assert index.search("wing")[0] == [1]
+    assert index.search("tie")[0] == []
+    index.refresh(2, loader=lambda: [])
+    assert index.rebuilds == 1
+    index.refresh(5, loader=lambda: SHIPS)
+    assert index.rebuilds == 2
+    assert index.search("tie")[0] == [2]
+
+
+def test_search_ships(client, query_budget):
+    r = client.get("/api/ships/search?q=x-wing")
+    assert r.status_code == 200
+    data = r.get_json()
+    assert data["total"] >= 1
+    assert all("wing" in ship["model"].lower() for ship in data["ships"])
+    assert sum(data["facets"]["affiliation"].values()) == data["total"]
+    r = client.get("/api/ships/search?limit=abc")
+    assert r.status_code == 400
+    # Once built, the index answers without reading every ship again.
+    with query_budget(max_queries=2):
+        client.get("/api/ships/search?q=fighter&category=Starfighters")
+
+
+def test_search_ships_pagination_and_facet_filters(client):
+    data = client.get("/api/ships/search?category=Starfighters").get_json()
+    assert all(ship["category"] == "Starfighters" for ship in data["ships"])
+    r = client.get("/api/ships/search?category=Starfighters&limit=2")
+    assert [ship["id"] for ship in r.get_json()["ships"]] == [ship["id"] for ship in data["ships"][:2]]
+    assert "after=" in r.headers["Link"]
+
+
+def test_writes_update_the_search_index(app, client, auth):
+    client.post("/api/users", json={"name": "search-user", "password": "secret"})
+    auth.login(username="search-user", password="secret")
+    client.get("/api/ships/search?q=zzquux")
+    ship_id = client.post("/api/ships", json={"model": "Zzquux Runner", "ship_class": "Class"}, headers=auth.headers).get_json()["id"]
+    assert [ship["id"] for ship in client.get("/api/ships/search?q=zzquux").get_json()["ships"]] == [ship_id]
+    client.put(f"/api/ships/{ship_id}", json={"model": "Plain Runner"}, headers=auth.headers)
+    assert client.get("/api/ships/search?q=zzquux").get_json()["total"] == 0
+    client.delete(f"/api/ships/{ship_id}", headers=auth.headers)
+    assert client.get("/api/ships/search?q=plain runner").get_json()["total"] == 0
+    assert app.extensions["ship_index"].rebuilds == 1
@@ -0,0 +1,60 @@
+import json
+from datetime import datetime
+import pytest
+from sqlalchemy import select
+from app.api.ships import SHIP_COLUMNS
+from app.serialization import RowSerializer, StdlibJSONBackend, create_backend, jsonify
+from models import db, Ship
+
+
+def test_backends_encode_like_flask(app):
+    data = {"b": [1, 2.5, None, True], "a": "Ünïcode", "when": datetime(2020, 5, 16, 8, 34, 18)}
+    expected = json.loads(StdlibJSONBackend().dumps(data))
+    assert expected["when"] == "Sat, 16 May 2020 08:34:18 GMT"
+    for name in ("orjson", "ujson"):
+        try:
+            backend = create_backend(name)
+        except RuntimeError:
+            continue
+        if name == "ujson":
+            data = dict(data, when=expected["when"])
+        assert json.loads(backend.dumps(data)) == expected
+        assert backend.dumps({"b": 1, "a": 2}, sort_keys=True) == b'{"a":2,"b":1}'
+
+
+def test_create_backend_rejects_unknown_library():
+    with pytest.raises(ValueError):
+        create_backend("yaml")
+
+
+def test_auto_backend_prefers_orjson():
+    pytest.importorskip("orjson")
+    assert create_backend("auto").name == "orjson"
+
+
+def test_jsonify_uses_configured_backend(app):
+    app.extensions["json_backend"] = StdlibJSONBackend()
+    with app.test_request_context():
+        response = jsonify(name="x", ids=[1, 2])
+    assert response.mimetype == "application/json"
+    assert response.get_json() == {"name": "x", "ids": [1, 2]}
+
+
+def test_row_serializer_matches_to_json(app):
+    serializer = RowSerializer(SHIP_COLUMNS.values())
+    db.session.add(Ship(model="No roles", ship_class="Test"))
+    db.session.commit()
+    rows = db.session.execute(serializer.select().order_by(Ship.id)).all()
+    ships = json.loads(serializer.dumps(rows))
+    assert ships == [ship.to_json() for ship in Ship.query.order_by(Ship.id)]
+    assert ships[-1]["roles"] is None
+    assert json.loads(serializer.dumps_one(rows[0])) == ships[0]
+    assert [json.loads(line) for line in serializer.lines(rows).splitlines()] == ships
+    assert serializer.dumps([]) == b"[]"
+
+
+def test_row_serializer_selects_json_columns_as_text(app):
+    serializer = RowSerializer([Ship.__table__.c.id, Ship.__table__.c.roles])
+    row = db.session.execute(serializer.select().where(Ship.roles.isnot(None)).limit(1)).first()
+    assert isinstance(row.roles, str)
+    assert json.loads(serializer.dumps_one(row))["roles"] == db.session.execute(select(Ship.roles).where(Ship.id == row.id)).scalar()
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import re
+import signal
+import subprocess
+import sys
+import urllib.request
+from app.server import RequestCounter, after_fork, dispose_engines, local_stores
+from app.response_cache import LocalCacheBackend
+
+
+def test_request_counter(client, app):
+    counts = multiprocessing.RawArray("Q", 2)
+    app.wsgi_app, wsgi_app = RequestCounter(app.wsgi_app, counts, 1), app.wsgi_app
+    try:
+        client.get("/api/ships/1")
+        client.get("/api/ships/2")
+    finally:
+        app.wsgi_app = wsgi_app
+    assert list(counts) == [0, 2]
+
+
+def test_dispose_engines(client, app):
+    dispose_engines(app)
+    # New connections are opened on demand.
+    assert client.get("/api/ships/1").status_code == 200
+
+
+def test_local_stores(app):
+    assert local_stores(app) == ["REVOCATION_BACKEND_URL", "RESPONSE_CACHE_URL", "LOGIN_RATE_LIMIT_URL"]
+    app.extensions["response_cache"].backend = LocalCacheBackend(1 << 20, shared=True)
+    assert local_stores(app) == ["REVOCATION_BACKEND_URL", "LOGIN_RATE_LIMIT_URL"]
+
+
+def test_after_fork_creates_the_stores_again(app):
+    stores = {name: app.extensions[name] for name in ("revocation_store", "response_cache", "login_limiter", "ship_index")}
+    after_fork(app, slot=1)
+    for name, store in stores.items():
+        assert app.extensions[name] is not store
+        assert type(app.extensions[name]) is type(store)
+
+
+def test_serve_and_recycle_workers():
+    server = subprocess.Popen([sys.executable, "-m", "app.server", "--workers", "2", "--port", "0"],
+                              stderr=subprocess.PIPE, text=True, env=dict(os.environ, SERVER_STATS_INTERVAL="0"))
+    try:
+        # With 'memory://' stores, the server warns that the workers do not share them.
+        assert "REVOCATION_BACKEND_URL" in server.stderr.readline()
+        port = int(re.search(r"Listening on [^:]+:(\d+)", server.stderr.readline()).group(1))
+        url = f"http://127.0.0.1:{port}/api/ships/1"
+        assert urllib.request.urlopen(url, timeout=10).status == 200
+
+        server.send_signal(signal.SIGHUP)
+        # The workers are replaced one at a time: no request goes unanswered.
+        for _ in range(20):
+            assert urllib.request.urlopen(url, timeout=10).status == 200
+
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+    finally:
+        server.kill()
+        server.stderr.close()